@@ -23,3 +23,9 @@ OCR_SERVER_HOST="0.0.0.0"
 OCR_MAX_CONCURRENT_REQUESTS=4
 ## 默认绑定主机
 OCR_DEFAULT_BIND_HOST="0.0.0.0"
+## 微批处理：单次批量推理的最大图片数
+OCR_MAX_BATCH_SIZE=8
+## 微批处理：凑批的最长等待时间（毫秒）
+OCR_BATCH_WAIT_MS=20
+## 单张图片最大生成token数
+OCR_MAX_NEW_TOKENS=4096
@@ -1,16 +1,18 @@
 import os
 os.environ["CUDA_VISIBLE_DEVICES"] = "6"
 import argparse
+import ast
 import logging
 import re
 import string
+import time
 from io import BytesIO
-from typing import Optional,Literal
+from typing import Optional,Literal,List,Tuple
 import asyncio  # 新增导入
 
 import torch
 import uvicorn
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form
 from fastapi.responses import JSONResponse
 from PIL import Image
 from pydantic import BaseModel
@@ -21,8 +23,9 @@ from GOT.demo.process_results import punctuation_dict, svg_to_html
 from GOT.model import *
 from GOT.model.plug.blip_process import BlipImageEvalProcessor
 from GOT.utils.conversation import SeparatorStyle, conv_templates
-from GOT.utils.utils import KeywordsStoppingCriteria, disable_torch_init
-from config import OCR_MODEL_PATH,OCR_SERVER_PORT,OCR_SERVER_HOST,OCR_MAX_CONCURRENT_REQUESTS,OCR_DEFAULT_BIND_HOST
+from GOT.utils.utils import disable_torch_init
+from config import (OCR_MODEL_PATH,OCR_SERVER_PORT,OCR_SERVER_HOST,OCR_MAX_CONCURRENT_REQUESTS,OCR_DEFAULT_BIND_HOST,
+                    OCR_MAX_BATCH_SIZE,OCR_BATCH_WAIT_MS,OCR_MAX_NEW_TOKENS)
 
 # 配置基础日志
 logging.basicConfig(
@@ -39,9 +42,8 @@ DEFAULT_IM_START_TOKEN = '<img>'
 DEFAULT_IM_END_TOKEN = '</img>'
 translation_table = str.maketrans(punctuation_dict)
 
-# 并发控制配置
-MAX_CONCURRENT_REQUESTS = 4  # 最大并发数
-request_semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)  # 并发信号量
+# 推理设备：有 GPU 时使用 cuda，否则在 CPU 上运行（便于用小模型调试）
+DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
 
 class OCRRequest(BaseModel):
     type:  Literal["ocr","format"]= "ocr"
@@ -55,6 +57,11 @@ class OCRItem(BaseModel):
     html_path: Optional[str] = None
     error: Optional[str] = None
 
+class OCRBatchResponse(BaseModel):
+    code:int=200
+    msg:str="success"
+    data:List[OCRItem]=[]
+
 class OCRResponse(BaseModel):
     code:int=200,
     msg:str="success",
@@ -83,10 +90,14 @@ def initialize_model(model_path: str):
     try:
         # 初始化组件
         tokenizer = AutoTokenizer.from_pretrained(model_path, trust_remote_code=True)
+        # 批量推理时左侧补齐，保证各样本生成位置对齐
+        tokenizer.padding_side = "left"
+        if tokenizer.pad_token_id is None:
+            tokenizer.pad_token_id = 151643
         model = GOTQwenForCausalLM.from_pretrained(
             model_path,
             low_cpu_mem_usage=True,
-            device_map='cuda',
+            device_map=DEVICE,
             use_safetensors=True,
             pad_token_id=151643
         ).eval().to(dtype=torch.bfloat16)
@@ -112,8 +123,9 @@ async def startup_event():
     """服务启动时加载模型"""
     try:
         initialize_model(model_path)
+        batcher.start()
         # 打印当前并发设置
-        logger.info(f"服务启动完成，最大并发数设置为: {MAX_CONCURRENT_REQUESTS}")
+        logger.info(f"服务启动完成，推理设备: {DEVICE}，微批大小: {batcher.max_batch_size}，凑批等待: {OCR_BATCH_WAIT_MS}ms")
     except Exception as e:
         logger.error(f"启动失败: {str(e)}")
         raise
@@ -128,21 +140,30 @@ async def process_image_file(file: UploadFile):
         logger.error(f"图片处理失败: {str(e)}")
         raise HTTPException(status_code=400, detail="无效的图片文件")
 
-def generate_output(
-    image: Image.Image,
-    request_params: OCRRequest
-) -> str:
-    """执行模型推理"""
+def parse_box(box: str) -> List[int]:
+    """
+    安全解析边界框参数（只接受 [x1,y1] 或 [x1,y1,x2,y2] 形式的数字列表）
+    """
+    try:
+        value = ast.literal_eval(box)
+    except (ValueError, SyntaxError):
+        raise HTTPException(status_code=400, detail=f"无效的边界框参数: {box}")
+    if not isinstance(value, (list, tuple)) or len(value) not in (2, 4) \
+            or not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in value):
+        raise HTTPException(status_code=400, detail=f"边界框必须为2个或4个数字: {box}")
+    return [int(v) for v in value]
+
+
+def build_prompt(request_params: OCRRequest) -> Tuple[str, str]:
+    """构建单张图片的 prompt，返回 (prompt, 停止符)"""
     conv_mode = "mpt"
     conv = conv_templates[conv_mode].copy()
-    tokenizer = global_model["tokenizer"]
-    
+
     # 构建查询字符串
-    w, h = image.size
     qs = 'OCR with format: ' if request_params.type == 'format' else 'OCR: '
 
     if request_params.box:
-        bbox = eval(request_params.box)
+        bbox = parse_box(request_params.box)
         # 边界框处理逻辑...
         qs = f"{bbox} {qs}"
 
@@ -157,36 +178,133 @@ def generate_output(
     conv.append_message(conv.roles[1], None)
     prompt = conv.get_prompt()
     logger.debug(f"生成prompt: {prompt}")
+    stop_str = conv.sep if conv.sep_style != SeparatorStyle.TWO else conv.sep2
+    return prompt, stop_str
+
+
+def generate_batch(
+    images: List[Image.Image],
+    params_list: List[OCRRequest]
+) -> List[str]:
+    """
+    批量执行模型推理
+    图像预处理后尺寸一致（1024x1024），直接按批组织；文本 prompt 左侧补齐到同一长度，
+    一次 generate 完成整批；对话分隔符作为额外的结束符，各条输出在分隔符处截断
+    """
+    tokenizer = global_model["tokenizer"]
+    # GPU 上沿用半精度输入 + bf16 autocast；CPU 上输入与模型权重保持一致（bf16）
+    dtype = torch.half if DEVICE == "cuda" else torch.bfloat16
+    prompts = []
+    stop_str = None
+    for params in params_list:
+        prompt, stop_str = build_prompt(params)
+        prompts.append(prompt)
 
     # 预处理图像
-    image_tensor = global_model["processor"](image).unsqueeze(0).half().cuda()
-    image_tensor_high = global_model["processor_high"](image).unsqueeze(0).half().cuda()
+    batch_images = []
+    for image in images:
+        image_tensor = global_model["processor"](image).unsqueeze(0).to(DEVICE, dtype=dtype)
+        image_tensor_high = global_model["processor_high"](image).unsqueeze(0).to(DEVICE, dtype=dtype)
+        batch_images.append((image_tensor, image_tensor_high))
 
     # 生成输入
-    inputs = tokenizer([prompt])
-    input_ids = torch.as_tensor(inputs.input_ids).cuda()
+    inputs = tokenizer(prompts, padding=True, return_tensors="pt")
+    input_ids = inputs.input_ids.to(DEVICE)
+    attention_mask = inputs.attention_mask.to(DEVICE)
 
-    # 设置停止条件
-    stop_str = conv.sep if conv.sep_style != SeparatorStyle.TWO else conv.sep2
-    stopping_criteria = KeywordsStoppingCriteria([stop_str], tokenizer, input_ids)
+    # 分隔符（<|im_end|>）是单个特殊 token，加入结束符后每条样本生成到分隔符即停止
+    stop_token_id = tokenizer.convert_tokens_to_ids(stop_str) if stop_str else None
+    eos_token_ids = [tokenizer.eos_token_id]
+    if stop_token_id is not None and stop_token_id != tokenizer.unk_token_id:
+        eos_token_ids.append(stop_token_id)
 
     # 执行推理
-    with torch.autocast("cuda", dtype=torch.bfloat16):
+    with torch.autocast(DEVICE, dtype=torch.bfloat16, enabled=DEVICE == "cuda"):
         output_ids = global_model["model"].generate(
             input_ids,
-            images=[(image_tensor, image_tensor_high)],
+            attention_mask=attention_mask,
+            images=batch_images,
             do_sample=False,
             num_beams=1,
-            max_new_tokens=4096,
-            stopping_criteria=[stopping_criteria]
+            max_new_tokens=OCR_MAX_NEW_TOKENS,
+            pad_token_id=tokenizer.pad_token_id,
+            eos_token_id=[token_id for token_id in eos_token_ids if token_id is not None]
         )
 
-    # 解码输出
-    outputs = tokenizer.decode(output_ids[0, input_ids.shape[1]:],skip_special_tokens=True).strip()
-    if outputs.endswith(stop_str):
-        outputs = outputs[:-len(stop_str)]
-    
-    return outputs.strip()
+    # 解码输出：先在第一个结束符处截断 token，再解码（解码时会去掉特殊 token，无法再按字符串截断）
+    results = []
+    for row in output_ids[:, input_ids.shape[1]:].tolist():
+        for idx, token_id in enumerate(row):
+            if token_id in eos_token_ids:
+                row = row[:idx]
+                break
+        results.append(tokenizer.decode(row, skip_special_tokens=True).strip())
+    return results
+
+
+def generate_output(
+    image: Image.Image,
+    request_params: OCRRequest
+) -> str:
+    """执行单张图片推理"""
+    return generate_batch([image], [request_params])[0]
+
+
+class MicroBatcher:
+    """
+    服务端微批处理器
+    请求先进入队列，后台任务在 OCR_BATCH_WAIT_MS 内凑满最多 OCR_MAX_BATCH_SIZE 张图片后一次批量推理，
+    同一时刻只有一个批次占用模型
+    """
+    def __init__(self, max_batch_size: int = OCR_MAX_BATCH_SIZE, max_wait_ms: int = OCR_BATCH_WAIT_MS):
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self.queue: Optional[asyncio.Queue] = None
+        self.worker: Optional[asyncio.Task] = None
+
+    def start(self):
+        self.queue = asyncio.Queue()
+        self.worker = asyncio.create_task(self._run())
+
+    async def submit(self, image: Image.Image, params: OCRRequest) -> str:
+        # 提前校验参数，非法请求不进入批次
+        build_prompt(params)
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((image, params, future))
+        return await future
+
+    async def _collect(self) -> list:
+        batch = [await self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            images = [item[0] for item in batch]
+            params_list = [item[1] for item in batch]
+            logger.info(f"批量推理: {len(batch)} 张图片 (队列剩余: {self.queue.qsize()})")
+            try:
+                results = await asyncio.to_thread(generate_batch, images, params_list)
+                for (_, _, future), outputs in zip(batch, results):
+                    if not future.done():
+                        future.set_result(outputs)
+            except Exception as e:
+                logger.error(f"批量推理失败: {str(e)}", exc_info=True)
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+
+batcher = MicroBatcher()
 
 def process_rendering(outputs: str, render: bool) -> Optional[str]:
     """处理结果渲染"""
@@ -205,49 +323,90 @@ def process_rendering(outputs: str, render: bool) -> Optional[str]:
     
     return None
 
+def build_request_params(type: str, box: Optional[str], color: Optional[str]) -> OCRRequest:
+    try:
+        return OCRRequest(type=type, box=box or None, color=color or None)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"无效的请求参数: {str(e)}")
+
+
 @app.post("/ocr", response_model=OCRResponse)
 async def process_ocr(
     file: UploadFile = File(...),
+    type: str = Form("ocr"),
+    box: Optional[str] = Form(None),
+    color: Optional[str] = Form(None),
 ):
-    request_params: OCRRequest = OCRRequest()
-    """OCR处理接口，带并发控制"""
-    # 等待获取信号量，如果并发数已满则等待
-    async with request_semaphore:
-        logger.info(f"开始处理OCR请求 (当前并发数: {MAX_CONCURRENT_REQUESTS - request_semaphore._value}/{MAX_CONCURRENT_REQUESTS})")
-        logger.info(f"请求参数 - 类型: {request_params.type}, 渲染: {request_params.render}")
+    """OCR处理接口，请求进入微批队列与其他请求合并推理"""
+    request_params: OCRRequest = build_request_params(type, box, color)
+    logger.info(f"请求参数 - 类型: {request_params.type}, 渲染: {request_params.render}")
+
+    try:
+        # 1. 处理输入图片
+        image = await process_image_file(file)
+        
+        # 2. 执行模型推理（微批）
+        outputs = await batcher.submit(image, request_params)
+        
+        # 3. 处理结果渲染
+        html_path = process_rendering(outputs, request_params.render)
+
+        return JSONResponse(content={
+                "code":200,
+                "data":{
+                    "text": outputs,
+                    "html_path": html_path
+                },
+                "msg": "success"
+            }
+        )
+
+    except HTTPException:
+        raise  # 直接抛出已有的HTTP异常
+    except Exception as e:
+        logger.error(f"处理失败: {str(e)}", exc_info=True)
+        return JSONResponse(content={
+                "code": 500,
+                "msg": f"处理失败: {str(e)}",
+                "data": None
+            }
+        )
 
+
+@app.post("/ocr/batch", response_model=OCRBatchResponse)
+async def process_ocr_batch(
+    files: List[UploadFile] = File(...),
+    type: str = Form("ocr"),
+    box: Optional[str] = Form(None),
+    color: Optional[str] = Form(None),
+):
+    """批量OCR接口：多张图片一次提交，结果顺序与上传顺序一致，单张失败不影响其他图片"""
+    request_params: OCRRequest = build_request_params(type, box, color)
+    # 逐张解码，解码失败的图片记录错误，不影响其他图片
+    data: List[Optional[dict]] = [None] * len(files)
+    decoded = []
+    for idx, file in enumerate(files):
         try:
-            # 1. 处理输入图片
-            image = await process_image_file(file)
-            
-            # 2. 执行模型推理
-            outputs = await asyncio.to_thread(generate_output, image, request_params)
-            
-            # 3. 处理结果渲染
-            html_path = process_rendering(outputs, request_params.render)
-
-            return JSONResponse(content={
-                    "code":200,
-                    "data":{
-                        "text": outputs,
-                        "html_path": html_path
-                    },
-                    "msg": "success"
-                }
-            )
-
-        except HTTPException:
-            raise  # 直接抛出已有的HTTP异常
+            decoded.append((idx, await process_image_file(file)))
+        except HTTPException as e:
+            data[idx] = {"text": "", "html_path": None, "error": f"{file.filename}: {e.detail}"}
         except Exception as e:
-            logger.error(f"处理失败: {str(e)}", exc_info=True)
-            return JSONResponse(content={
-                    "code": 500,
-                    "msg": f"处理失败: {str(e)}",
-                    "data": None
-                }
-            )
-        finally:
-            logger.info("请求处理完成，释放并发槽")
+            data[idx] = {"text": "", "html_path": None, "error": f"{file.filename}: {str(e)}"}
+    results = await asyncio.gather(
+        *[batcher.submit(image, request_params) for _, image in decoded],
+        return_exceptions=True
+    )
+    for (idx, _), outputs in zip(decoded, results):
+        if isinstance(outputs, Exception):
+            data[idx] = {"text": "", "html_path": None, "error": str(outputs)}
+        else:
+            data[idx] = {"text": outputs, "html_path": process_rendering(outputs, request_params.render)}
+    return JSONResponse(content={
+            "code": 200,
+            "data": data,
+            "msg": "success"
+        }
+    )
 
 if __name__ == "__main__":
     # 全局变量
@@ -255,10 +414,9 @@ if __name__ == "__main__":
     server_port=OCR_SERVER_PORT
     server_host=OCR_SERVER_HOST
     
-    # 从环境变量获取并发数设置，默认为4
+    # 从环境变量获取并发连接数设置（推理并发由微批处理器控制，连接数至少能凑满一个批次）
     max_concurrent = int(os.getenv("MAX_CONCURRENT_REQUESTS", str(OCR_MAX_CONCURRENT_REQUESTS)))
-    MAX_CONCURRENT_REQUESTS = max_concurrent
-    request_semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+    max_concurrent = max(max_concurrent, OCR_MAX_BATCH_SIZE)
     
     # 启动服务器
     uvicorn.run(
@@ -266,7 +424,7 @@ if __name__ == "__main__":
         host=server_host,
         port=server_port,
         # 调整uvicorn的工作线程数
-        workers=1,  # 由于我们使用信号量控制并发，worker数保持为1
-        limit_concurrency=MAX_CONCURRENT_REQUESTS+5,  # 设置稍大于我们的并发限制
+        workers=1,  # 模型只加载一份，由微批处理器串行执行批次，worker数保持为1
+        limit_concurrency=max_concurrent+5,  # 设置稍大于我们的并发限制
         timeout_keep_alive=120  # 保持连接时间
     )
\ No newline at end of file
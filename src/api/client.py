@@ -1,5 +1,6 @@
 import requests
 from urllib.parse import urljoin, urlencode
+from conf.config import MAP_IMAGE_TIMEOUT_SECONDS
 
 class APIClient:
     def __init__(self, base_url):
@@ -44,15 +45,31 @@ class APIClient:
             url=url+"?"+params
         return url
 
-    def download_image(self,url, save_path):
+    def fetch_image(self,url,timeout:float=MAP_IMAGE_TIMEOUT_SECONDS)->bytes:
+        """
+        从指定 URL 下载图片，直接返回二进制内容（不落盘）
+        :param url: 图片的 URL
+        :param timeout: 请求超时（秒）
+        :return: 图片内容，失败（含超时）时返回 b""
+        """
+        try:
+            response = requests.get(url, timeout=timeout)
+            response.raise_for_status()
+            return response.content
+        except requests.RequestException as e:
+            print(f"下载图片时出错: {e}")
+            return b""
+
+    def download_image(self,url, save_path, timeout:float=MAP_IMAGE_TIMEOUT_SECONDS):
         """
         从指定 URL 下载图片并保存到本地路径
         :param url: 图片的 URL
         :param save_path: 保存图片的本地路径
+        :param timeout: 请求超时（秒）
         """
         try:
             # 发送 GET 请求
-            response = requests.get(url)
+            response = requests.get(url, timeout=timeout)
             response.raise_for_status()  # 确保请求成功
 
             # 以二进制写模式打开一个文件，保存图片
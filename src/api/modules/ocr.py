@@ -1,18 +1,30 @@
 import json
+import copy
+import hashlib
+import threading
+from collections import OrderedDict
 from typing import Dict, Any, Optional,List
 from pydantic import BaseModel, Field
 from api.base_models import BaseRequestModel, BaseResponseModel
 from api.api_module import APIModule
 import mimetypes
-from conf.config import OCR_MODEL_PATH
+from conf.config import OCR_MODEL_PATH,OCR_RESULT_CACHE_SIZE
 
 # 请求模型
 class OCRRequestModel(BaseRequestModel):
-    def __init__(self, file_path: str):
-        mime_type, _ = mimetypes.guess_type(file_path)
+    def __init__(self, file_path: str = "", image: bytes = None):
+        """
+        :param file_path: 图片路径
+        :param image: 图片内容（已读入内存时直接传入，不再读文件）
+        """
+        mime_type, _ = mimetypes.guess_type(file_path or "image.png")
         mime_type = mime_type or "application/octet-stream"
+        if image is None:
+            # 读入内存后立即关闭文件句柄
+            with open(file_path, "rb") as fp:
+                image = fp.read()
         files = {
-            "file": (file_path, open(file_path, "rb"), mime_type)
+            "file": (file_path or "image.png", image, mime_type)
         }
         super().__init__(files=files)
 
@@ -42,6 +54,107 @@ class OCRResponseModel(BaseResponseModel):
             data=data
         )
 
+class _InFlightCall:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Optional[OCRResponseModel] = None
+        self.error: Optional[BaseException] = None
+
+
+class OCRResultCache:
+    """
+    OCR 调用结果缓存：按图片内容哈希做 LRU 缓存，并对同一图片的并发请求去重（singleflight），
+    并行字段同时识别同一裁剪图时只向 OCR 服务发送一次请求。
+    每个调用方拿到的都是结果的深拷贝，修改返回值不会影响缓存及其他调用方
+    """
+    def __init__(self, max_size: int = OCR_RESULT_CACHE_SIZE):
+        self.max_size = max_size
+        self.hits = 0
+        self.shared = 0
+        self.misses = 0
+        self._results: "OrderedDict[str, OCRResponseModel]" = OrderedDict()
+        self._inflight: Dict[str, _InFlightCall] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(image: bytes) -> str:
+        return hashlib.sha256(image).hexdigest()
+
+    def get_or_call(self, key: str, call_fun) -> OCRResponseModel:
+        with self._lock:
+            result = self._results.get(key)
+            if result is not None:
+                self._results.move_to_end(key)
+                self.hits += 1
+                return copy.deepcopy(result)
+            inflight = self._inflight.get(key)
+            leader = inflight is None
+            if leader:
+                inflight = _InFlightCall()
+                self._inflight[key] = inflight
+                self.misses += 1
+            else:
+                self.shared += 1
+        if not leader:
+            # 等待正在进行的同一图片请求
+            inflight.done.wait()
+            if inflight.error is not None:
+                raise inflight.error
+            return copy.deepcopy(inflight.result)
+        try:
+            inflight.result = call_fun()
+            # 只缓存识别成功的结果
+            if inflight.result is not None and inflight.result.code == 200 and self.max_size > 0:
+                with self._lock:
+                    self._results[key] = inflight.result
+                    self._results.move_to_end(key)
+                    while len(self._results) > self.max_size:
+                        self._results.popitem(last=False)
+            return copy.deepcopy(inflight.result)
+        except BaseException as e:
+            inflight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            inflight.done.set()
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+
+    def report(self) -> str:
+        with self._lock:
+            total = self.hits + self.shared + self.misses
+            return f"OCR结果缓存: 请求 {total} 次, 缓存命中 {self.hits}, 并发合并 {self.shared}, 实际调用 {self.misses}"
+
+
+OCR_RESULT_CACHE = OCRResultCache()
+
+
+def ocr_call_fun(module: APIModule, params: Dict) -> OCRResponseModel:
+    """读入图片后按内容哈希查缓存/合并并发请求，未命中时才调用 OCR 服务"""
+    image = params.get("image")
+    file_path = params.get("file_path", "")
+    if image is None:
+        with open(file_path, "rb") as fp:
+            image = fp.read()
+
+    def call() -> OCRResponseModel:
+        validated_params = module.request_model(file_path=file_path, image=image)
+        response = module.send_request(
+            method=module.method,
+            url=module.url,
+            headers=module.headers,
+            params=validated_params.params,
+            data=validated_params.data,
+            files=validated_params.files
+        )
+        return module.response_model.from_api_response(response)
+
+    return OCR_RESULT_CACHE.get_or_call(OCR_RESULT_CACHE.key(image), call)
+
+
 # 注册 OCR 模块
 ocr_module = APIModule(
     name="ocr",
@@ -49,5 +162,6 @@ ocr_module = APIModule(
     url=OCR_MODEL_PATH,
     headers={"accept": "application/json"},  # multipart/form-data 会自动设置
     request_model=OCRRequestModel,
-    response_model=OCRResponseModel
+    response_model=OCRResponseModel,
+    call_fun=ocr_call_fun
 )
@@ -17,12 +17,28 @@ OPENAI_API_BASE="https://api.siliconflow.cn/v1"
 # VL大模型
 VL_MODEL_NAME="Qwen/Qwen2.5-VL-72B-Instruct"
 
+# VL请求图片预处理
+## 最长边像素（0 表示不缩放）
+VL_IMAGE_MAX_SIDE=int(os.environ.get("VL_IMAGE_MAX_SIDE",2048))
+## 灰度转换：auto（低饱和度线稿转灰度）/ true / false
+VL_IMAGE_GRAYSCALE=os.environ.get("VL_IMAGE_GRAYSCALE","auto")
+## 发送格式：webp / jpeg / png / original（保持原格式）
+VL_IMAGE_FORMAT=os.environ.get("VL_IMAGE_FORMAT","webp")
+## WebP/JPEG 压缩质量
+VL_IMAGE_QUALITY=int(os.environ.get("VL_IMAGE_QUALITY",90))
+
+# VL图片识别结果缓存（按图片像素哈希+提示词+模型缓存到 DATA_TMP_DIR/vl_cache）
+VL_CACHE_ENABLED=os.environ.get("VL_CACHE_ENABLED","true").lower()=="true"
+
 # 代理模型（用于生成真实值）
 AGENT_MODEL_NAME="Qwen/Qwen2.5-7B-Instruct"
 
 # 候选答案生成模型
 CANDIDATES_GENERATION_MODEL_NAME="Qwen/Qwen2.5-7B-Instruct"
 
+# 批量候选答案生成：单次请求的提示词 token 预算（按字符数估计，0 表示不合并、逐字段生成）
+CANDIDATES_BATCH_MAX_TOKENS=int(os.environ.get("CANDIDATES_BATCH_MAX_TOKENS",20000))
+
 # httpx 配置
 HTTPX_DEFAULT_TIMEOUT = 300.0
 
@@ -41,15 +57,56 @@ IE_MODEL_PATH="http://localhost:9890/ie_server"
 # OCR模型路径
 OCR_MODEL_PATH="http://localhost:8777/ocr"
 
+# 业态字段并发抽取的最大线程数（默认 1 逐个业态顺序抽取，大于 1 时开启并发）
+BUSINESS_MODEL_MAX_WORKERS=int(os.environ.get("BUSINESS_MODEL_MAX_WORKERS",1))
+
+# 出图方式：remote（唯杰地图 WMS 远程出图）/ local（用已查询的实体快照在本地绘制）
+MAP_RENDER_MODE=os.environ.get("MAP_RENDER_MODE","remote")
+# 本地出图使用的中文字体路径（为空时自动查找常见字体）
+LOCAL_RENDER_FONT_PATH=os.environ.get("LOCAL_RENDER_FONT_PATH","")
+
+# 子图导出图片的并发数与失败重试次数
+MAP_IMAGE_EXPORT_WORKERS=int(os.environ.get("MAP_IMAGE_EXPORT_WORKERS",4))
+MAP_IMAGE_EXPORT_RETRIES=int(os.environ.get("MAP_IMAGE_EXPORT_RETRIES",2))
+# 单张图片下载超时（秒），超时视为失败并按重试次数重试
+MAP_IMAGE_TIMEOUT_SECONDS=float(os.environ.get("MAP_IMAGE_TIMEOUT_SECONDS",60))
+
+# 图纸标题表格抽取方式：vector_first（先矢量抽取，完整度不足时再走图片+VL）/ vl（始终图片+VL）
+TABLE_EXTRACT_MODE=os.environ.get("TABLE_EXTRACT_MODE","vector_first")
+# 矢量表格完整度阈值（0~1），低于该值时回退到图片+VL
+TABLE_VECTOR_MIN_SCORE=float(os.environ.get("TABLE_VECTOR_MIN_SCORE",0.8))
+
 # 数据缓存目录
 DATA_TMP_DIR= os.path.join(os.getcwd(),"data/tmp")
 
+# OCR裁剪图片目录（只保存需要作为参考依据的裁剪图，文件名为内容md5）
+OCR_IMAGE_DIR=os.path.join(os.getcwd(),"data/images/ocr")
+
+# OCR裁剪时是否合并相邻的关键词裁剪框（合并区域只出图、识别一次）
+OCR_MERGE_REGIONS=os.environ.get("OCR_MERGE_REGIONS","true").lower()=="true"
+
+# 图片目录中未被引用的图片保留时长（秒），超过后清理
+OCR_IMAGE_RETENTION_SECONDS=int(os.environ.get("OCR_IMAGE_RETENTION_SECONDS",7*24*3600))
+# OCR接口结果缓存条数（按图片内容哈希，LRU淘汰）
+OCR_RESULT_CACHE_SIZE=int(os.environ.get("OCR_RESULT_CACHE_SIZE",256))
+
+# 文件解析缓存格式：json（默认）或 columnar（文本列表按列存储为 .npy，内存映射读取）
+FILE_PARSE_CACHE_FORMAT=os.environ.get("FILE_PARSE_CACHE_FORMAT","json")
+
 # 数据库默认存储路径
 DB_ROOT_PATH = os.path.join(
     os.getcwd(),
     "data/sqlite_database/info.db"
 )
 
+# SQLite 连接参数（每个新连接建立时执行的 PRAGMA）
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",     # 写前日志，读写互不阻塞
+    "synchronous": "NORMAL",   # WAL 模式下兼顾安全与写入性能
+    "busy_timeout": 5000,      # 锁等待时间（毫秒），避免 database is locked
+    "cache_size": -20000,      # 页缓存大小，负数表示 KiB（约 20MB）
+}
+
 # 文件系统存储地址
 FILE_SYSTEM_ROOT_PATH = os.path.join(
     os.getcwd(),
@@ -62,11 +119,28 @@ FILE_SYSTEM_MAPPING_DIR = os.path.join(
     "data/file_system_mapping"
 )
 
+# 上传文件临时目录（与文件系统存储位于同一磁盘，保证原子重命名）
+FILE_UPLOAD_TMP_DIR = os.path.join(
+    os.getcwd(),
+    "data/file_system_upload_tmp"
+)
+
+# 上传文件分块读取大小（字节）
+FILE_UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# 上传文件内容存储目录：按md5保存只读对象，相同内容的文件硬链接到同一对象（需与文件系统存储位于同一磁盘）
+FILE_OBJECT_STORE_DIR = os.path.join(
+    os.getcwd(),
+    "data/file_system_objects"
+)
+
 # 创建数据库和文件系统存储目录
 os.makedirs(os.path.dirname(DB_ROOT_PATH), exist_ok=True)
 os.makedirs(os.path.dirname(FILE_SYSTEM_ROOT_PATH), exist_ok=True)
 os.makedirs(os.path.dirname(FILE_SYSTEM_MAPPING_DIR), exist_ok=True)
 os.makedirs(DATA_TMP_DIR, exist_ok=True)
+os.makedirs(FILE_UPLOAD_TMP_DIR, exist_ok=True)
+os.makedirs(FILE_OBJECT_STORE_DIR, exist_ok=True)
 
 # 打印日志
 print(f"HF_HOME: {HF_HOME}")
@@ -76,18 +150,40 @@ print(f"VJMAP_ACCESS_TOKEN: {VJMAP_ACCESS_TOKEN}")
 print(f"OPENAI_API_KEY: {OPENAI_API_KEY}")
 print(f"OPENAI_API_BASE: {OPENAI_API_BASE}")
 print(f"VL_MODEL_NAME: {VL_MODEL_NAME}")
+print(f"VL_IMAGE_MAX_SIDE: {VL_IMAGE_MAX_SIDE}")
+print(f"VL_IMAGE_GRAYSCALE: {VL_IMAGE_GRAYSCALE}")
+print(f"VL_IMAGE_FORMAT: {VL_IMAGE_FORMAT}")
+print(f"VL_IMAGE_QUALITY: {VL_IMAGE_QUALITY}")
+print(f"VL_CACHE_ENABLED: {VL_CACHE_ENABLED}")
 print(f"AGENT_MODEL_NAME: {AGENT_MODEL_NAME}")
 print(f"CANDIDATES_GENERATION_MODEL_NAME: {CANDIDATES_GENERATION_MODEL_NAME}")
+print(f"CANDIDATES_BATCH_MAX_TOKENS: {CANDIDATES_BATCH_MAX_TOKENS}")
 print(f"HTTPX_DEFAULT_TIMEOUT: {HTTPX_DEFAULT_TIMEOUT}")
 print(f"SERVER_PORT: {SERVER_PORT}")
 print(f"INFERENCE_PORT: {INFERENCE_PORT}")
 print(f"DEFAULT_BIND_HOST: {DEFAULT_BIND_HOST}")
 print(f"IE_MODEL_PATH: {IE_MODEL_PATH}")
 print(f"OCR_MODEL_PATH: {OCR_MODEL_PATH}")
+print(f"BUSINESS_MODEL_MAX_WORKERS: {BUSINESS_MODEL_MAX_WORKERS}")
+print(f"MAP_RENDER_MODE: {MAP_RENDER_MODE}")
+print(f"LOCAL_RENDER_FONT_PATH: {LOCAL_RENDER_FONT_PATH}")
+print(f"MAP_IMAGE_EXPORT_WORKERS: {MAP_IMAGE_EXPORT_WORKERS}")
+print(f"MAP_IMAGE_EXPORT_RETRIES: {MAP_IMAGE_EXPORT_RETRIES}")
+print(f"MAP_IMAGE_TIMEOUT_SECONDS: {MAP_IMAGE_TIMEOUT_SECONDS}")
+print(f"TABLE_EXTRACT_MODE: {TABLE_EXTRACT_MODE}")
+print(f"TABLE_VECTOR_MIN_SCORE: {TABLE_VECTOR_MIN_SCORE}")
 print(f"DATA_TMP_DIR: {DATA_TMP_DIR}")
+print(f"OCR_IMAGE_DIR: {OCR_IMAGE_DIR}")
+print(f"OCR_MERGE_REGIONS: {OCR_MERGE_REGIONS}")
+print(f"OCR_IMAGE_RETENTION_SECONDS: {OCR_IMAGE_RETENTION_SECONDS}")
+print(f"OCR_RESULT_CACHE_SIZE: {OCR_RESULT_CACHE_SIZE}")
+print(f"FILE_PARSE_CACHE_FORMAT: {FILE_PARSE_CACHE_FORMAT}")
 print(f"DB_ROOT_PATH: {DB_ROOT_PATH}")
+print(f"SQLITE_PRAGMAS: {SQLITE_PRAGMAS}")
 print(f"FILE_SYSTEM_ROOT_PATH: {FILE_SYSTEM_ROOT_PATH}")
 print(f"FILE_SYSTEM_ROOT_PATH: {FILE_SYSTEM_ROOT_PATH}")
+print(f"FILE_UPLOAD_TMP_DIR: {FILE_UPLOAD_TMP_DIR}")
+print(f"FILE_OBJECT_STORE_DIR: {FILE_OBJECT_STORE_DIR}")
 print("#"*50)
 
 
@@ -1,9 +1,9 @@
 import os
 import json
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from conf.config import DB_ROOT_PATH
+from conf.config import DB_ROOT_PATH, SQLITE_PRAGMAS
 
 
 # 确保数据库文件所在目录存在
@@ -19,10 +19,46 @@ engine = create_engine(
     json_serializer=lambda obj: json.dumps(obj, ensure_ascii=False),
 )
 
+
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """每个新连接建立时设置 SQLite PRAGMA（WAL、busy_timeout 等）"""
+    cursor = dbapi_connection.cursor()
+    try:
+        for key, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {key}={value}")
+    finally:
+        cursor.close()
+
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
 
+def migrate_columns():
+    """为已存在的表补加新增的列（create_all 不会修改旧表结构）"""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            exist_columns = {col["name"] for col in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in exist_columns:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'))
+
+
+def migrate_indexes():
+    """为已存在的表补建索引（create_all 只建新表，不会给旧表增加索引）"""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+
 def create_tables():
-    Base.metadata.create_all(bind=engine)
\ No newline at end of file
+    Base.metadata.create_all(bind=engine)
+    migrate_columns()
+    migrate_indexes()
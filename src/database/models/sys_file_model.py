@@ -6,6 +6,7 @@ from sqlalchemy import (
     DateTime, 
     func,
     UniqueConstraint,
+    Index,
     Enum as SAEnum,
     Boolean
 )
@@ -26,6 +27,9 @@ class SysFileModel(Base):
     __tablename__ = 'sys_file'
     __table_args__ = (
         UniqueConstraint('file_name', 'file_parent', name='uniq_name_in_folder'),
+        Index('idx_sys_file_parent', 'file_parent'),
+        Index('idx_sys_file_md5', 'file_md5'),
+        Index('idx_sys_file_path', 'file_path'),
     )
 
 
@@ -36,6 +40,7 @@ class SysFileModel(Base):
     file_type = Column(SAEnum(FileType), comment='文件类型(D目录，F文件)')
     file_suffix = Column(String(16), comment='文件后缀')
     file_parent = Column(String(64), default='root', nullable=False, comment='父目录ID（默认 root 表示顶层）')
+    file_path = Column(String(4096), comment='物化路径（相对文件系统根目录，以/分隔）')
     can_delete = Column(Boolean, default=True, comment='是否可以删除')
     update_time = Column(DateTime, default=func.now(), onupdate=func.now(), comment='更新时间')
     create_time = Column(DateTime, default=func.now(), comment='创建时间')
@@ -1,5 +1,5 @@
 import enum
-from sqlalchemy import Column, String, Integer, DateTime, Text, Enum, ForeignKey, UniqueConstraint 
+from sqlalchemy import Column, String, Integer, DateTime, Text, Enum, ForeignKey, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.types import JSON
 from sqlalchemy.sql import func
@@ -23,6 +23,7 @@ class TaskModel(Base):
     __tablename__ = 'task'
     __table_args__ = (
         UniqueConstraint('task_name', name='uniq_task_name'),
+        Index('idx_task_status', 'task_status'),
     )
 
     task_id = Column(String(64), primary_key=True, default=generate_task_id, comment='任务ID')
@@ -1,12 +1,17 @@
 from database.models.sys_file_model import SysFileModel, FileType
 from database.utils import generate_file_id
 from database.session import with_session
-from conf.config import FILE_SYSTEM_ROOT_PATH
+from conf.config import FILE_SYSTEM_ROOT_PATH, FILE_UPLOAD_TMP_DIR, FILE_UPLOAD_CHUNK_SIZE, FILE_OBJECT_STORE_DIR
 from pathlib import Path
+import tempfile
 import hashlib
+import shutil
+import stat
+import threading
 import os
 from fastapi import UploadFile
 from typing import Optional
+from sqlalchemy import and_, literal, func, String
 
 # 获取文件的子文件列表
 @with_session
@@ -52,8 +57,9 @@ def get_file_by_id(session, file_id: str):
 # 创建文件夹
 @with_session
 def create_folder(session, file_name: str, parent_id: str):
-    # 构建文件夹的完整路径
-    folder_path = _build_folder_path(session, file_name, parent_id)
+    # 构建文件夹的物化路径及完整路径
+    relative_path = _join_relative_path(_get_parent_relative_path(session, parent_id), file_name)
+    folder_path = _to_physical_path(relative_path)
     
     # 在本地文件系统中创建目录
     try:
@@ -67,6 +73,7 @@ def create_folder(session, file_name: str, parent_id: str):
         file_type=FileType.DIRECTORY,
         file_suffix='',
         file_parent=parent_id,
+        file_path=relative_path,
         file_size=0
     )
     session.add(folder)
@@ -85,55 +92,205 @@ def create_folder(session, file_name: str, parent_id: str):
         'update_time': folder.update_time.isoformat() if folder.update_time else None
     }
 
+def _to_physical_path(relative_path: str) -> str:
+    """物化路径（以/分隔）转换为本地文件系统路径"""
+    return os.path.join(FILE_SYSTEM_ROOT_PATH, *relative_path.split("/"))
+
+def _join_relative_path(parent_path: str, name: str) -> str:
+    """拼接物化路径，顶层目录的父路径为空串"""
+    return f"{parent_path}/{name}" if parent_path else name
+
+def _get_relative_path(session, file: SysFileModel) -> str:
+    """获取记录的物化路径；旧数据尚未回填时逐级向上拼接并写回"""
+    if file.file_path:
+        return file.file_path
+    parent_path = _get_parent_relative_path(session, file.file_parent)
+    file.file_path = _join_relative_path(parent_path, file.file_name)
+    return file.file_path
+
+def _get_parent_relative_path(session, parent_id: str) -> str:
+    """获取父目录的物化路径（一次主键查询）"""
+    if parent_id == "root":
+        return ""
+    parent_folder = session.query(SysFileModel).filter_by(file_id=parent_id).first()
+    if not parent_folder:
+        raise ValueError(f"父目录不存在: {parent_id}")
+    return _get_relative_path(session, parent_folder)
+
+def _subtree_filter(folder_path: str):
+    """
+    子树范围条件：file_path ∈ [folder_path/, folder_path0)
+    '0' 是 '/' 的下一个字符，区间内恰好是该目录下的全部后代，可直接走 file_path 索引
+    """
+    return and_(
+        SysFileModel.file_path >= f"{folder_path}/",
+        SysFileModel.file_path < f"{folder_path}0"
+    )
+
 def _build_folder_path(session, file_name: str, parent_id: str) -> str:
     """构建文件夹的完整路径"""
-    if parent_id == "root":
-        # 如果是根目录，直接在文件系统根路径下创建
-        return os.path.join(FILE_SYSTEM_ROOT_PATH, file_name)
+    parent_path = _get_parent_relative_path(session, parent_id)
+    return _to_physical_path(_join_relative_path(parent_path, file_name))
+
+def _stream_to_temp_file(uploaded_file: UploadFile):
+    """
+    分块将上传文件写入临时文件，同时增量计算md5
+    内存占用只与分块大小有关，与文件大小无关
+    返回 (临时文件路径, md5, 文件大小)
+    """
+    file_md5 = hashlib.md5()
+    file_size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=FILE_UPLOAD_TMP_DIR, suffix=".part")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            while True:
+                chunk = uploaded_file.file.read(FILE_UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                file_md5.update(chunk)
+                f.write(chunk)
+                file_size += len(chunk)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return tmp_path, file_md5.hexdigest(), file_size
+
+def _object_path(file_md5: str) -> str:
+    """内容对象路径：按md5前两位分目录"""
+    return os.path.join(FILE_OBJECT_STORE_DIR, file_md5[:2], file_md5)
+
+def _make_read_only(path: str):
+    mode = os.stat(path).st_mode
+    os.chmod(path, mode & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+
+def _link_replace(source: str, save_path: str):
+    """为 source 在 save_path 建立硬链接（目标已存在时原子替换）"""
+    link_tmp = f"{save_path}.{os.getpid()}.{threading.get_ident()}.link"
+    os.link(source, link_tmp)
+    try:
+        os.replace(link_tmp, save_path)
+    except Exception:
+        os.unlink(link_tmp)
+        raise
+
+def _store_file(tmp_path: str, file_md5: str, save_path: str):
+    """
+    将临时文件按内容去重后放到目标位置
+    内容对象按md5只保存一份且设为只读，各记录的物理文件都是该对象的硬链接：
+    - 相同内容（含不同目录下的文件）只占用一份磁盘空间
+    - 共享的 inode 只读，任何一处都无法原地修改而影响其他文件；覆盖上传总是整体替换目录项
+    - 删除记录只删除其硬链接，对象在没有任何记录引用时由 _release_object 回收
+    文件系统不支持硬链接（或对象目录跨磁盘）时退化为每条记录独占一份文件
+    """
+    object_path = _object_path(file_md5)
+    try:
+        if os.path.exists(object_path):
+            try:
+                _link_replace(object_path, save_path)
+                os.unlink(tmp_path)
+                return
+            except FileNotFoundError:
+                # 对象恰好被并发删除，按新对象重新保存
+                pass
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        _make_read_only(tmp_path)
+        os.replace(tmp_path, object_path)
+        _link_replace(object_path, save_path)
+        return
+    except OSError:
+        pass
+    if os.path.exists(tmp_path):
+        try:
+            os.replace(tmp_path, save_path)
+        except OSError:
+            # 跨设备时无法原子重命名，退化为移动
+            shutil.move(tmp_path, save_path)
     else:
-        # 获取父目录信息
-        parent_folder = session.query(SysFileModel).filter_by(file_id=parent_id).first()
-        if not parent_folder:
-            raise ValueError(f"父目录不存在: {parent_id}")
-        
-        # 递归构建父目录路径
-        parent_path = _build_folder_path(session, parent_folder.file_name, parent_folder.file_parent)
-        return os.path.join(parent_path, file_name)
+        # 临时文件已放入对象存储但无法建立链接，复制一份后回收对象
+        shutil.copyfile(object_path, save_path)
+        _release_object(file_md5)
+
+def _release_object(file_md5: Optional[str]):
+    """内容对象只剩自身一个链接（没有记录引用）时删除"""
+    if not file_md5:
+        return
+    object_path = _object_path(file_md5)
+    try:
+        if os.stat(object_path).st_nlink <= 1:
+            os.unlink(object_path)
+    except OSError:
+        pass
+
+def _unlink_physical_file(file_path: str) -> bool:
+    """删除记录的物理文件（只删除硬链接，不修改共享对象的权限）"""
+    if not os.path.lexists(file_path):
+        return False
+    os.unlink(file_path)
+    return True
 
 # 上传文件到指定目录
 @with_session
 def upload_file_to_directory(session, uploaded_file: UploadFile, parent_id: str):
-    content = uploaded_file.file.read()
-    file_md5 = hashlib.md5(content).hexdigest()
     suffix = Path(uploaded_file.filename).suffix.lstrip('.')
     file_id = generate_file_id()
 
-    # 构建文件的完整保存路径
-    save_path = _build_file_save_path(session, uploaded_file.filename, parent_id)
+    # 构建文件的物化路径及完整保存路径
+    relative_path = _join_relative_path(_get_parent_relative_path(session, parent_id), uploaded_file.filename)
+    save_path = _to_physical_path(relative_path)
     
-    # 确保父目录存在
-    os.makedirs(os.path.dirname(save_path), exist_ok=True)
+    # 分块写入临时文件
+    try:
+        tmp_path, file_md5, file_size = _stream_to_temp_file(uploaded_file)
+    except Exception as e:
+        return {"success": False, "message": f"保存文件失败: {str(e)}"}
     
-    # 保存文件到本地文件系统
     try:
-        with open(save_path, 'wb') as f:
-            f.write(content)
+        # 同级目录下同名文件：内容相同且物理文件存在时直接复用记录，不重复写盘；
+        # 内容不同或物理文件缺失时覆盖写入（与原有上传行为一致），并更新原记录而不是新增重复记录
+        existing_file = session.query(SysFileModel).filter_by(
+            file_parent=parent_id, file_name=uploaded_file.filename
+        ).first()
+        if existing_file and existing_file.file_md5 == file_md5 and os.path.exists(save_path):
+            os.unlink(tmp_path)
+            return _file_to_dict(existing_file)
+        replaced_md5 = existing_file.file_md5 if existing_file else None
+        
+        # 确保父目录存在；相同md5的内容只保存一份
+        os.makedirs(os.path.dirname(save_path), exist_ok=True)
+        _store_file(tmp_path, file_md5, save_path)
+        if replaced_md5 and replaced_md5 != file_md5:
+            _release_object(replaced_md5)
     except Exception as e:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
         return {"success": False, "message": f"保存文件失败: {str(e)}"}
 
+    if existing_file:
+        existing_file.file_suffix = suffix
+        existing_file.file_path = relative_path
+        existing_file.file_size = file_size
+        existing_file.file_md5 = file_md5
+        session.commit()
+        return _file_to_dict(existing_file)
+
     file = SysFileModel(
         file_id=file_id,
         file_name=uploaded_file.filename,
         file_type=FileType.FILE,
         file_suffix=suffix,
         file_parent=parent_id,
-        file_size=len(content),
+        file_path=relative_path,
+        file_size=file_size,
         file_md5=file_md5
     )
     session.add(file)
     session.commit()
 
     # 返回字典格式
+    return _file_to_dict(file)
+
+def _file_to_dict(file: SysFileModel) -> dict:
     return {
         'file_id': file.file_id,
         'file_name': file.file_name,
@@ -148,33 +305,12 @@ def upload_file_to_directory(session, uploaded_file: UploadFile, parent_id: str)
 
 def _build_file_save_path(session, filename: str, parent_id: str) -> str:
     """构建文件的完整保存路径"""
-    if parent_id == "root":
-        # 如果是根目录，直接在文件系统根路径下保存
-        return os.path.join(FILE_SYSTEM_ROOT_PATH, filename)
-    else:
-        # 获取父目录信息
-        parent_folder = session.query(SysFileModel).filter_by(file_id=parent_id).first()
-        if not parent_folder:
-            raise ValueError(f"父目录不存在: {parent_id}")
-        
-        # 递归构建父目录路径
-        parent_path = _build_folder_path(session, parent_folder.file_name, parent_folder.file_parent)
-        return os.path.join(parent_path, filename)
+    parent_path = _get_parent_relative_path(session, parent_id)
+    return _to_physical_path(_join_relative_path(parent_path, filename))
 
 def _build_file_path_for_deletion(session, file: SysFileModel) -> str:
     """构建文件删除时的完整路径"""
-    if file.file_parent == "root":
-        # 如果是根目录下的文件
-        return os.path.join(FILE_SYSTEM_ROOT_PATH, file.file_name)
-    else:
-        # 获取父目录信息
-        parent_folder = session.query(SysFileModel).filter_by(file_id=file.file_parent).first()
-        if not parent_folder:
-            raise ValueError(f"父目录不存在: {file.file_parent}")
-        
-        # 递归构建父目录路径
-        parent_path = _build_folder_path(session, parent_folder.file_name, parent_folder.file_parent)
-        return os.path.join(parent_path, file.file_name)
+    return _to_physical_path(_get_relative_path(session, file))
 
 
 # 递归删除文件或文件夹
@@ -193,16 +329,16 @@ def delete_file_recursive(session, file_id: str):
     
     try:
         if file.file_type == FileType.DIRECTORY:
-            # 如果是文件夹，先递归删除所有子文件和子文件夹
-            deleted_files.extend(_delete_folder_recursive(session, file_id))
+            # 如果是文件夹，先删除其子树下的所有文件和文件夹
+            deleted_files.extend(_delete_folder_recursive(session, file))
         else:
             # 如果是文件，删除物理文件
             if file.file_name:
                 # 构建文件的完整路径
                 file_path = _build_file_path_for_deletion(session, file)
-                if os.path.exists(file_path):
-                    os.unlink(file_path)
+                if _unlink_physical_file(file_path):
                     deleted_files.append(str(file_path))
+                _release_object(file.file_md5)
         
         # 删除数据库记录
         session.delete(file)
@@ -230,31 +366,27 @@ def delete_file_recursive(session, file_id: str):
         return {"success": False, "message": f"删除失败: {str(e)}"}
 
 
-def _delete_folder_recursive(session, folder_id: str):
+def _delete_folder_recursive(session, folder: SysFileModel):
     """
-    递归删除文件夹的内部函数
-    返回被删除的物理文件路径列表
+    删除文件夹子树的内部函数
+    通过物化路径一次范围查询取出全部后代，返回被删除的物理文件路径列表
     """
     deleted_files = []
+    subtree = _subtree_filter(_get_relative_path(session, folder))
     
-    # 获取文件夹下的所有子文件和子文件夹
-    children = session.query(SysFileModel).filter(SysFileModel.file_parent == folder_id).all()
+    # 获取文件夹下的所有后代文件
+    children = session.query(SysFileModel).filter(subtree, SysFileModel.file_type == FileType.FILE).all()
     
     for child in children:
-        if child.file_type == FileType.DIRECTORY:
-            # 递归删除子文件夹
-            deleted_files.extend(_delete_folder_recursive(session, child.file_id))
-        else:
-            # 删除物理文件
-            if child.file_name:
-                # 构建文件的完整路径
-                file_path = _build_file_path_for_deletion(session, child)
-                if os.path.exists(file_path):
-                    os.unlink(file_path)
-                    deleted_files.append(str(file_path))
-        
-        # 删除数据库记录
-        session.delete(child)
+        # 删除物理文件
+        if child.file_name:
+            file_path = _to_physical_path(child.file_path)
+            if _unlink_physical_file(file_path):
+                deleted_files.append(str(file_path))
+            _release_object(child.file_md5)
+    
+    # 批量删除数据库记录
+    session.query(SysFileModel).filter(subtree).delete(synchronize_session=False)
     
     return deleted_files
 
@@ -269,6 +401,7 @@ def get_file_info(session, file_id: str)->Optional[SysFileModel]:
         _ = file.file_size
         _ = file.file_suffix
         _ = file.file_parent
+        _ = file.file_path
         _ = file.file_md5
         _ = file.create_time
         _ = file.update_time
@@ -314,10 +447,8 @@ def update_file_name(session, file_id: str, file_name: str):
         # 如果是文件或目录，都需要重命名物理文件/文件夹
         if file.file_type in [FileType.FILE, FileType.DIRECTORY]:
             # 构建旧文件/文件夹路径
-            if file.file_type == FileType.FILE:
-                old_file_path = _build_file_path_for_deletion(session, file)
-            else:  # FileType.DIRECTORY
-                old_file_path = _build_folder_path(session, file.file_name, file.file_parent)
+            old_relative_path = _get_relative_path(session, file)
+            old_file_path = _to_physical_path(old_relative_path)
             
             # 构建新文件/文件夹路径
             if file.file_type == FileType.FILE and file.file_suffix:
@@ -326,12 +457,21 @@ def update_file_name(session, file_id: str, file_name: str):
                 new_file_name = file_name
             
             # 构建新文件/文件夹路径
-            parent_path = _build_folder_path(session, "", file.file_parent)
-            new_file_path = os.path.join(parent_path, new_file_name)
+            parent_path = _get_parent_relative_path(session, file.file_parent)
+            new_relative_path = _join_relative_path(parent_path, new_file_name)
+            new_file_path = _to_physical_path(new_relative_path)
             
             # 重命名物理文件/文件夹
             if os.path.exists(old_file_path):
                 os.rename(old_file_path, new_file_path)
+            
+            # 更新物化路径；目录需同步替换整棵子树的路径前缀
+            file.file_path = new_relative_path
+            if file.file_type == FileType.DIRECTORY:
+                session.query(SysFileModel).filter(_subtree_filter(old_relative_path)).update(
+                    {SysFileModel.file_path: literal(new_relative_path, String) + func.substr(SysFileModel.file_path, len(old_relative_path) + 1)},
+                    synchronize_session=False
+                )
         
         # 更新数据库记录
         file.file_name = file_name
@@ -373,3 +513,32 @@ def update_file_name(session, file_id: str, file_name: str):
                 pass
         return {"success": False, "message": f"更新文件名失败: {str(e)}"}
 
+@with_session
+def backfill_file_paths(session):
+    """
+    为旧数据回填物化路径
+    一次性加载全部记录在内存中拼接路径，避免逐级查询
+    """
+    files = session.query(SysFileModel).all()
+    file_map = {file.file_id: file for file in files}
+    
+    def _resolve(file: SysFileModel) -> str:
+        if file.file_path:
+            return file.file_path
+        if file.file_parent == "root":
+            file.file_path = file.file_name
+        else:
+            parent = file_map.get(file.file_parent)
+            if not parent:
+                return None
+            parent_path = _resolve(parent)
+            if parent_path is None:
+                return None
+            file.file_path = _join_relative_path(parent_path, file.file_name)
+        return file.file_path
+    
+    missing = [file for file in files if not file.file_path]
+    for file in missing:
+        _resolve(file)
+    session.commit()
+    return sum(1 for file in missing if file.file_path)
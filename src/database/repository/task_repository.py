@@ -207,4 +207,11 @@ def update_task_result(session, task_id: str, result: Dict[str, Any]) -> bool:
         return False
     task.task_result = result
     session.commit()
-    return True
\ No newline at end of file
+    return True
+
+
+@with_session
+def get_all_task_results(session) -> List[Any]:
+    """获取所有任务的结果（用于统计结果中仍在引用的文件）"""
+    rows = session.query(TaskModel.task_result).filter(TaskModel.task_result.isnot(None)).all()
+    return [row[0] for row in rows]
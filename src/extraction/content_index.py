@@ -0,0 +1,58 @@
+"""
+文件内容倒排索引
+
+以二元组（相邻两个字符）为索引项，记录包含该二元组的内容编号。
+查找关键词时先对其全部二元组的倒排表求交得到候选内容，再做子串校验，
+字段抽取时无需对整个项目的文本逐条扫描
+"""
+from collections import defaultdict
+from typing import Dict, List, Set, Iterable
+
+
+class ContentIndex:
+    """单个文件上下文的内容倒排索引"""
+
+    def __init__(self, contents: List[str], table_count: int = 0, ngram: int = 2):
+        """
+        Args:
+            contents: 内容列表（表格内容在前，文本内容在后，与字段原有的拼接顺序一致）
+            table_count: 表格内容条数
+            ngram: 索引项长度
+        """
+        self.contents = contents
+        self.table_count = table_count
+        self.ngram = ngram
+        self.postings: Dict[str, Set[int]] = defaultdict(set)
+        # 关键词 → 命中的内容编号，多个字段使用相同关键词时共享结果
+        self._key_cache: Dict[str, List[int]] = {}
+        for idx, content in enumerate(contents):
+            if not content:
+                continue
+            for gram in {content[i:i + ngram] for i in range(len(content) - ngram + 1)}:
+                self.postings[gram].add(idx)
+
+    def _candidates(self, key: str) -> Iterable[int]:
+        if len(key) < self.ngram:
+            return range(len(self.contents))
+        grams = {key[i:i + self.ngram] for i in range(len(key) - self.ngram + 1)}
+        posting_lists = sorted((self.postings.get(gram, set()) for gram in grams), key=len)
+        if not posting_lists[0]:
+            return []
+        return set.intersection(*posting_lists)
+
+    def match(self, key: str) -> List[int]:
+        """返回包含关键词的内容编号（升序），结果按关键词缓存"""
+        hits = self._key_cache.get(key)
+        if hits is None:
+            hits = sorted(idx for idx in self._candidates(key) if key in self.contents[idx]) if key else []
+            self._key_cache[key] = hits
+        return hits
+
+    def lookup(self, keys: List[str], include_tables: bool = True) -> List[str]:
+        """返回包含任一关键词的内容（保持原始顺序）"""
+        hits = set()
+        for key in keys:
+            for idx in self.match(key):
+                if include_tables or idx >= self.table_count:
+                    hits.add(idx)
+        return [self.contents[idx] for idx in sorted(hits)]
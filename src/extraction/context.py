@@ -1,14 +1,16 @@
 import os
 import re
 from dataclasses import dataclass,field
-from typing import List,Dict,Literal,Optional,Tuple
+from typing import List,Dict,Literal,Optional,Tuple,Any
 
 from enum import Enum
 
 from vjmap.items import (
     QueryItem,
+    QueryItemCollection,
     EnvelopBounds
 )
+from extraction.content_index import ContentIndex
 
 
 class ContextScope(Enum):
@@ -27,6 +29,8 @@ class BaseFileContext:
     file_name: str = field(init=False, metadata={"help": "文件名"})
     file_extension: str = field(init=False, metadata={"help": "文件后缀"})
     file_size:int=field(init=False,metadata={"help":"文件大小"})
+    _title_index:Optional[ContentIndex]=field(default=None,init=False,repr=False,compare=False,metadata={"help":"段落标题索引"})
+    _content_index:Optional[ContentIndex]=field(default=None,init=False,repr=False,compare=False,metadata={"help":"表格/文本内容倒排索引"})
 
     def __post_init__(self):
         """在实例化时自动解析文件名和后缀"""
@@ -34,6 +38,47 @@ class BaseFileContext:
             self.file_name = os.path.basename(self.file_path)  # 获取文件名（带后缀）
             self.file_extension = os.path.splitext(self.file_name)[1]  # 获取文件后缀（带点）
             self.file_size=os.path.getsize(self.file_path)
+        self.build_title_index()
+    
+    def build_title_index(self)->Optional[ContentIndex]:
+        """为段落标题建立倒排索引（段落列表有变化时重建）"""
+        if not self.paragraphs:
+            self._title_index=None
+            return None
+        if self._title_index is None or len(self._title_index.contents)!=len(self.paragraphs):
+            self._title_index=ContentIndex(contents=[paragraph.get("title") or "" for paragraph in self.paragraphs])
+        return self._title_index
+    
+    def match_paragraphs(self,keys:List[str])->List[str]:
+        """
+        获取标题包含任一关键词的段落内容（保持段落原始顺序，每个段落只出现一次）
+        各关键词的命中结果缓存在索引中，多个字段关键词重叠时共享
+        """
+        index=self.build_title_index()
+        if index is None:
+            return []
+        hit_ids=set()
+        for key in keys:
+            hit_ids.update(index.match(key))
+        return [self.paragraphs[idx]['content'] for idx in sorted(hit_ids)]
+    
+    def build_content_index(self)->ContentIndex:
+        """为表格/文本内容建立倒排索引（首次查找时建立，内容列表有变化时重建）"""
+        table_content_list=getattr(self,"table_content_list",None) or []
+        text_content_list=self.text_content_list or []
+        index=self._content_index
+        if (index is None or index.table_count!=len(table_content_list)
+                or len(index.contents)!=len(table_content_list)+len(text_content_list)):
+            index=ContentIndex(
+                contents=list(table_content_list)+list(text_content_list),
+                table_count=len(table_content_list)
+            )
+            self._content_index=index
+        return index
+    
+    def lookup_contents(self,keys:List[str],include_tables:bool=True)->List[str]:
+        """获取包含任一关键词的表格/文本内容（保持原始顺序）"""
+        return self.build_content_index().lookup(keys,include_tables=include_tables)
 
 @dataclass
 class FacadeContext:
@@ -146,6 +191,23 @@ class DwgFileContext(BaseFileContext):
     mapid:Optional[str]=field(default=None,metadata={"help":"地图ID"})
     fileid:Optional[str]=field(default=None,metadata={"help":"文件ID"})
     uploadname:Optional[str]=field(default=None,metadata={"help":"上传名称"})
+    _text_collection:Optional[Any]=field(default=None,init=False,repr=False,compare=False,metadata={"help":"文本列式集合缓存"})
+    
+    def get_text_collection(self)->QueryItemCollection:
+        """
+        文本列表的列式集合（bounds/中心点只计算一次）
+        text_list 被整体替换时自动重建；原地增删或修改文本后需调用 invalidate_text_collection
+        """
+        cached=self._text_collection
+        # 缓存持有列表对象本身，按对象判断是否被替换，不受 id 复用影响
+        if cached is None or cached[0] is not self.text_list:
+            cached=(self.text_list,QueryItemCollection(self.text_list))
+            self._text_collection=cached
+        return cached[1]
+    
+    def invalidate_text_collection(self):
+        """丢弃文本列式集合缓存（原地修改 text_list 后调用）"""
+        self._text_collection=None
 
 
 @dataclass
@@ -173,6 +235,9 @@ class ProjectContext:
     
     project_name:str=field(init=False,metadata={"help":"项目名称"})
     
+    layout_cache:Optional[Any]=field(default=None,init=False,repr=False,metadata={"help":"子布局缓存（ChildLayoutCache），任务内共享"})
+    candidates_batch:Optional[Any]=field(default=None,init=False,repr=False,metadata={"help":"候选答案批量生成收集器（CandidatesBatch），为空时逐字段生成"})
+    
     
     
     def get_contents_by_scope(self,scope:ContextScope)->List[BaseFileContext]:
@@ -189,5 +254,9 @@ class ProjectContext:
         else:
             raise ValueError(f"不存在上下文【{scope.value()}】类型")
     
+    def lookup_contents(self,file_context:BaseFileContext,keys:List[str],include_tables:bool=True)->List[str]:
+        """获取文件上下文中包含任一关键词的表格/文本内容（索引挂在文件上下文上，按需建立）"""
+        return file_context.lookup_contents(keys,include_tables=include_tables)
+    
     def __post_init__(self):
         self.project_name = os.path.basename(self.root_dir)  # 获取文件名（带后缀）
\ No newline at end of file
@@ -2,9 +2,11 @@
 # 标准库导入
 # =============================================================================
 import re
+import copy
+import threading
 from abc import ABC, abstractmethod
 from collections import Counter
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import as_completed
 from dataclasses import dataclass, field, asdict
 from typing import List, Literal, Optional, Union, Dict, Tuple, Any
 import jionlp
@@ -45,7 +47,7 @@ from pipelines.ai_task_pipelines import (
 )
 
 # 文件解析管道
-from pipelines.fileparse_pipelines import DwgTextParsePipeLine,DwgTextParseByMapIdAndFileIdPipeLine
+from pipelines.fileparse_pipelines import DwgTextParsePipeLine,ChildLayoutCache
 from pipelines.cut_off_pipelines import DwgImageCatOffPipeLine
 
 # 分割器
@@ -56,14 +58,26 @@ from api.modules import api_caller
 from api.modules.ocr import OCRResponseModel
 from api.modules.ie import IEResponseModel
 
+# 配置
+from conf.config import BUSINESS_MODEL_MAX_WORKERS,OCR_MERGE_REGIONS
+
 # 工具模块
 from utils.address import parse_regions, get_level_by_city
 from utils.data import is_number
 from utils.file import image_to_text
+from utils.thread import ContextThreadPoolExecutor
 
 # VJMap模块
-from vjmap.items import QueryItem
-from vjmap.services import ExportLayoutService
+from vjmap.items import QueryItem,QueryItemCollection
+
+# 正则注册表
+from extraction.patterns import PATTERN_REGISTRY, TimedPattern
+
+
+# 字段间共用的正则（模块加载时编译一次）
+DIGITS_PATTERN = PATTERN_REGISTRY.compile(r'\d+', name="数字")
+NUMBER_PATTERN = PATTERN_REGISTRY.compile(r'-?\d+\.?\d*', name="带符号数值")
+DECIMAL_PATTERN = PATTERN_REGISTRY.compile(r'\d+\.?\d*', name="小数")
 
 
 # =============================================================================
@@ -135,6 +149,9 @@ class ReferenceData:
 class Field(ABC):
     """字段基类 - 所有字段类型的抽象基类"""
     
+    # 字段用到的正则 {名称: (模式, flags)}，子类按需覆盖，构造时统一编译
+    patterns: Dict[str, Tuple[str, int]] = {}
+    
     def __init__(self,
                  name: str,
                  alias: List[str] = [],
@@ -177,6 +194,13 @@ class Field(ABC):
         self.field_id = field_id
         self.candidates = []
         self.is_general_candidates = is_general_candidates
+        self._run_lock = threading.RLock()  # 运行实例的解析锁（依赖字段可能被多个线程同时触发解析）
+        self._parsing_thread = None         # 正在解析本字段的线程（用于发现循环依赖）
+        # 字段用到的正则在构造时编译（注册表内同一模式只编译一次）
+        self.compiled_patterns: Dict[str, TimedPattern] = {
+            key: PATTERN_REGISTRY.compile(pattern, flags, name=f"{self.name}.{key}")
+            for key, (pattern, flags) in self.patterns.items()
+        }
         
     
     # =============================================================================
@@ -212,6 +236,41 @@ class Field(ABC):
         ]
         return results
     
+    def extract_surrounding_text_multi(self, text, keys: List[str], pre_len=10, post_len=50, max_len=None) -> List[str]:
+        """
+        一次扫描提取多个关键词周围的文本
+        
+        所有关键词组合为一个交替正则（长词优先），单次遍历找出全部命中，
+        相互重叠的窗口合并为一个片段，避免别名较多时对同一文本反复扫描
+        
+        Args:
+            text: 源文本
+            keys: 关键词列表
+            pre_len: 前置文本长度
+            post_len: 后置文本长度
+            max_len: 合并片段的最大长度，默认为单个窗口长度的2倍；超出时另起片段
+            
+        Returns:
+            匹配的文本片段列表（按出现位置排序）
+        """
+        keys = [key for key in dict.fromkeys(keys) if key]
+        if not text or not keys:
+            return []
+        if max_len is None:
+            max_len = 2 * (pre_len + post_len + max(len(key) for key in keys))
+        alternation = "|".join(re.escape(key) for key in sorted(keys, key=len, reverse=True))
+        pattern = PATTERN_REGISTRY.compile(alternation, name=f"{self.name}.关键词")
+        # 合并重叠窗口
+        spans = []
+        for match in pattern.finditer(text):
+            start = max(0, match.start() - pre_len)
+            end = min(len(text), match.end() + post_len)
+            if spans and start <= spans[-1][1] and max(spans[-1][1], end) - spans[-1][0] <= max_len:
+                spans[-1][1] = max(spans[-1][1], end)
+            else:
+                spans.append([start, end])
+        return [text[start:end] for start, end in spans]
+    
     # =============================================================================
     # 核心处理方法
     # =============================================================================
@@ -220,7 +279,47 @@ class Field(ABC):
         """后处理方法 - 子类可重写"""
         return self.value
     
+    # =============================================================================
+    # 字段定义（spec）与运行实例（run）
+    # =============================================================================
+    
+    def _reset_run_state(self):
+        """重置运行状态 - 子类有额外运行状态时重写"""
+        self.value = None
+        self.ref_data = ReferenceData()
+        self.candidates = []
+    
+    def spawn(self) -> "Field":
+        """
+        由字段定义创建一次抽取使用的运行实例
+        
+        注册的字段只作为定义（别名、范围、正则等配置）使用，不直接解析；
+        每次抽取任务创建各自的运行实例，value/ref_data/candidates 等运行状态互不共享。
+        运行实例是浅拷贝，alias/dependencies/context_scope/compiled_patterns 等配置对象与定义共享，
+        因此定义在 spawn 之后视为只读：不得原地修改这些配置，运行状态只能写在运行实例的独立属性上
+        """
+        run = copy.copy(self)
+        run._run_lock = threading.RLock()
+        run._parsing_thread = None
+        run._reset_run_state()
+        return run
+    
     def parse(self, context, **kwargs):
+        """
+        解析字段值（同一运行实例加锁，保证只解析一次）
+        依赖字段在持有本字段锁时解析，依赖关系必须无环（create_field_runs 创建时检查），
+        否则同一线程内的循环会被检测为错误，不同线程间的循环会互相等待
+        """
+        with self._run_lock:
+            if self._parsing_thread == threading.get_ident():
+                raise ValueError(f"字段【{self.name}】存在循环依赖")
+            self._parsing_thread = threading.get_ident()
+            try:
+                return self._parse(context, **kwargs)
+            finally:
+                self._parsing_thread = None
+    
+    def _parse(self, context, **kwargs):
         """
         解析字段值
         
@@ -294,7 +393,7 @@ class Field(ABC):
             )
             return content, res
 
-        with ThreadPoolExecutor(max_workers=20) as executor:
+        with ContextThreadPoolExecutor(max_workers=20) as executor:
             future_to_content = {executor.submit(call_ie, content): content for content in contents}
             for future in tqdm.tqdm(as_completed(future_to_content), total=len(contents), desc=f"IE过滤中【{key}】"):
                 content, res = future.result()
@@ -332,18 +431,27 @@ class Field(ABC):
             
         keys = [self.name] + self.alias
         cutoff_tool = DwgImageCatOffPipeLine(dwg_context)
-        cut_result = cutoff_tool.invoke(keys=keys, p_height=p_height, p_width=p_width, scale=scale)
+        # 裁剪图片只在内存中流转，识别出内容、需要作为参考依据时才落盘；
+        # 相邻的裁剪框合并为一个区域，各关键词共享同一张图片，每张图片只识别一次
+        if OCR_MERGE_REGIONS:
+            cut_result = cutoff_tool.invoke_merged(keys=keys, p_height=p_height, p_width=p_width, scale=scale)
+        else:
+            cut_result = cutoff_tool.invoke_in_memory(keys=keys, p_height=p_height, p_width=p_width, scale=scale)
         
         ocr_images = []
         ocr_contents = []
         count = 0
+        recognized = set()
         
         for key in cut_result:
-            for image_path in tqdm.tqdm(cut_result[key], desc=f'当前OCR识别字段【{key}】'):
+            for crop in tqdm.tqdm(cut_result[key], desc=f'当前OCR识别字段【{key}】'):
+                if id(crop) in recognized:
+                    continue
+                recognized.add(id(crop))
                 count += 1
-                content = image_to_text(image_path)
+                content = image_to_text(crop.image)
                 if content:
-                    ocr_images.append(image_path)
+                    ocr_images.append(crop.persist())
                     ocr_contents.append(content)
                 # res:OCRResponseModel=api_caller.call("ocr",{"file_path":image_path})
                 # if res.data and res.data.text:
@@ -371,6 +479,25 @@ class Field(ABC):
         else:
             self.candidates=[]
         return self.candidates
+    
+    def request_candidates(self,context:ProjectContext,prompt:str,prompt_params:Dict[str,Any],prefix:List[str]=None,on_result=None)->List[str]:
+        """
+        生成候选答案
+        
+        上下文开启批量生成（context.candidates_batch）时只登记请求并先返回 prefix，
+        全部字段解析完成后批量生成，结果通过回调写回（默认写入 self.candidates）；
+        否则直接请求模型
+        """
+        prefix=list(prefix or [])
+        batch=getattr(context,"candidates_batch",None)
+        if batch is None:
+            candidates=CandidatesGenerationPipeLine(prompt=prompt,prompt_params=prompt_params).invoke() or []
+            return prefix+candidates
+        if on_result is None:
+            def on_result(candidates):
+                self.candidates=candidates
+        batch.add(prompt,prompt_params,lambda candidates:on_result(prefix+candidates))
+        return prefix
                 
 
         
@@ -444,12 +571,7 @@ class BaseCategorizedField(Field):
         for scope in self.context_scope:
             contexts:List[BaseFileContext]=context.get_contents_by_scope(scope)
             for file_context in contexts:
-                if file_context.paragraphs and len(file_context.paragraphs)>0:
-                    for paragraph in file_context.paragraphs:
-                        for paragraph_key in self.paragraph_keys:
-                            if paragraph_key in paragraph['title']:
-                                matched_paragraphs.append(paragraph['content'])
-                                break
+                matched_paragraphs.extend(file_context.match_paragraphs(self.paragraph_keys))
         # 首先直接根据分类列表在原文本中进行匹配
         if matched_paragraphs and len(matched_paragraphs)>0:
             for matched_paragraph in matched_paragraphs:
@@ -469,12 +591,7 @@ class BaseCategorizedField(Field):
                 contexts:List[BaseFileContext]=context.get_contents_by_scope(scope)
                 contents=[]
                 for file_context in contexts:
-                    text_content_list=file_context.text_content_list
-                    table_content_list=[]
-                    if isinstance(file_context,DwgFileContext):
-                        table_content_list=file_context.table_content_list
-                    contents.extend(table_content_list)
-                    contents.extend(text_content_list)
+                    contents.extend(context.lookup_contents(file_context,classifications))
                 for classification in classifications:
                     for content in contents:
                         count=content.count(classification)
@@ -555,9 +672,7 @@ class BaseCategorizedField(Field):
 </output>
 输出用<output></output>标签包裹，不要输出其他内容，不要输出任何解释。
         """.strip()
-        pipeline=CandidatesGenerationPipeLine(prompt=prompt,prompt_params=prompt_params)
-        candidates=pipeline.invoke()
-        return candidates
+        return self.request_candidates(context,prompt,prompt_params)
     
 
 
@@ -606,20 +721,14 @@ class BaseValueField(Field):
                 continue
             contents=[]
             for file_context in contexts:
-                text_content_list=file_context.text_content_list
-                table_content_list=[]
-                if isinstance(file_context,DwgFileContext):
-                    table_content_list=file_context.table_content_list
-                contents.extend(table_content_list)
-                contents.extend(text_content_list)
+                contents.extend(context.lookup_contents(file_context,keys))
                 if isinstance(file_context,DwgFileContext):
                     if file_context.text_list:
                         ocr_images,ocr_contents=self.ocr_check(file_context,p_width=self.p_width,p_height=self.p_height)
                         contents.extend(ocr_contents)
             for content in contents:
-                for key in keys:
-                    str_list=self.extract_surrounding_text(content,key,50,50)
-                    matched_str_list.extend(str_list)
+                str_list=self.extract_surrounding_text_multi(content,keys,50,50)
+                matched_str_list.extend(str_list)
         matched_str_list,ie_results=self.ie_filter(matched_str_list)
         content="\n".join(matched_str_list)
         if not content.strip():
@@ -638,7 +747,7 @@ class BaseValueField(Field):
         if not self.value:
             return None
         if self.return_type=="number":
-            self.value=''.join(re.findall(r'\d+', self.value))
+            self.value=''.join(DIGITS_PATTERN.findall(self.value))
         elif self.return_type=="str" and isinstance(self.value,str):
             self.value=self.value.split("，")[0]
             self.value=self.value.split(",")[0]
@@ -687,15 +796,13 @@ class DegreeCountField(BaseValueField):
 </output>
 输出用<output></output>标签包裹，不要输出其他内容，不要输出任何解释。
         """.strip()
-        candidates_generation_pipe=CandidatesGenerationPipeLine(prompt=prompt,prompt_params=prompt_params)
-        candidates=candidates_generation_pipe.invoke()
-        return candidates
+        return self.request_candidates(context,prompt,prompt_params)
 
     def _post_process(self):
         if not self.value:
             return self.default_value
         if isinstance(self.value,str):
-            self.value=''.join(re.findall(r'\d+', self.value))
+            self.value=''.join(DIGITS_PATTERN.findall(self.value))
             if not self.value.strip():
                 return self.default_value
         self.value=int(self.value)
@@ -707,7 +814,7 @@ class TotalHouseholdsField(BaseValueField):
         if not self.value:
             return self.default_value
         if isinstance(self.value,str):
-            self.value=''.join(re.findall(r'\d+', self.value))
+            self.value=''.join(DIGITS_PATTERN.findall(self.value))
             if not self.value.strip():
                 return self.default_value
         self.value=int(self.value)
@@ -745,16 +852,14 @@ class TotalHouseholdsField(BaseValueField):
 </output>
 输出用<output></output>标签包裹，不要输出其他内容，不要输出任何解释。
         """.strip()
-        candidates_generation_pipe=CandidatesGenerationPipeLine(prompt=prompt,prompt_params=prompt_params)  
-        candidates=candidates_generation_pipe.invoke()
-        return candidates
+        return self.request_candidates(context,prompt,prompt_params)
 class BedCountField(BaseValueField):
     """床位数字段"""
     def _post_process(self):
         if not self.value:
             return self.default_value
         if isinstance(self.value,str):
-            self.value=''.join(re.findall(r'\d+', self.value))
+            self.value=''.join(DIGITS_PATTERN.findall(self.value))
             if not self.value.strip():
                 return self.default_value
         self.value=int(self.value)
@@ -792,9 +897,7 @@ class BedCountField(BaseValueField):
 </output>
 输出用<output></output>标签包裹，不要输出其他内容，不要输出任何解释。
         """.strip()
-        candidates_generation_pipe=CandidatesGenerationPipeLine(prompt=prompt,prompt_params=prompt_params)
-        candidates=candidates_generation_pipe.invoke()
-        return candidates
+        return self.request_candidates(context,prompt,prompt_params)
 
 # =============================================================================
 # 段落匹配字段类
@@ -838,12 +941,7 @@ class ParagraphMatchField(BaseValueField):
         for scope in self.context_scope:
             contexts:List[BaseFileContext]=context.get_contents_by_scope(scope)
             for file_context in contexts:
-                if file_context.paragraphs and len(file_context.paragraphs)>0:
-                    for paragraph in file_context.paragraphs:
-                        for paragraph_key in self.paragraph_keys:
-                            if paragraph_key in paragraph['title']:
-                                matched_paragraphs.append(paragraph['content'])
-                                break
+                matched_paragraphs.extend(file_context.match_paragraphs(self.paragraph_keys))
         matched_str_list=matched_paragraphs
         for scope in self.context_scope:
             contexts:List[BaseFileContext]=context.get_contents_by_scope(scope)
@@ -851,20 +949,14 @@ class ParagraphMatchField(BaseValueField):
                 continue
             contents=[]
             for file_context in contexts:
-                text_content_list=file_context.text_content_list
-                table_content_list=[]
-                if isinstance(file_context,DwgFileContext):
-                    table_content_list=file_context.table_content_list
-                contents.extend(table_content_list)
-                contents.extend(text_content_list)
+                contents.extend(context.lookup_contents(file_context,keys))
                 if isinstance(file_context,DwgFileContext):
                     if file_context.text_list:
                         ocr_images,ocr_contents=self.ocr_check(file_context,p_width=self.p_width,p_height=self.p_height)
                         contents.extend(ocr_contents)
             for content in contents:
-                for key in keys:
-                    str_list=self.extract_surrounding_text(content,key,50,50)
-                    matched_str_list.extend(str_list)
+                str_list=self.extract_surrounding_text_multi(content,keys,50,50)
+                matched_str_list.extend(str_list)
         matched_str_list,ie_results=self.ie_filter(matched_str_list)
         content="\n".join(matched_str_list)
         if not content.strip():
@@ -898,6 +990,10 @@ class BaseDependentsField(ParagraphMatchField):
         self.project_fields = project_fields
         self.ref_value = None
         
+    def _reset_run_state(self):
+        super()._reset_run_state()
+        self.ref_value = None
+        
     # =============================================================================
     # 计算工具方法
     # =============================================================================
@@ -941,12 +1037,7 @@ class BaseDependentsField(ParagraphMatchField):
         for scope in self.context_scope:
             contexts:List[BaseFileContext]=context.get_contents_by_scope(scope)
             for file_context in contexts:
-                if file_context.paragraphs and len(file_context.paragraphs)>0:
-                    for paragraph in file_context.paragraphs:
-                        for paragraph_key in self.paragraph_keys:
-                            if paragraph_key in paragraph['title']:
-                                matched_paragraphs.append(paragraph['content'])
-                                break
+                matched_paragraphs.extend(file_context.match_paragraphs(self.paragraph_keys))
         matched_str_list=matched_paragraphs
         for matched_paragraph in matched_paragraphs:
             self.ref_data.texts.append(ContentItem(content=matched_paragraph))
@@ -1024,9 +1115,7 @@ class ProjectNameField(ParagraphMatchField):
 </output>
 输出用<output></output>标签包裹，不要输出其他内容，不要输出任何解释。
         """.strip()
-        candidates_generation_pipe=CandidatesGenerationPipeLine(prompt=prompt,prompt_params=prompt_params)
-        candidates=candidates_generation_pipe.invoke()
-        return candidates
+        return self.request_candidates(context,prompt,prompt_params)
 
 # 项目地址
 
@@ -1048,13 +1137,13 @@ class TotalBuildingAreaField(BaseDependentsField):
     
     def _post_process(self):
         if self.ref_value and isinstance(self.ref_value,str):
-            match = re.search(r'-?\d+\.?\d*', self.ref_value)
+            match = NUMBER_PATTERN.search(self.ref_value)
             if match:
                 self.ref_value=match.group()
             else:
                 self.ref_value=None
         if isinstance(self.value,str):
-            match = re.search(r'-?\d+\.?\d*', self.value)
+            match = NUMBER_PATTERN.search(self.value)
             if match:
                 self.value=match.group()
             else:
@@ -1102,9 +1191,7 @@ class TotalBuildingAreaField(BaseDependentsField):
 </output>
 输出用<output></output>标签包裹，不要输出其他内容，不要输出任何解释。
         """.strip()
-        candidates_generation_pipe=CandidatesGenerationPipeLine(prompt=prompt,prompt_params=prompt_params)
-        candidates=candidates_generation_pipe.invoke()
-        return candidates
+        return self.request_candidates(context,prompt,prompt_params)
 
 class AboveGroundBuildingAreaField(BaseDependentsField):
     """地上建筑面积字段"""
@@ -1122,13 +1209,13 @@ class AboveGroundBuildingAreaField(BaseDependentsField):
 
     def _post_process(self):
         if self.ref_value and isinstance(self.ref_value,str):
-            match = re.search(r'-?\d+\.?\d*', self.ref_value)
+            match = NUMBER_PATTERN.search(self.ref_value)
             if match:
                 self.ref_value=match.group()
             else:
                 self.ref_value=None
         if isinstance(self.value,str):
-            match = re.search(r'-?\d+\.?\d*', self.value)
+            match = NUMBER_PATTERN.search(self.value)
             if match:
                 self.value=match.group()
             else:
@@ -1176,10 +1263,7 @@ class AboveGroundBuildingAreaField(BaseDependentsField):
 </output>
 输出用<output></output>标签包裹，不要输出其他内容，不要输出任何解释。   
         """.strip()
-        candidates_generation_pipe=CandidatesGenerationPipeLine(prompt=prompt,prompt_params=prompt_params)
-        candidates=candidates_generation_pipe.invoke()
-        candidates=self.candidates+candidates
-        return candidates
+        return self.request_candidates(context,prompt,prompt_params,prefix=self.candidates)
 
 class UndergroundBuildingAreaField(BaseDependentsField):
     """地下建筑面积字段"""
@@ -1198,13 +1282,13 @@ class UndergroundBuildingAreaField(BaseDependentsField):
             return None
     def _post_process(self):
         if self.ref_value and isinstance(self.ref_value,str):
-            match = re.search(r'-?\d+\.?\d*', self.ref_value)
+            match = NUMBER_PATTERN.search(self.ref_value)
             if match:
                 self.ref_value=match.group()
             else:
                 self.ref_value=None
         if isinstance(self.value,str):
-            match = re.search(r'-?\d+\.?\d*', self.value)
+            match = NUMBER_PATTERN.search(self.value)
             if match:
                 self.value=match.group()
             else:
@@ -1254,10 +1338,7 @@ class UndergroundBuildingAreaField(BaseDependentsField):
 </output>
 输出用<output></output>标签包裹，不要输出其他内容，不要输出任何解释。   
         """.strip()
-        candidates_generation_pipe=CandidatesGenerationPipeLine(prompt=prompt,prompt_params=prompt_params)
-        candidates=candidates_generation_pipe.invoke()
-        candidates=self.candidates+candidates
-        return candidates
+        return self.request_candidates(context,prompt,prompt_params,prefix=self.candidates)
 
 # =============================================================================
 # 计算字段
@@ -1294,7 +1375,7 @@ class LandscapeAreaField(BaseDependentsField):
             return self.default_value
         
         if isinstance(self.value,str):
-            match = re.search(r'-?\d+\.?\d*', self.value)
+            match = NUMBER_PATTERN.search(self.value)
             if match:
                 self.value=match.group()
             else:
@@ -1307,7 +1388,7 @@ class GreeningRateField(BaseDependentsField):
         if not self.value:
             return self.default_value
         if isinstance(self.value,str):
-            match = re.search(r'-?\d+\.?\d*', self.value)
+            match = NUMBER_PATTERN.search(self.value)
             if match:
                 self.value=match.group()
             else:
@@ -1377,7 +1458,7 @@ class ConstructionPeriodField(BaseDependentsField):
         if not self.value:
             return self.default_value
         if isinstance(self.value,str):
-            self.value=''.join(re.findall(r'\d+', self.value))
+            self.value=''.join(DIGITS_PATTERN.findall(self.value))
             if not self.value.strip():
                 return self.default_value
         self.value=int(self.value)
@@ -1467,9 +1548,7 @@ class AddressValueField(ParagraphMatchField):
 </output>
 输出用<output></output>标签包裹，不要输出其他内容，不要输出任何解释。
         """.strip()
-        candidates_generation_pipe=CandidatesGenerationPipeLine(prompt=prompt,prompt_params=prompt_params)
-        candidates=candidates_generation_pipe.invoke()
-        return candidates
+        return self.request_candidates(context,prompt,prompt_params)
 
 
 
@@ -1493,7 +1572,7 @@ class SingleAreaValueField(ParagraphMatchField):
     """单一面积值字段"""
     
     def _post_process(self):
-        match = re.search(r'-?\d+\.?\d*', self.value)
+        match = NUMBER_PATTERN.search(self.value)
         if match:
             self.value = match.group()
         else:
@@ -1506,7 +1585,7 @@ class RoomCountField(SingleAreaValueField):
         if not self.value:
             return self.default_value
         if isinstance(self.value,str):
-            self.value=''.join(re.findall(r'\d+', self.value))
+            self.value=''.join(DIGITS_PATTERN.findall(self.value))
             if not self.value.strip():
                 return self.default_value
         self.value=int(self.value)
@@ -1544,9 +1623,7 @@ class RoomCountField(SingleAreaValueField):
 </output>
 输出用<output></output>标签包裹，不要输出其他内容，不要输出任何解释。
         """.strip()
-        candidates_generation_pipe=CandidatesGenerationPipeLine(prompt=prompt,prompt_params=prompt_params)
-        candidates=candidates_generation_pipe.invoke()
-        return candidates
+        return self.request_candidates(context,prompt,prompt_params)
 
 
 # 建筑物基底面积
@@ -1557,7 +1634,7 @@ class BuildingBaseAreaField(SingleAreaValueField):
             return self.default_value
         
         if isinstance(self.value,str):
-            match = re.search(r'-?\d+\.?\d*', self.value)
+            match = NUMBER_PATTERN.search(self.value)
             if match:
                 self.value=match.group()
             else:
@@ -1598,9 +1675,7 @@ class BuildingBaseAreaField(SingleAreaValueField):
 </output>
 输出用<output></output>标签包裹，不要输出其他内容，不要输出任何解释。
         """.strip()
-        candidates_generation_pipe=CandidatesGenerationPipeLine(prompt=prompt,prompt_params=prompt_params)
-        candidates=candidates_generation_pipe.invoke()
-        return candidates
+        return self.request_candidates(context,prompt,prompt_params)
 
 
 class LandAreaField(SingleAreaValueField):
@@ -1617,12 +1692,7 @@ class LandAreaField(SingleAreaValueField):
         for scope in self.context_scope:
             contexts:List[BaseFileContext]=context.get_contents_by_scope(scope)
             for file_context in contexts:
-                if file_context.paragraphs and len(file_context.paragraphs)>0:
-                    for paragraph in file_context.paragraphs:
-                        for paragraph_key in self.paragraph_keys:
-                            if paragraph_key in paragraph['title']:
-                                matched_paragraphs.append(paragraph['content'])
-                                break
+                matched_paragraphs.extend(file_context.match_paragraphs(self.paragraph_keys))
         
         matched_str_list=[]+matched_paragraphs
         
@@ -1646,20 +1716,14 @@ class LandAreaField(SingleAreaValueField):
                 continue
             contents=[]
             for file_context in contexts:
-                text_content_list=file_context.text_content_list
-                table_content_list=[]
-                if isinstance(file_context,DwgFileContext):
-                    table_content_list=file_context.table_content_list
-                contents.extend(table_content_list)
-                contents.extend(text_content_list)
+                contents.extend(context.lookup_contents(file_context,keys))
                 if isinstance(file_context,DwgFileContext):
                     if file_context.text_list:
                         ocr_images,ocr_contents=self.ocr_check(file_context,p_width=self.p_width,p_height=self.p_height)
                         contents.extend(ocr_contents)
             for content in contents:
-                for key in keys:
-                    str_list=self.extract_surrounding_text(content,key,50,50)
-                    matched_str_list.extend(str_list)
+                str_list=self.extract_surrounding_text_multi(content,keys,50,50)
+                matched_str_list.extend(str_list)
         matched_str_list,ie_results=self.ie_filter(matched_str_list)
         content="\n".join(matched_str_list)
         if not content.strip():
@@ -1684,7 +1748,7 @@ class LandAreaField(SingleAreaValueField):
     
     def _post_process(self):
         if isinstance(self.value,str):
-            match = re.search(r'-?\d+\.?\d*', self.value)
+            match = NUMBER_PATTERN.search(self.value)
             if match:
                 self.value = match.group()
             else:
@@ -1729,9 +1793,7 @@ class LandAreaField(SingleAreaValueField):
 </output>
 输出用<output></output>标签包裹，不要输出其他内容，不要输出任何解释。
          """.strip()
-         candidates_generation_pipe=CandidatesGenerationPipeLine(prompt=prompt,prompt_params=prompt_params)
-         candidates=candidates_generation_pipe.invoke()
-         return candidates
+         return self.request_candidates(context,prompt,prompt_params)
 # =============================================================================
 # 设备数量字段
 # =============================================================================
@@ -1741,7 +1803,7 @@ class PlotRatioField(SingleAreaValueField):
         if self.value is None:
             self.value=self.default_value
         else:
-            match = re.search(r'-?\d+\.?\d*', self.value)
+            match = NUMBER_PATTERN.search(self.value)
             if match:
                 self.value = match.group()
             else:
@@ -1784,9 +1846,7 @@ class PlotRatioField(SingleAreaValueField):
 </output>
 输出用<output></output>标签包裹，不要输出其他内容，不要输出任何解释。
         """.strip()
-        candidates_generation_pipe=CandidatesGenerationPipeLine(prompt=prompt,prompt_params=prompt_params)
-        candidates=candidates_generation_pipe.invoke()
-        return candidates
+        return self.request_candidates(context,prompt,prompt_params)
 
 class ChargerNumberField(SingleAreaValueField):
     """充电桩数量字段"""
@@ -1795,7 +1855,7 @@ class ChargerNumberField(SingleAreaValueField):
         if not self.value:
             return self.default_value
         if isinstance(self.value,str):
-            self.value=''.join(re.findall(r'\d+', self.value))
+            self.value=''.join(DIGITS_PATTERN.findall(self.value))
             if not self.value.strip():
                 return self.default_value
         self.value=int(self.value)
@@ -1834,12 +1894,7 @@ class ChargerNumberField(SingleAreaValueField):
         for scope in self.context_scope:
             contexts:List[BaseFileContext]=context.get_contents_by_scope(scope)
             for file_context in contexts:
-                if file_context.paragraphs and len(file_context.paragraphs)>0:
-                    for paragraph in file_context.paragraphs:
-                        for paragraph_key in self.paragraph_keys:
-                            if paragraph_key in paragraph['title']:
-                                matched_paragraphs.append(paragraph['content'])
-                                break
+                matched_paragraphs.extend(file_context.match_paragraphs(self.paragraph_keys))
         matched_str_list=[]+matched_paragraphs
         for scope in self.context_scope:
             contexts:List[BaseFileContext]=context.get_contents_by_scope(scope)
@@ -1847,12 +1902,7 @@ class ChargerNumberField(SingleAreaValueField):
                 continue
             contents=[]
             for file_context in contexts:
-                text_content_list=file_context.text_content_list
-                table_content_list=[]
-                if isinstance(file_context,DwgFileContext):
-                    table_content_list=file_context.table_content_list
-                contents.extend(table_content_list)
-                contents.extend(text_content_list)
+                contents.extend(context.lookup_contents(file_context,keys))
                 if isinstance(file_context,DwgFileContext):
                     if file_context.text_list:
                         ocr_images,ocr_contents=self.ocr_check(file_context,p_width=self.p_width,p_height=self.p_height)
@@ -1861,9 +1911,8 @@ class ChargerNumberField(SingleAreaValueField):
                         car_ref_contents=self.find_car_ref_contents(file_context.text_list,keys)
                         contents.extend(car_ref_contents)
             for content in contents:
-                for key in keys:
-                    str_list=self.extract_surrounding_text(content,key,50,50)
-                    matched_str_list.extend(str_list)
+                str_list=self.extract_surrounding_text_multi(content,keys,50,50)
+                matched_str_list.extend(str_list)
         matched_str_list,ie_results=self.ie_filter(matched_str_list)
         content="\n".join(matched_str_list)
         if not content.strip():
@@ -1894,7 +1943,7 @@ class ParkingSpaceNumberField(ChargerNumberField):
         if not self.value:
             return self.default_value
         if isinstance(self.value,str):
-            self.value=''.join(re.findall(r'\d+', self.value))
+            self.value=''.join(DIGITS_PATTERN.findall(self.value))
             if not self.value.strip():
                 return self.default_value
         self.value=int(self.value)
@@ -1907,6 +1956,9 @@ class ParkingSpaceNumberField(ChargerNumberField):
 class BaseBusinessModelField(Field):
     """业态字段基类"""
     
+    # 业态并发抽取的最大线程数，子类可按需调整（如依赖外部服务限流时设为 1）
+    max_workers: int = BUSINESS_MODEL_MAX_WORKERS
+    
     def __init__(self, name, alias=[], dependencies=[], project_fields: Dict[str, Field] = {}, 
                  default_value=None, context_scope=[], is_hidden=False, is_use_ocr=False, 
                  is_use_ie=False, agent_model_name="gpt-4o-mini",field_id=None,**kwargs):
@@ -1932,6 +1984,28 @@ class BaseBusinessModelField(Field):
     def _extract_field_business_model(self,context:ProjectContext,business_model_item:BusinessModelItem)->Tuple[Any,ReferenceData]:
         raise NotImplementedError("请实现`_extract_field_business_model`方法")
     
+    def _extract_business_models(self, context:ProjectContext)->List[Tuple[str,Any,ReferenceData]]:
+        """
+        抽取全部业态，返回 [(业态名称, 值, 参考数据)]
+        max_workers>1 时各业态并发抽取，结果仍按 model_names 顺序返回，保证合并结果确定
+        """
+        business_model=context.business_model
+        model_names=business_model.model_names
+        max_workers=min(self.max_workers,len(model_names))
+        if max_workers<=1:
+            results=[
+                self._extract_field_business_model(context,business_model.models[business_model_name])
+                for business_model_name in model_names
+            ]
+        else:
+            with ContextThreadPoolExecutor(max_workers=max_workers) as pool:
+                futures=[
+                    pool.submit(self._extract_field_business_model,context,business_model.models[business_model_name])
+                    for business_model_name in model_names
+                ]
+                results=[future.result() for future in futures]
+        return [(business_model_name,item_value,ref_data) for business_model_name,(item_value,ref_data) in zip(model_names,results)]
+    
     def _extract_field_value(self, context:ProjectContext)->Dict[str,Any]:
         value:Dict[str,Dict[str,Any]]={}
         # 获取当前字段对应的业态信息    
@@ -1941,16 +2015,14 @@ class BaseBusinessModelField(Field):
         
         if not business_model.model_names:
             return value
-        for business_model_name in business_model.model_names:
-            business_model_item=business_model.models[business_model_name]
-            item_value,ref_data=self._extract_field_business_model(context,business_model_item)
+        for business_model_name,item_value,ref_data in self._extract_business_models(context):
             value[business_model_name] = {
                 "value":item_value,
                 "ref_data":ref_data
             }
         return value
     
-    def parse(self, context, **kwargs):
+    def _parse(self, context, **kwargs):
         if kwargs.get("pd"):
             kwargs["pd"].update(1)
             kwargs["pd"].desc = f"正在抽取【{self.name}】"
@@ -2011,6 +2083,14 @@ class BuildingAreaForBusinessModelField(BaseBusinessModelField):
     )
     '''
     
+    patterns = {
+        "level": (pattern, re.VERBOSE),
+        "underground": (r"地.*?[:：]\s*([0-9]+(?:\.[0-9]+)?)\s*平方米", 0),
+        "underground_level": (r"地(上|下)([一二三四五六七八九十]+)层.*?[:：].*?平方米", 0),
+        "floor_number": (r'(\d+).*', 0),
+        "underground_floor_number": (r'(-\d+).*', 0),
+    }
+    
     def _extract_field_business_model(self,context:ProjectContext,business_model_item:BusinessModelItem)->Tuple[Any,ReferenceData]:
         ref_data=None
         if business_model_item.structure:
@@ -2165,7 +2245,7 @@ class BuildingAreaForBusinessModelField(BaseBusinessModelField):
         if not is_underground:
             # 先获取所有楼层面积
             # 正则匹配前缀带有数字
-            pattern=re.compile(r'(\d+).*')
+            pattern=self.compiled_patterns["floor_number"]
             floor_number_list=[]
             new_floor_number_list=[]
             for key,v in value.items():
@@ -2176,7 +2256,7 @@ class BuildingAreaForBusinessModelField(BaseBusinessModelField):
             if len(floor_number_list)<=0:
                 return []
         else:
-            pattern=re.compile(r'(-\d+).*')
+            pattern=self.compiled_patterns["underground_floor_number"]
             for key,v in value.items():
                 match=pattern.search(key)
                 if match:
@@ -2202,8 +2282,7 @@ class BuildingAreaForBusinessModelField(BaseBusinessModelField):
         text=text.replace(" ", "")
         text=text.split("-")[-1]
         result=[]
-        pattern = re.compile(self.pattern, re.VERBOSE)
-        for m in re.finditer(pattern, text):
+        for m in self.compiled_patterns["level"].finditer(text):
             raw_level=m.group('level')
             roof_name=m.group('roof')
             levels=[]
@@ -2267,7 +2346,7 @@ class BuildingAreaForBusinessModelField(BaseBusinessModelField):
         return False
         
     def _area_filter(self,text_list:List[QueryItem],context)->List[str]:
-        underground_pattern = r"地.*?[:：]\s*([0-9]+(?:\.[0-9]+)?)\s*平方米"
+        underground_pattern = self.compiled_patterns["underground"]
         # 先查找符合过滤条件的文本
         in_condition_text_list:List[QueryItem]=[]
         for text_item in text_list:  
@@ -2279,12 +2358,17 @@ class BuildingAreaForBusinessModelField(BaseBusinessModelField):
         if not in_condition_text_list or len(in_condition_text_list)<=0:
             for text_item in text_list:    
                 if text_item.text:
-                    if re.search(underground_pattern,text_item.text):
+                    if underground_pattern.search(text_item.text):
                         is_special_underground=True
                         in_condition_text_list.append(text_item)       
         if is_special_underground:
             return [text_item.text for text_item in in_condition_text_list],is_special_underground
-        # 查找其下方的建筑面积
+        # 查找其下方的建筑面积（bounds 与中心点按文件上下文只计算一次）
+        if isinstance(context,DwgFileContext) and text_list is context.text_list:
+            text_collection=context.get_text_collection()
+        else:
+            text_collection=QueryItemCollection(text_list)
+        centers=text_collection.centers.tolist()
         area_text_list:List[Tuple[QueryItem,QueryItem,QueryItem]]=[]
         for condition_text in in_condition_text_list:
             font_height=abs(condition_text.bounds.maxy-condition_text.bounds.miny)
@@ -2292,14 +2376,14 @@ class BuildingAreaForBusinessModelField(BaseBusinessModelField):
             condition_bounds=condition_text.bounds
             # 查找符合条件的文本
             candidate_text_list=[]
-            for text_item in text_list:
+            for idx,text_item in enumerate(text_list):
                 if not text_item.text:
                     continue
-                if self.is_area_text(text_item.text) or ("地" in condition_text.text and re.search(underground_pattern,text_item.text)):
-                    text_center_point=text_item.bounds.center_point()
+                if self.is_area_text(text_item.text) or ("地" in condition_text.text and underground_pattern.search(text_item.text)):
+                    center_x,center_y=centers[idx]
                     # 单位归一化，以字高为y的单位长度，以condition_text宽为x的单位长度
-                    if (abs(text_center_point.y-condition_bounds.miny)/font_height<=20):
-                        if abs(text_center_point.x-condition_bounds.minx)/font_width>5:
+                    if (abs(center_y-condition_bounds.miny)/font_height<=20):
+                        if abs(center_x-condition_bounds.minx)/font_width>5:
                             continue
                         candidate_text_list.append(text_item)
             candidate_text_list.sort(key=lambda p: p.bounds.miny,reverse=True)
@@ -2307,11 +2391,11 @@ class BuildingAreaForBusinessModelField(BaseBusinessModelField):
             if candidate_text:
                 # 获取面积
                 values:List[QueryItem]=[]
-                for text_item in text_list:
-                    text_center_point=text_item.bounds.center_point()
-                    if (text_center_point.y>candidate_text.bounds.miny
-                        and text_center_point.y<candidate_text.bounds.maxy
-                        and text_center_point.x > candidate_text.bounds.maxx):
+                for idx,text_item in enumerate(text_list):
+                    center_x,center_y=centers[idx]
+                    if (center_y>candidate_text.bounds.miny
+                        and center_y<candidate_text.bounds.maxy
+                        and center_x > candidate_text.bounds.maxx):
                         if text_item.text==":":
                             continue
                         values.append(text_item)
@@ -2321,7 +2405,7 @@ class BuildingAreaForBusinessModelField(BaseBusinessModelField):
                     area_text_list.append((condition_text,candidate_text,value))
                 else:
                     area_text_list.append((condition_text,candidate_text,None))
-                if re.search(underground_pattern,candidate_text.text):
+                if underground_pattern.search(candidate_text.text):
                     area_text_list.append((condition_text,candidate_text,None))
             else: # TODO 针对c002项目进行设计
                 ## 寻找'建筑面积'字样
@@ -2335,13 +2419,13 @@ class BuildingAreaForBusinessModelField(BaseBusinessModelField):
                         floor_area_item=item
                         break
                 if floor_area_item: # 找下方的面积字段
-                    for area_text in text_list:
-                        area_text_center_point=area_text.bounds.center_point()
+                    for idx,area_text in enumerate(text_list):
+                        center_x,_=centers[idx]
                         if (
                             abs(area_text.bounds.maxy-floor_area_item.bounds.miny)<5000 and
                             area_text.bounds.maxy<floor_area_item.bounds.miny and
-                            area_text_center_point.x>=floor_area_item.bounds.minx and 
-                            area_text_center_point.x<=floor_area_item.bounds.maxx and
+                            center_x>=floor_area_item.bounds.minx and 
+                            center_x<=floor_area_item.bounds.maxx and
                             len(area_text.text)>2 and
                             is_number(area_text.text.strip())
                         ):
@@ -2359,12 +2443,13 @@ class BuildingAreaForBusinessModelField(BaseBusinessModelField):
         # text_content=context.text_content_list
         # 预处理text_content.text_list
         pre_processed_text_list=self._pre_process_text_list(context.text_list)
+        # 预处理会原地合并、删除 context.text_list 中的文本，列式集合需要重建
+        context.invalidate_text_collection()
         text_contents,is_special_underground=self._area_filter(pre_processed_text_list,context=context)
         is_record=False
         for content in text_contents:
             if is_special_underground:
-                pattern = r"地(上|下)([一二三四五六七八九十]+)层.*?[:：].*?平方米"
-                matches = re.finditer(pattern, content)
+                matches = self.compiled_patterns["underground_level"].finditer(content)
                 for match in matches:
                     position = match.group(1)  # "上" 或 "下"
                     floor = match.group(2)     # 中文数字（如 "三"、"二"）
@@ -2386,9 +2471,12 @@ class BuildingAreaForBusinessModelField(BaseBusinessModelField):
             
         return is_record
 
-    def build_children_context(self,mapid,fileid):
-        pipeline=DwgTextParseByMapIdAndFileIdPipeLine(mapid=mapid,fileid=fileid,uploadname=fileid)
-        return pipeline.invoke()
+    def get_layout_cache(self,project_context:ProjectContext)->ChildLayoutCache:
+        """获取任务内共享的子布局缓存（未初始化时临时创建，仍可复用磁盘缓存）"""
+        layout_cache=getattr(project_context,"layout_cache",None)
+        if layout_cache is None:
+            layout_cache=ChildLayoutCache()
+        return layout_cache
 
     def _extract_field_business_model(self, project_context, business_model_item:BusinessModelItem):
         building_contexts=business_model_item.building
@@ -2396,25 +2484,22 @@ class BuildingAreaForBusinessModelField(BaseBusinessModelField):
             return None,None
         # 从building中抽取建筑面积信息
         area_content_map={}
+        layout_cache=self.get_layout_cache(project_context)
         for context in building_contexts:
             if not isinstance(context,DwgFileContext):
                 continue
             is_record=self._record_floor_area(context,area_content_map)
             if is_record:
                 continue
-            # 获取当前context对应的布局数
+            # 获取当前context对应的布局数（布局导出与子图解析结果按 (fileid,布局序号) 缓存）
             mapid=context.mapid
             fileid=context.fileid
             uploadname=context.uploadname
-            exportLayoutService=ExportLayoutService()
-            layout_number=exportLayoutService.get_current_map_layout_number(mapid,fileid,uploadname)
+            layout_number=layout_cache.get_layout_number(mapid,fileid,uploadname)
             if layout_number>0:
                 for layoutIndex in range(1,layout_number+1):
-                    children_layout=exportLayoutService.get_children_layout(mapid,fileid,uploadname,layoutIndex)
-                    children_mapid=children_layout["mapid"]
-                    children_fileid=children_layout["fileid"]
-                    if children_mapid and children_fileid:
-                        children_context=self.build_children_context(children_mapid,children_fileid)
+                    children_context=layout_cache.get_children_context(mapid,fileid,uploadname,layoutIndex)
+                    if children_context:
                         is_record=self._record_floor_area(children_context,area_content_map)
                         if is_record:
                             break
@@ -2449,7 +2534,7 @@ class BuildingAreaForBusinessModelField(BaseBusinessModelField):
     def _str_to_number(self,value):
         if isinstance(value,(int,float)):
             return value
-        match = re.search(r'-?\d+\.?\d*', value)
+        match = NUMBER_PATTERN.search(value)
         if match:
             return float(match.group())
         else:
@@ -2467,23 +2552,24 @@ class BuildingAreaForBusinessModelField(BaseBusinessModelField):
         
         
         
-        for business_model_name in business_model.model_names:
-            business_model_item=business_model.models[business_model_name]
-            item_value,ref_data=self._extract_field_business_model(context,business_model_item)
+        for business_model_name,item_value,ref_data in self._extract_business_models(context):
             value[business_model_name] = {
                 "value":item_value,
                 "ref_data":ref_data
             }
             if self.is_general_candidates:
-                candidates=self.do_general_candidates(item_value,ref_data)
-                value[business_model_name]["candidates"]=candidates
+                entry=value[business_model_name]
+                entry["candidates"]=self.do_general_candidates(
+                    item_value,ref_data,context=context,
+                    on_result=lambda candidates,entry=entry:entry.__setitem__("candidates",candidates)
+                )
             else:
                 value[business_model_name]["candidates"]=[]
         return value
     
     def _general_candidates(self,context:ProjectContext):
         return []
-    def do_general_candidates(self, value,ref_data):
+    def do_general_candidates(self, value,ref_data,context:ProjectContext=None,on_result=None):
          if not value or not ref_data:
              return []
          content="\n".join([text.content for text in ref_data.texts])
@@ -2518,9 +2604,7 @@ class BuildingAreaForBusinessModelField(BaseBusinessModelField):
 </output>
 输出用<output></output>标签包裹，不要输出其他内容，不要输出任何解释。
          """.strip()
-         pipeline=CandidatesGenerationPipeLine(prompt=prompt,prompt_params=prompt_params)
-         candidates=pipeline.invoke()
-         return candidates
+         return self.request_candidates(context,prompt,prompt_params,on_result=on_result)
         
 
 # =============================================================================
@@ -2708,7 +2792,7 @@ class ServiceLifeBusinessModelField(BaseStructureExtractBusinessModelField):
         if not value:
             return self.default_value
         if isinstance(value,str):
-            value=''.join(re.findall(r'\d+', value))
+            value=''.join(DIGITS_PATTERN.findall(value))
             if not value.strip():
                 return self.default_value
         value=int(value)
@@ -2728,12 +2812,7 @@ class ServiceLifeBusinessModelField(BaseStructureExtractBusinessModelField):
         for scope in self.context_scope:
             contexts=project_context.get_contents_by_scope(scope)
             for file_context in contexts:
-                if file_context.paragraphs and len(file_context.paragraphs)>0:
-                    for paragraph in file_context.paragraphs:
-                        for paragraph_key in self.paragraph_keys:
-                            if paragraph_key in paragraph["title"]:
-                                match_paragraph.append(paragraph["content"])
-                                break
+                match_paragraph.extend(file_context.match_paragraphs(self.paragraph_keys))
         building_contexts=business_model_item.structure
         if not building_contexts:
             # return None,None
@@ -2837,12 +2916,7 @@ class StructureTypeBusinessModelField(ServiceLifeBusinessModelField):
         for scope in self.context_scope:
             contexts=project_context.get_contents_by_scope(scope)
             for file_context in contexts:
-                if file_context.paragraphs and len(file_context.paragraphs)>0:
-                    for paragraph in file_context.paragraphs:
-                        for paragraph_key in self.paragraph_keys:
-                            if paragraph_key in paragraph["title"]:
-                                match_paragraph.append(paragraph["content"])
-                                break
+                match_paragraph.extend(file_context.match_paragraphs(self.paragraph_keys))
         building_contexts=business_model_item.structure
         if not building_contexts:
             # return None,None
@@ -2881,7 +2955,7 @@ class BuildingFortificationIntensityBusinessModelField(ServiceLifeBusinessModelF
         if not value:
             return self.default_value
         if isinstance(value,str):
-            value=''.join(re.findall(r'\d+', value))
+            value=''.join(DIGITS_PATTERN.findall(value))
             if not value.strip():
                 return self.default_value
         value=int(value)
@@ -2922,6 +2996,11 @@ class EarthquakeLevelBusinessModelField(ServiceLifeBusinessModelField):
 
 class LiftValueField(BaseValueField):
     """电梯字段"""
+    
+    patterns = {
+        "lift": (r'电梯DT(\d+)', 0),
+    }
+    
     def _extract_field_value(self,context:ProjectContext):
         value=None
         field_name=self.name
@@ -2931,24 +3010,17 @@ class LiftValueField(BaseValueField):
             contexts:List[BaseFileContext]=context.get_contents_by_scope(scope)
             contents=[]
             for file_context in contexts:
-                text_content_list=file_context.text_content_list
-                table_content_list=[]
-                if isinstance(file_context,DwgFileContext):
-                    table_content_list=file_context.table_content_list
-                contents.extend(table_content_list)
-                contents.extend(text_content_list)
+                contents.extend(context.lookup_contents(file_context,keys))
                 if isinstance(file_context,DwgFileContext):
                     if file_context.text_list:
                         ocr_images,ocr_contents=self.ocr_check(file_context,p_width=self.p_width,p_height=self.p_height)
                         contents.extend(ocr_contents)
             for content in contents:
-                for key in keys:
-                    str_list=self.extract_surrounding_text(content,key,50,50)
-                    matched_str_list.extend(str_list)
+                str_list=self.extract_surrounding_text_multi(content,keys,50,50)
+                matched_str_list.extend(str_list)
         matched_str_list,ie_results=self.ie_filter(matched_str_list)
         content="\n".join(matched_str_list)
-        pattern='电梯DT(\d+)'
-        matches = re.findall(pattern, content)
+        matches = self.compiled_patterns["lift"].findall(content)
         value=len(set(matches))
         return value
     
@@ -2956,7 +3028,7 @@ class LiftValueField(BaseValueField):
         if not self.value:
             return None
         if self.return_type=="number":
-            self.value=''.join(re.findall(r'\d+', self.value))
+            self.value=''.join(DIGITS_PATTERN.findall(self.value))
         elif self.return_type=="str" and isinstance(self.value,str):
             self.value=self.value.split("，")[0]
             self.value=self.value.split(",")[0]
@@ -2970,7 +3042,7 @@ class LiftValueField(BaseValueField):
         if not self.value:
             return self.default_value
         if isinstance(self.value,str):
-            self.value=''.join(re.findall(r'\d+', self.value))
+            self.value=''.join(DIGITS_PATTERN.findall(self.value))
             if not self.value.strip():
                 return self.default_value
         self.value=int(self.value)
@@ -3018,7 +3090,7 @@ class HeightBusinessModelField(BaseBusinessModelField):
     """      
     def _extract_field_business_model(self, project_context, business_model_item:BusinessModelItem):
         if not business_model_item.facade:
-            return -1,self.ref_data
+            return -1,ReferenceData()
         facade_context_list=business_model_item.facade
         candidation_facade:List[float]=[]
         for file_context in facade_context_list:
@@ -3036,10 +3108,9 @@ class HeightBusinessModelField(BaseBusinessModelField):
                 height=abs(min(candidation_facade))
             else:
                 height=max(candidation_facade)
-            self.value=height
-            return height,self.ref_data
+            return height,ReferenceData()
         else:
-            return -1,self.ref_data
+            return -1,ReferenceData()
         
                 
 
@@ -3065,7 +3136,7 @@ class StandardHeightBusinessModelField(BaseBusinessModelField):
     
     def _extract_field_business_model(self, project_context, business_model_item:BusinessModelItem):
         if not business_model_item.facade:
-            return -1,self.ref_data
+            return -1,ReferenceData()
         facade_context_list=business_model_item.facade
         candidation_facade:List[float]=[]
         for file_context in facade_context_list:
@@ -3087,10 +3158,9 @@ class StandardHeightBusinessModelField(BaseBusinessModelField):
             else:
                 # 寻找最多的重数
                 height=self.most_common_element(candidation_facade)
-            self.value=height
-            return height,self.ref_data
+            return height,ReferenceData()
         else:
-            return -1,self.ref_data
+            return -1,ReferenceData()
 
 # =============================================================================
 # 专门的字段子类 - 为基础字段类添加候选键生成功能
@@ -3103,7 +3173,7 @@ class GreeningAreaField(SingleAreaValueField):
             return self.default_value
         
         if isinstance(self.value,str):
-            match = re.search(r'-?\d+\.?\d*', self.value)
+            match = NUMBER_PATTERN.search(self.value)
             if match:
                 self.value=match.group()
             else:
@@ -3119,12 +3189,7 @@ class GreeningAreaField(SingleAreaValueField):
         for scope in self.context_scope:
             contexts:List[BaseFileContext]=context.get_contents_by_scope(scope)
             for file_context in contexts:
-                if file_context.paragraphs and len(file_context.paragraphs)>0:
-                    for paragraph in file_context.paragraphs:
-                        for paragraph_key in self.paragraph_keys:
-                            if paragraph_key in paragraph['title']:
-                                matched_paragraphs.append(paragraph['content'])
-                                break
+                matched_paragraphs.extend(file_context.match_paragraphs(self.paragraph_keys))
         matched_str_list=matched_paragraphs
         for scope in self.context_scope:
             contexts:List[BaseFileContext]=context.get_contents_by_scope(scope)
@@ -3132,20 +3197,14 @@ class GreeningAreaField(SingleAreaValueField):
                 continue
             contents=[]
             for file_context in contexts:
-                text_content_list=file_context.text_content_list
-                table_content_list=[]
-                if isinstance(file_context,DwgFileContext):
-                    table_content_list=file_context.table_content_list
-                contents.extend(table_content_list)
-                contents.extend(text_content_list)
+                contents.extend(context.lookup_contents(file_context,keys))
                 if isinstance(file_context,DwgFileContext):
                     if file_context.text_list:
                         ocr_images,ocr_contents=self.ocr_check(file_context,p_width=self.p_width,p_height=self.p_height)
                         contents.extend(ocr_contents)
             for content in contents:
-                for key in keys:
-                    str_list=self.extract_surrounding_text(content,key,50,50)
-                    matched_str_list.extend(str_list)
+                str_list=self.extract_surrounding_text_multi(content,keys,50,50)
+                matched_str_list.extend(str_list)
         matched_str_list,ie_results=self.ie_filter(matched_str_list)
         content="\n".join(matched_str_list)
         if not content.strip():
@@ -3192,9 +3251,7 @@ class GreeningAreaField(SingleAreaValueField):
 </output>
 输出用<output></output>标签包裹，不要输出其他内容，不要输出任何解释。
         """.strip()
-        candidates_generation_pipe=CandidatesGenerationPipeLine(prompt=prompt,prompt_params=prompt_params)
-        candidates=candidates_generation_pipe.invoke()
-        return candidates
+        return self.request_candidates(context,prompt,prompt_params)
 
 class StartDateField(BaseValueField):
     """开工日期字段"""
@@ -3264,9 +3321,7 @@ class StartDateField(BaseValueField):
 </output>
 输出用<output></output>标签包裹，不要输出其他内容，不要输出任何解释。
         """.strip()
-        candidates_generation_pipe=CandidatesGenerationPipeLine(prompt=prompt,prompt_params=prompt_params)
-        candidates=candidates_generation_pipe.invoke()
-        return candidates
+        return self.request_candidates(context,prompt,prompt_params)
 
 class CompletionDateField(BaseValueField):
     """竣工日期字段"""
@@ -3338,9 +3393,7 @@ class CompletionDateField(BaseValueField):
 </output>
 输出用<output></output>标签包裹，不要输出其他内容，不要输出任何解释。
         """.strip()
-        candidates_generation_pipe=CandidatesGenerationPipeLine(prompt=prompt,prompt_params=prompt_params)
-        candidates=candidates_generation_pipe.invoke()
-        return candidates
+        return self.request_candidates(context,prompt,prompt_params)
 
 class ConstructionUnitField(BaseValueField):
     """建设单位字段"""
@@ -3376,9 +3429,7 @@ class ConstructionUnitField(BaseValueField):
 </output>
 输出用<output></output>标签包裹，不要输出其他内容，不要输出任何解释。
         """.strip()
-        candidates_generation_pipe=CandidatesGenerationPipeLine(prompt=prompt,prompt_params=prompt_params)
-        candidates=candidates_generation_pipe.invoke()
-        return candidates
+        return self.request_candidates(context,prompt,prompt_params)
 
 class DesignUnitField(BaseValueField):
     """设计单位字段"""
@@ -3413,9 +3464,7 @@ class DesignUnitField(BaseValueField):
 </output>
 输出用<output></output>标签包裹，不要输出其他内容，不要输出任何解释。
         """.strip()
-        candidates_generation_pipe=CandidatesGenerationPipeLine(prompt=prompt,prompt_params=prompt_params)
-        candidates=candidates_generation_pipe.invoke()
-        return candidates
+        return self.request_candidates(context,prompt,prompt_params)
 
 class CivilDefenseBuildingAreaField(SingleAreaValueField):
     """人防建筑面积字段"""
@@ -3429,12 +3478,7 @@ class CivilDefenseBuildingAreaField(SingleAreaValueField):
         for scope in self.context_scope:
             contexts:List[BaseFileContext]=context.get_contents_by_scope(scope)
             for file_context in contexts:
-                if file_context.paragraphs and len(file_context.paragraphs)>0:
-                    for paragraph in file_context.paragraphs:
-                        for paragraph_key in self.paragraph_keys:
-                            if paragraph_key in paragraph['title']:
-                                matched_paragraphs.append(paragraph['content'])
-                                break
+                matched_paragraphs.extend(file_context.match_paragraphs(self.paragraph_keys))
         # 再走表格匹配
         matched_table_contents=[]
         for scope in self.context_scope:
@@ -3452,19 +3496,14 @@ class CivilDefenseBuildingAreaField(SingleAreaValueField):
                 continue
             contents=[]
             for file_context in contexts:
-                text_content_list=file_context.text_content_list
-                table_content_list=[]
-                if isinstance(file_context,DwgFileContext):
-                    table_content_list=file_context.table_content_list
-                contents.extend(text_content_list)
+                contents.extend(context.lookup_contents(file_context,keys,include_tables=False))
                 if isinstance(file_context,DwgFileContext):
                     if file_context.text_list:
                         ocr_images,ocr_contents=self.ocr_check(file_context,p_width=self.p_width,p_height=self.p_height)
                         contents.extend(ocr_contents)
             for content in contents:
-                for key in keys:
-                    str_list=self.extract_surrounding_text(content,key,50,50)
-                    matched_str_list.extend(str_list)
+                str_list=self.extract_surrounding_text_multi(content,keys,50,50)
+                matched_str_list.extend(str_list)
         matched_str_list,ie_results=self.ie_filter(matched_str_list)
         content="\n".join(matched_str_list)
         if not content.strip():
@@ -3484,7 +3523,7 @@ class CivilDefenseBuildingAreaField(SingleAreaValueField):
         if not self.value:
             return self.default_value
         if isinstance(self.value,str):
-            self.value=''.join(re.findall(r'\d+\.?\d*', self.value))
+            self.value=''.join(DECIMAL_PATTERN.findall(self.value))
         self.value=float(self.value)
         return self.value
     
@@ -3521,9 +3560,7 @@ class CivilDefenseBuildingAreaField(SingleAreaValueField):
 </output>
 输出用<output></output>标签包裹，不要输出其他内容，不要输出任何解释。
         """.strip()
-        candidates_generation_pipe=CandidatesGenerationPipeLine(prompt=prompt,prompt_params=prompt_params)
-        candidates=candidates_generation_pipe.invoke()
-        return candidates
+        return self.request_candidates(context,prompt,prompt_params)
 
 class FoundationTypeField(BaseCategorizedField):
     """基础类型字段"""
@@ -3563,6 +3600,54 @@ class FoundationTypeField(BaseCategorizedField):
 </output>
 输出用<output></output>标签包裹，不要输出其他内容，不要输出任何解释。
         """.strip()
-        candidates_generation_pipe=CandidatesGenerationPipeLine(prompt=prompt,prompt_params=prompt_params)
-        candidates=candidates_generation_pipe.invoke()
-        return candidates
+        return self.request_candidates(context,prompt,prompt_params)
+
+
+# =============================================================================
+# 运行实例创建
+# =============================================================================
+
+def create_field_runs(specs: Dict[str, Field]) -> Dict[str, Field]:
+    """
+    为一次抽取任务创建全部字段的运行实例
+    
+    依赖其他字段的运行实例（project_fields）指向同一任务的运行实例字典，
+    因此同一进程内可以同时执行多个抽取任务，互不干扰。
+    字段解析依赖时会持有自身的解析锁，存在循环依赖时直接报错，避免并发解析时互相等待
+    """
+    runs = {key: spec.spawn() for key, spec in specs.items()}
+    for run in runs.values():
+        if hasattr(run, "project_fields"):
+            run.project_fields = runs
+    _check_dependency_cycles(runs)
+    return runs
+
+
+def _check_dependency_cycles(runs: Dict[str, Field]):
+    """检查运行实例之间的依赖关系是否有环，有环时抛出 ValueError"""
+    graph = {
+        key: [dep for dep in (run.dependencies or []) if dep in runs]
+        for key, run in runs.items()
+        if hasattr(run, "project_fields")
+    }
+    # 0 未访问，1 访问中，2 已完成
+    state: Dict[str, int] = {}
+    for root in graph:
+        if state.get(root):
+            continue
+        state[root] = 1
+        path = [root]
+        stack = [iter(graph[root])]
+        while stack:
+            dep = next(stack[-1], None)
+            if dep is None:
+                state[path.pop()] = 2
+                stack.pop()
+                continue
+            if state.get(dep) == 1:
+                cycle = path[path.index(dep):] + [dep]
+                raise ValueError(f"字段依赖存在循环: {' -> '.join(cycle)}")
+            if not state.get(dep):
+                state[dep] = 1
+                path.append(dep)
+                stack.append(iter(graph.get(dep, [])))
@@ -12,10 +12,18 @@ from extraction.context import (
     BusinessModel
 )
 import random
-from pipelines.fileparse_pipelines import get_file_parse_pipeline
+from pipelines.fileparse_pipelines import get_file_parse_pipeline,ChildLayoutCache
+from pipelines.ai_task_pipelines import CandidatesBatch
+from conf.config import CANDIDATES_BATCH_MAX_TOKENS
 from utils.file import get_all_files_in_dir,calculate_file_metadata_md5
-from extraction.fields import Field
+from extraction.fields import Field,create_field_runs
+from extraction.patterns import PATTERN_REGISTRY
+from utils.template import PROMPT_TEMPLATE_REGISTRY
+from utils.image import IMAGE_ENCODE_STATS
+from utils.vl_cache import VL_RESULT_CACHE
+from vjmap.renderer import FACADE_RENDER_CACHE
 from utils.thread import xthread,as_completed
+from utils.task_stats import task_stats_scope
 from server.task_exec.message import Message
 import json
 
@@ -131,15 +139,28 @@ class CADContentIdentifier:
             construction_cost_document_context=construction_cost_document_context,
             business_model=business_model
         )
+        # 子布局导出与解析结果在任务内共享
+        self.project_context.layout_cache=ChildLayoutCache()
+        # 候选答案在全部字段解析完成后按 token 预算批量生成
+        if CANDIDATES_BATCH_MAX_TOKENS>0:
+            self.project_context.candidates_batch=CandidatesBatch()
     
     
     def extract_filds(self, fields: Dict[str, Field], worker_num=1, **kwargs) -> Dict[Literal["general","business_type","project_name"], Any]:
+        # 正则、模板、图片预处理等统计在本任务的统计范围内累计，同一进程内并发任务互不干扰
+        with task_stats_scope(self.project_name):
+            return self._extract_filds(fields, worker_num=worker_num, **kwargs)
+
+    def _extract_filds(self, fields: Dict[str, Field], worker_num=1, **kwargs) -> Dict[Literal["general","business_type","project_name"], Any]:
         result = {
             "project_name": "",
             "general": {},
             "business_type": {}
         }
 
+        # 由字段定义创建本次任务的运行实例，注册的字段定义本身不保存抽取状态
+        fields = create_field_runs(fields)
+
         # 注入代理模型
         for key, field in fields.items():
             if hasattr(field, "agent_model_name"):
@@ -201,7 +222,15 @@ class CADContentIdentifier:
             logger.info(f"不使用缓存，开始抽取: {output_path}")
             for _, field in fields.items():
                 field.parse(context=self.project_context, pd=pd)
+            if self.project_context.candidates_batch is not None:
+                pd.desc = "正在批量生成候选答案"
+                self.project_context.candidates_batch.flush()
             pd.close()
+            logger.info(PATTERN_REGISTRY.report())
+            logger.info(PROMPT_TEMPLATE_REGISTRY.report())
+            logger.info(IMAGE_ENCODE_STATS.report())
+            logger.info(VL_RESULT_CACHE.report())
+            logger.info(FACADE_RENDER_CACHE.report())
 
             # 正常抽取逻辑（省略，保持不变）
             for key, field in fields.items():
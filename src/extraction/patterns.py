@@ -0,0 +1,134 @@
+"""
+正则模式注册表
+
+字段中用到的正则统一在此编译（同一模式只编译一次），
+并对每个模式统计调用次数与累计耗时，便于发现回溯严重、耗时异常的表达式
+"""
+import re
+import time
+import threading
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Tuple, Iterator, Optional
+
+from utils.task_stats import TaskStatsScope, current_scope, record_time
+
+
+@dataclass
+class PatternStats:
+    name: str = ""
+    pattern: str = ""
+    calls: int = 0
+    total_time: float = 0.0     # 累计耗时（秒）
+    max_time: float = 0.0       # 单次最大耗时（秒）
+
+    def to_dict(self):
+        return asdict(self)
+
+
+class TimedPattern:
+    """
+    带计时的已编译正则，接口与 re.Pattern 常用方法一致
+    计时记入当前任务的统计范围（utils.task_stats），并发任务互不干扰；没有活动范围时不计时
+    """
+
+    def __init__(self, compiled: re.Pattern, name: str):
+        self.compiled = compiled
+        self.name = name
+        self.key = (compiled.pattern, compiled.flags)
+
+    @property
+    def pattern(self) -> str:
+        return self.compiled.pattern
+
+    def _record(self, start: float):
+        record_time("pattern", self.key, time.perf_counter() - start)
+
+    def search(self, text: str):
+        start = time.perf_counter()
+        try:
+            return self.compiled.search(text)
+        finally:
+            self._record(start)
+
+    def match(self, text: str):
+        start = time.perf_counter()
+        try:
+            return self.compiled.match(text)
+        finally:
+            self._record(start)
+
+    def findall(self, text: str) -> list:
+        start = time.perf_counter()
+        try:
+            return self.compiled.findall(text)
+        finally:
+            self._record(start)
+
+    def finditer(self, text: str) -> Iterator[re.Match]:
+        # 一次性取完匹配结果，计时才包含真正的匹配过程
+        start = time.perf_counter()
+        try:
+            matches = list(self.compiled.finditer(text))
+        finally:
+            self._record(start)
+        return iter(matches)
+
+    def sub(self, repl, text: str, count: int = 0) -> str:
+        start = time.perf_counter()
+        try:
+            return self.compiled.sub(repl, text, count)
+        finally:
+            self._record(start)
+
+
+class PatternRegistry:
+    """正则注册表：按 (pattern, flags) 缓存编译结果并汇总计时"""
+
+    def __init__(self):
+        self._patterns: Dict[Tuple[str, int], TimedPattern] = {}
+        self._lock = threading.Lock()
+
+    def compile(self, pattern: str, flags: int = 0, name: str = None) -> TimedPattern:
+        key = (pattern, flags)
+        timed = self._patterns.get(key)
+        if timed is not None:
+            return timed
+        with self._lock:
+            timed = self._patterns.get(key)
+            if timed is None:
+                timed = TimedPattern(re.compile(pattern, flags), name=name or pattern.strip()[:40])
+                self._patterns[key] = timed
+        return timed
+
+    def stats(self, scope: Optional[TaskStatsScope] = None) -> List[PatternStats]:
+        """按累计耗时降序返回指定统计范围（默认当前任务）内各模式的统计"""
+        scope = scope or current_scope()
+        if scope is None:
+            return []
+        with self._lock:
+            patterns = {timed.key: timed for timed in self._patterns.values()}
+        stats = []
+        for (_, key), (calls, total_time, max_time) in scope.snapshot("pattern").items():
+            timed = patterns.get(key)
+            stats.append(PatternStats(
+                name=timed.name if timed else key[0].strip()[:40],
+                pattern=key[0],
+                calls=int(calls),
+                total_time=total_time,
+                max_time=max_time
+            ))
+        return sorted(stats, key=lambda s: s.total_time, reverse=True)
+
+    def report(self, top: int = 10, scope: Optional[TaskStatsScope] = None) -> str:
+        lines = ["正则耗时统计（按累计耗时降序）:"]
+        for s in self.stats(scope)[:top]:
+            if s.calls <= 0:
+                continue
+            lines.append(
+                f"\t{s.name}: 调用 {s.calls} 次, 累计 {s.total_time*1000:.1f}ms, "
+                f"平均 {s.total_time/s.calls*1000:.3f}ms, 最大 {s.max_time*1000:.1f}ms"
+            )
+        return "\n".join(lines)
+
+
+PATTERN_REGISTRY = PatternRegistry()
@@ -46,6 +46,7 @@ from extraction.fields import (
 )
 
 from extraction.context import ContextScope
+# 字段定义注册表：这里的字段只作为定义，抽取时由 create_field_runs 为每个任务创建运行实例
 FIELDS_POOL=dict()
 
 def regist_field(key_name,field:Field):
@@ -4,8 +4,53 @@
 
 import tqdm
 from parser.base import Parser
+from collections import Counter
 from vjmap.services import MapTableExtractService,MapTableExtractParams,TableItem
-from typing import List
+from vjmap.items import EnvelopBounds
+from typing import List,Optional
+
+
+def table_completeness_score(table_item:TableItem)->float:
+    """
+    矢量表格完整度评分（0~1）：非空单元格占比 × 行列数一致的行占比
+    少于 2 行或 2 列的表格视为不完整
+    """
+    rows=table_item.datas or []
+    if len(rows)<2:
+        return 0.0
+    col_count=Counter(len(row) for row in rows).most_common(1)[0][0]
+    col_count=max(col_count,table_item.colCount or 0)
+    if col_count<2:
+        return 0.0
+    consistent=sum(1 for row in rows if len(row)==col_count)/len(rows)
+    filled=sum(1 for row in rows for cell in row if cell and str(cell).strip())/(len(rows)*col_count)
+    return filled*consistent
+
+
+def table_to_markdown(table_item:TableItem)->str:
+    """矢量表格转为 markdown（首行作为表头）"""
+    rows=table_item.datas or []
+    if not rows:
+        return ""
+    col_count=max(len(row) for row in rows)
+    def fmt(row):
+        cells=[str(cell or "").replace("\n"," ").replace("|","/").strip() for cell in row]
+        cells+=[""]*(col_count-len(cells))
+        return "| "+" | ".join(cells)+" |"
+    lines=[fmt(rows[0]),"| "+" | ".join(["---"]*col_count)+" |"]
+    lines.extend(fmt(row) for row in rows[1:])
+    return "\n".join(lines)
+
+
+def bounds_iou(a:EnvelopBounds,b:EnvelopBounds)->float:
+    inter_w=min(a.maxx,b.maxx)-max(a.minx,b.minx)
+    inter_h=min(a.maxy,b.maxy)-max(a.miny,b.miny)
+    if inter_w<=0 or inter_h<=0:
+        return 0.0
+    inter=inter_w*inter_h
+    union=a.width()*a.height()+b.width()*b.height()-inter
+    return inter/union if union>0 else 0.0
+
 
 class MapTableparser(Parser):
     def __init__(self,mapid:str,version:str="v1",geom:bool=True,**kwargs):
@@ -36,5 +81,33 @@ class MapTableparser(Parser):
             table_content="\n".join(item_row)
             self.table_content_list.append(table_content)
         return self.table_content_list
-        
-        
+
+    def find_table_in_bounds(self,bounds:EnvelopBounds,min_iou:float=0.6)->Optional[TableItem]:
+        """
+        查找与指定范围重合的矢量表格：先在整图抽取结果中按重合度匹配，
+        没有匹配时按范围单独抽取一次
+        """
+        if not bounds:
+            return None
+        best,best_iou=None,0.0
+        for table_item in self.extract_table_item_list():
+            if not table_item.rect:
+                continue
+            iou=bounds_iou(table_item.rect,bounds)
+            if iou>best_iou:
+                best,best_iou=table_item,iou
+        if best and best_iou>=min_iou:
+            return best
+        try:
+            tables=self.map_table_extract_service.extract(params=MapTableExtractParams(
+                mapid=self.mapid,
+                bounds=bounds.scale(1.02).to_str()
+            ))
+        except Exception as e:
+            print(f"按范围抽取表格失败: {e}")
+            return None
+        tables=[table for table in tables if table.datas]
+        if not tables:
+            return None
+        # 范围内有多个表格时取面积最大的
+        return max(tables,key=lambda t:t.rect.width()*t.rect.height() if t.rect else 0)
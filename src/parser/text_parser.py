@@ -2,7 +2,6 @@
 文本解析器
 """
 import tqdm
-import json
 import re
 from scipy.spatial import KDTree
 import numpy as np
@@ -14,8 +13,9 @@ from vjmap.services import (
 )
 from vjmap.items import (
     QueryItem,
-    EnvelopBounds
+    QueryItemCollection
 )
+from vjmap.renderer import MAP_ENTITY_SNAPSHOTS
 from vjmap.utils import (
     geoPointFromString,
     get_min_distance,
@@ -37,6 +37,7 @@ class MapTextParser(Parser):
         self.version=version
         self.geom=geom
         self.text_list=[]
+        self.text_collection:QueryItemCollection=QueryItemCollection([])
         self.text_cluster_list=[]
         self.query_ent_types=["AcDbText","AcDbMText","AcDbAttributeDefinition","AcDbAttribute"]
         
@@ -86,12 +87,14 @@ class MapTextParser(Parser):
         if pbar:
             pbar.close()
         for item in result:
-            bounds=json.loads(item.bounds)
-            item.bounds=EnvelopBounds(minx=bounds[0],miny=bounds[1],maxx=bounds[2],maxy=bounds[3])
+            item.parse_bounds()
             if item.points:
                 item.points=geoPointFromString(item.points)
         layout_coordinate_points(result)
         self.text_list=result
+        # bounds 与中心点按列缓存，聚类等后续步骤不再逐项计算
+        self.text_collection=QueryItemCollection(result)
+        MAP_ENTITY_SNAPSHOTS.register_texts(self.mapid,result)
         return result
     
     
@@ -142,19 +145,12 @@ class MapTextParser(Parser):
         if self.text_cluster_list:
             return self.text_cluster_list
 
-        all_text_list = self.parse_all_text_from_map()
-        centers = []
-        index_to_item = []
-
-        for item in all_text_list:
-            if not item.text or len(item.text) <= 2 or not item.bounds:
-                continue
-            cx = (item.bounds.minx + item.bounds.maxx) / 2
-            cy = (item.bounds.miny + item.bounds.maxy) / 2
-            centers.append([cx, cy])
-            index_to_item.append(item)
-
-        centers = np.array(centers)
+        self.parse_all_text_from_map()
+        collection = self.text_collection
+        valid = ~np.isnan(collection.centers).any(axis=1)
+        indices = [idx for idx, text in enumerate(collection.texts) if len(text) > 2 and valid[idx]]
+        index_to_item = [collection[idx] for idx in indices]
+        centers = collection.centers[indices]
         tree = KDTree(centers)
         visited = set()
         clusters = []
@@ -1,8 +1,10 @@
 import json
-import hashlib
+import threading
+from dataclasses import dataclass,field
 from abc import ABC, abstractmethod
 from typing import Iterable,List,Dict,Literal,Tuple
-from jinja2 import Template
+from utils.template import get_template
+from utils.thread import ContextThreadPoolExecutor
 from utils.openai import openai_chat_by_api,ChatCompletionMessageParam
 from pipelines.base import PipeLine
 from common.prompts import (field_requiring_classification_prompt_template,
@@ -22,12 +24,9 @@ from common.prompts import (field_requiring_classification_prompt_template,
                             greening_area_extraction_prompt)
 from extraction.context import DwgFileContext,FacadeContext
 from utils.file import image_chat
-from vjmap.services import (
-    MapPngByBoundsService,
-    MapPngByBoundsParams
-)
-from typing import Any
-from conf.config import CANDIDATES_GENERATION_MODEL_NAME
+from vjmap.renderer import get_facade_image
+from typing import Any,Callable,Optional
+from conf.config import CANDIDATES_GENERATION_MODEL_NAME,CANDIDATES_BATCH_MAX_TOKENS
 
 
 class BaseLanguageModelTaskPipeLine(PipeLine,ABC):
@@ -63,7 +62,7 @@ class ExtractionCategorizedTaskPipeLine(BaseLanguageModelTaskPipeLine):
         self.classifications=classifications
     
     def create_query(self):
-        template=Template(field_requiring_classification_prompt_template)
+        template=get_template(field_requiring_classification_prompt_template)
         query=template.render(
             {
                 "content":self.content,
@@ -89,7 +88,7 @@ class ExtractionFieldValueTaskBaseLanguageModelPipeLine(BaseLanguageModelTaskPip
         self.alias=alias
     
     def create_query(self):
-        template=Template(field_directed_prompt_template)
+        template=get_template(field_directed_prompt_template)
         keys=[self.field_name]+self.alias
         content=self.content.replace("2\r\n","\r\n")
         query=template.render(
@@ -114,7 +113,7 @@ class ExtractionFieldValueTaskBaseLanguageModelPipeLine(BaseLanguageModelTaskPip
         return field_value
 class LandAreaFieldValueTaskLanguageModelPipeLine(ExtractionFieldValueTaskBaseLanguageModelPipeLine):
     def create_query(self):
-        template=Template(land_area_prompt_template)
+        template=get_template(land_area_prompt_template)
         keys=[self.field_name]+self.alias
         content=self.content.replace("2\r\n","\r\n")
         query=template.render(
@@ -127,7 +126,7 @@ class LandAreaFieldValueTaskLanguageModelPipeLine(ExtractionFieldValueTaskBaseLa
 # 抽取充电桩数量
 class ChargerCountExtractionPipeLine(ExtractionFieldValueTaskBaseLanguageModelPipeLine):
     def create_query(self):
-        template=Template(charger_count_extraction_prompt)
+        template=get_template(charger_count_extraction_prompt)
         keys=[self.field_name]+self.alias
         content=self.content.replace("2\r\n","\r\n")
         query=template.render(
@@ -141,7 +140,7 @@ class ChargerCountExtractionPipeLine(ExtractionFieldValueTaskBaseLanguageModelPi
 # 停车位数量
 class ParkingSpaceCountExtractionPipeLine(ExtractionFieldValueTaskBaseLanguageModelPipeLine):
     def create_query(self):
-        template=Template(parking_space_count_extraction_prompt)
+        template=get_template(parking_space_count_extraction_prompt)
         keys=[self.field_name]+self.alias
         content=self.content.replace("2\r\n","\r\n")
         query=template.render(
@@ -158,7 +157,7 @@ class AddressParsePipeLine(BaseLanguageModelTaskPipeLine):
         self.address=address
     
     def create_query(self):
-        template=Template(address_search_template)
+        template=get_template(address_search_template)
         query=template.render(
             {
                 "address":self.address
@@ -191,7 +190,7 @@ class FloorAreaExtractionPipeLine(BaseLanguageModelTaskPipeLine):
         self.ref_contexts=ref_contexts
     
     def create_query(self):
-        template=Template(building_area_extraction_prompt)
+        template=get_template(building_area_extraction_prompt)
         query=template.render(
             {
                 "field_name":self.field_name,
@@ -238,7 +237,7 @@ class BaseGeneralBusinessExtractionPipeLine(BaseLanguageModelTaskPipeLine):
         raise NotImplementedError("子类必须实现该方法")
     
     def create_query(self):
-        template=Template(self._get_prompt())
+        template=get_template(self._get_prompt())
         query=template.render(
             {
                 "field_name":self.field_name,
@@ -277,7 +276,7 @@ class StructureTypeExtractionPipeLine(BaseGeneralBusinessExtractionPipeLine):
     def _get_prompt(self):
         return structure_type_extraction_prompt
     def create_query(self):
-        template=Template(self._get_prompt())
+        template=get_template(self._get_prompt())
         query=template.render(
             {
                 "keys":self.keys,
@@ -309,31 +308,6 @@ class BuildingFortificationIntensityExtractionPipeLine(BaseGeneralBusinessExtrac
     def _get_value_key(self):
         return "building_fortification_intensity"
     
-"""
-class BaseLanguageModelTaskPipeLine(PipeLine,ABC):
-    def __init__(self,model_name="gpt-4o-mini"):
-        self.model_name=model_name
-
-    
-    def single_complete(self,query,temperature=0.7,max_tokens=1024):
-        ai_res=openai_chat_by_api(
-            model_name=self.model_name,
-            messages=[{
-                    "role":"user",
-                    "content":query
-            }],
-            inference_params={
-                "temperature":temperature,
-                "max_tokens":max_tokens
-            }
-        )
-        return ai_res
-    
-    @abstractmethod
-    def create_query(self):
-        pass
-"""
-
 class HeightParsePipeLine(BaseLanguageModelTaskPipeLine):
     def __init__(self, file_context:DwgFileContext,facade_context:FacadeContext,building_model_name:str,**kwargs):
         super().__init__(**kwargs)
@@ -345,18 +319,11 @@ class HeightParsePipeLine(BaseLanguageModelTaskPipeLine):
         return "building_height"
     
     def create_image(self):
-        mapPngByBoundsService=MapPngByBoundsService(self.file_context.mapid)
-        url=mapPngByBoundsService.map_to_img_url(params=MapPngByBoundsParams(
-            width=4096,
-            bbox=self.facade_context.submap.to_str()
-        ))
-        image_name=f"{self.file_context.mapid}_{hashlib.md5(self.facade_context.submap.to_str().encode()).hexdigest()}.png"
-        end_save_dir=f"data/images/{self.file_context.mapid}"
-        image_path=mapPngByBoundsService.url_to_img(img_url=url,image_name=image_name,save_dir=end_save_dir)
-        return image_path
+        # 立面大图在各立面流水线之间共享，同一子图只出图一次
+        return get_facade_image(self.file_context.mapid,self.facade_context.submap,width=4096)
     
     def create_query(self):
-        template=Template(building_height_with_refcontent_prompt)
+        template=get_template(building_height_with_refcontent_prompt)
         query=template.render(
             {
                 "building_model_name":self.building_model_name,
@@ -391,7 +358,7 @@ class StandardHeightParsePipeLine(HeightParsePipeLine):
         return "floor_height"
 
     def create_query(self):
-        template=Template(building_standard_height_with_refcontent_prompt)
+        template=get_template(building_standard_height_with_refcontent_prompt)
         query=template.render(
             {
                 "building_model_name":self.building_model_name,
@@ -431,7 +398,7 @@ class CandidatesGenerationPipeLine(BaseLanguageModelTaskPipeLine):
         return ai_res
     
     def create_query(self):
-        template=Template(self.prompt)
+        template=get_template(self.prompt)
         query=template.render(
             self.prompt_params
         )
@@ -454,6 +421,153 @@ class CandidatesGenerationPipeLine(BaseLanguageModelTaskPipeLine):
         candidates=self.parse_ai_res(ai_res=ai_res)
         return candidates
     
+@dataclass
+class CandidatesRequest:
+    key:str=field(metadata={"help":"请求标识（批内唯一）"})
+    prompt:str=field(metadata={"help":"候选项生成提示词模板"})
+    prompt_params:Dict[str,Any]=field(default_factory=dict,metadata={"help":"模板参数"})
+    on_result:Optional[Callable[[List[str]],None]]=field(default=None,repr=False,metadata={"help":"生成结果回调"})
+    
+    def render(self)->str:
+        return get_template(self.prompt).render(self.prompt_params)
+
+
+class BatchCandidatesGenerationPipeLine(CandidatesGenerationPipeLine):
+    """
+    批量候选答案生成
+    
+    将多个字段的候选项请求按 token 预算分块，每块合并为一个结构化提示词请求一次模型，
+    返回 {请求标识: 候选项列表}；某块解析失败时退化为逐个请求
+    """
+    # 单个子任务提示词中的输出格式说明，合并时统一替换为批量输出格式
+    OUTPUT_FORMAT_MARK="请按照以下格式输出"
+    
+    def __init__(self,requests:List[CandidatesRequest],max_prompt_tokens:int=CANDIDATES_BATCH_MAX_TOKENS,max_workers:int=4,**kwargs):
+        super().__init__(**kwargs)
+        self.requests=requests
+        self.max_prompt_tokens=max_prompt_tokens
+        self.max_workers=max_workers
+    
+    @staticmethod
+    def estimate_tokens(text:str)->int:
+        # 中文约 1 字 1 token，按字符数保守估计
+        return len(text)
+    
+    def _task_prompt(self,request:CandidatesRequest)->str:
+        prompt=request.render()
+        idx=prompt.find(self.OUTPUT_FORMAT_MARK)
+        if idx>0:
+            prompt=prompt[:idx]
+        return prompt.strip()
+    
+    def split_chunks(self)->List[List[Tuple[CandidatesRequest,str]]]:
+        """按 token 预算切分请求，单个请求超出预算时独占一块"""
+        chunks=[]
+        current=[]
+        current_tokens=0
+        for request in self.requests:
+            task_prompt=self._task_prompt(request)
+            tokens=self.estimate_tokens(task_prompt)
+            if current and current_tokens+tokens>self.max_prompt_tokens:
+                chunks.append(current)
+                current=[]
+                current_tokens=0
+            current.append((request,task_prompt))
+            current_tokens+=tokens
+        if current:
+            chunks.append(current)
+        return chunks
+    
+    def create_batch_query(self,chunk:List[Tuple[CandidatesRequest,str]])->str:
+        tasks="\n\n".join(
+            f'<task id="{request.key}">\n{task_prompt}\n</task>'
+            for request,task_prompt in chunk
+        )
+        example=",\n".join(f'    "{request.key}": ["候选项1", "候选项2"]' for request,_ in chunk[:2])
+        return f"""
+以下共有{len(chunk)}个相互独立的候选项生成任务，每个任务的参考内容与要求只适用于该任务本身，请逐个完成。
+
+{tasks}
+
+请将所有任务的结果合并为一个JSON对象输出，键为任务id，值为该任务的候选项列表（没有候选项时为空列表），必须包含全部{len(chunk)}个任务id：
+<output>
+{{
+{example}
+}}
+</output>
+输出用<output></output>标签包裹，不要输出其他内容，不要输出任何解释。
+        """.strip()
+    
+    def parse_batch_res(self,ai_res:str)->Dict[str,List[str]]:
+        ai_res=ai_res.split("<output>")[-1].split("</output>")[0]
+        ai_res=ai_res.replace("`","")
+        ai_res=ai_res.replace("json","")
+        data=json.loads(ai_res.strip())
+        if not isinstance(data,dict):
+            raise ValueError("批量候选项结果不是JSON对象")
+        return {key:value if isinstance(value,list) else [] for key,value in data.items()}
+    
+    def invoke_chunk(self,chunk:List[Tuple[CandidatesRequest,str]])->Dict[str,List[str]]:
+        if len(chunk)==1:
+            request=chunk[0][0]
+            single=CandidatesGenerationPipeLine(prompt=request.prompt,prompt_params=request.prompt_params,model_name=self.model_name)
+            return {request.key:single.invoke() or []}
+        try:
+            query=self.create_batch_query(chunk)
+            ai_res=self.single_complete(query=query,temperature=self.temperature,max_tokens=self.max_tokens)
+            data=self.parse_batch_res(ai_res)
+            return {request.key:data.get(request.key,[]) for request,_ in chunk}
+        except Exception as e:
+            print(f"批量候选项生成失败，逐个生成: {e}")
+            result={}
+            for item in chunk:
+                result.update(self.invoke_chunk([item]))
+            return result
+    
+    def invoke(self)->Dict[str,List[str]]:
+        if not self.requests:
+            return {}
+        chunks=self.split_chunks()
+        print(f"批量候选项生成：{len(self.requests)}个请求，合并为{len(chunks)}次模型调用")
+        result={}
+        with ContextThreadPoolExecutor(max_workers=max(1,min(self.max_workers,len(chunks)))) as executor:
+            for chunk_result in executor.map(self.invoke_chunk,chunks):
+                result.update(chunk_result)
+        return result
+
+
+class CandidatesBatch:
+    """
+    候选项请求收集器
+    
+    字段解析过程中只登记候选项请求，全部字段解析完成后 flush 一次性批量生成，
+    并通过回调写回各字段
+    """
+    def __init__(self,max_prompt_tokens:int=CANDIDATES_BATCH_MAX_TOKENS):
+        self.max_prompt_tokens=max_prompt_tokens
+        self.requests:List[CandidatesRequest]=[]
+        self._lock=threading.Lock()
+    
+    def add(self,prompt:str,prompt_params:Dict[str,Any],on_result:Callable[[List[str]],None])->str:
+        with self._lock:
+            key=f"t{len(self.requests)}"
+            self.requests.append(CandidatesRequest(key=key,prompt=prompt,prompt_params=prompt_params,on_result=on_result))
+        return key
+    
+    def flush(self)->int:
+        """批量生成并回写候选项，返回处理的请求数"""
+        with self._lock:
+            requests=self.requests
+            self.requests=[]
+        if not requests:
+            return 0
+        result=BatchCandidatesGenerationPipeLine(requests=requests,max_prompt_tokens=self.max_prompt_tokens).invoke()
+        for request in requests:
+            if request.on_result:
+                request.on_result(result.get(request.key) or [])
+        return len(requests)
+    
+
 class ExtractionGreeningAreaFieldPipeLine(ExtractionFieldValueTaskBaseLanguageModelPipeLine):
     """
     抽取绿化面积
@@ -462,7 +576,7 @@ class ExtractionGreeningAreaFieldPipeLine(ExtractionFieldValueTaskBaseLanguageMo
         super().__init__(**kwargs)
     
     def create_query(self):
-        template=Template(greening_area_extraction_prompt)
+        template=get_template(greening_area_extraction_prompt)
         keys=[self.field_name]+self.alias
         content=self.content.replace("2\r\n","\r\n")
         query=template.render(
@@ -482,7 +596,7 @@ class ExtractionCivilDefenseBuildingAreaFieldPipeLine(ExtractionFieldValueTaskBa
         
     
     def create_query(self):
-        template=Template(civil_defense_building_area_extraction_prompt)
+        template=get_template(civil_defense_building_area_extraction_prompt)
         keys=[self.field_name]+self.alias
         content=self.content.replace("2\r\n","\r\n")
         query=template.render(
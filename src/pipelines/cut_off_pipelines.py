@@ -1,17 +1,122 @@
-import os
 import time
-from typing import List,Dict
+import threading
+from dataclasses import dataclass,field
+from typing import List,Dict,Optional,Tuple
 from vjmap.items import EnvelopBounds
 from extraction.context import DwgFileContext
 from vjmap.services import OpenmapService,OpenMapRequestParams
-from vjmap.services import MapPngByBoundsService,MapPngByBoundsParams
+from vjmap.services import MapPngByBoundsParams
+from vjmap.renderer import MAP_ENTITY_SNAPSHOTS,get_map_png_service
+from utils.file import save_image_bytes,cleanup_orphan_images
+from conf.config import OCR_IMAGE_DIR,OCR_IMAGE_RETENTION_SECONDS
+
+
+# 旧版裁剪图片目录（按 time_ns 命名，直接写在该目录下）
+LEGACY_IMAGE_DIR="data/images"
+# 过期图片清理的最小间隔（秒）
+CLEANUP_INTERVAL=3600
+
+_cleanup_lock=threading.Lock()
+_last_cleanup=0.0
+
+
+def cleanup_crop_images(keep:set,force:bool=False)->int:
+    """
+    清理过期且未被任务结果引用的裁剪图片（进程内按 CLEANUP_INTERVAL 节流）
+    :param keep: 已保存的任务结果中引用的图片路径（见 utils.file.collect_image_paths）
+    """
+    global _last_cleanup
+    with _cleanup_lock:
+        now=time.time()
+        if not force and now-_last_cleanup<CLEANUP_INTERVAL:
+            return 0
+        _last_cleanup=now
+    removed=cleanup_orphan_images(OCR_IMAGE_DIR,OCR_IMAGE_RETENTION_SECONDS,keep=keep)
+    removed+=cleanup_orphan_images(LEGACY_IMAGE_DIR,OCR_IMAGE_RETENTION_SECONDS,keep=keep,recursive=False)
+    if removed:
+        print(f"已清理过期图片 {removed} 张")
+    return removed
+
+
+@dataclass
+class CropImage:
+    key:str
+    bbox:str
+    image:bytes
+    image_path:Optional[str]=None
+
+    def persist(self,save_dir:str=OCR_IMAGE_DIR)->str:
+        """需要保留图片路径（如 OcrItem.image_path）时才写入磁盘"""
+        if not self.image_path:
+            self.image_path=save_image_bytes(self.image,save_dir)
+        return self.image_path
+
+
+@dataclass
+class CropRegion:
+    """合并后的裁剪区域，记录覆盖的关键词及单个裁剪框的最大尺寸"""
+    bounds:EnvelopBounds
+    keys:List[str]=field(default_factory=list)
+    unit_width:float=0.0
+    unit_height:float=0.0
+
+    def can_merge(self,other:"CropRegion",max_scale:float,gap_ratio:float)->bool:
+        # 重叠或间距小于 gap 视为相邻
+        gap=min(self.unit_height,other.unit_height)*gap_ratio
+        a,b=self.bounds,other.bounds
+        if a.minx-gap>b.maxx or b.minx-gap>a.maxx or a.miny-gap>b.maxy or b.miny-gap>a.maxy:
+            return False
+        # 合并后的区域不能超过单个裁剪框的 max_scale 倍
+        width=max(a.maxx,b.maxx)-min(a.minx,b.minx)
+        height=max(a.maxy,b.maxy)-min(a.miny,b.miny)
+        return (width<=max(self.unit_width,other.unit_width)*max_scale
+                and height<=max(self.unit_height,other.unit_height)*max_scale)
+
+    def merge(self,other:"CropRegion"):
+        a,b=self.bounds,other.bounds
+        self.bounds=EnvelopBounds(
+            minx=min(a.minx,b.minx),
+            miny=min(a.miny,b.miny),
+            maxx=max(a.maxx,b.maxx),
+            maxy=max(a.maxy,b.maxy)
+        )
+        self.keys.extend(key for key in other.keys if key not in self.keys)
+        self.unit_width=max(self.unit_width,other.unit_width)
+        self.unit_height=max(self.unit_height,other.unit_height)
+
+
+def merge_crop_regions(boxes:List[Tuple[str,EnvelopBounds]],max_scale:float=4.0,gap_ratio:float=0.5)->List[CropRegion]:
+    """
+    合并重叠或相邻的裁剪框（反复合并直到稳定）
+    :param boxes: (关键词, 裁剪框) 列表
+    :param max_scale: 合并区域的宽高上限（相对单个裁剪框的倍数）
+    :param gap_ratio: 相邻判定间距（相对裁剪框高度的比例）
+    """
+    regions=[
+        CropRegion(bounds=bounds,keys=[key],unit_width=bounds.width(),unit_height=bounds.height())
+        for key,bounds in boxes
+    ]
+    merged=True
+    while merged:
+        merged=False
+        result:List[CropRegion]=[]
+        for region in sorted(regions,key=lambda r:(r.bounds.minx,r.bounds.miny)):
+            for target in result:
+                if target.can_merge(region,max_scale,gap_ratio):
+                    target.merge(region)
+                    merged=True
+                    break
+            else:
+                result.append(region)
+        regions=result
+    return regions
 
 
 class DwgImageCatOffPipeLine:
     def __init__(self,file_context:DwgFileContext):
         assert file_context
         self.file_context=file_context
-    
+
         mapid=file_context.mapid
         self.mapid=mapid
         fileid=file_context.fileid
@@ -31,42 +136,90 @@ class DwgImageCatOffPipeLine:
                 continue
             else:
                 break
-        self.svc=MapPngByBoundsService(mapid=mapid)
-        
-        
-    
-    def invoke(self,keys:List[str],scale=1.02,p_width=1.0,p_height=1.0)->Dict[str,List]:
+        # 本地出图时以已解析的文本作为文字快照（缓存命中时文本解析器不会运行）
+        snapshot=MAP_ENTITY_SNAPSHOTS.get(mapid)
+        if (snapshot is None or snapshot.texts is None) and file_context.text_list:
+            MAP_ENTITY_SNAPSHOTS.register_texts(mapid,file_context.text_list)
+        self.svc=get_map_png_service(mapid)
+
+
+    @staticmethod
+    def crop_bounds(bounds:EnvelopBounds,scale=1.02,p_width=1.0,p_height=1.0)->EnvelopBounds:
+        """按宽高倍率向右上方扩展并缩放（返回新对象，不修改文本原始坐标）"""
+        deta_width=bounds.width()*(p_width-1)
+        deta_height=bounds.height()*(p_height-1)
+        expanded=EnvelopBounds(
+            minx=bounds.minx,
+            miny=bounds.miny,
+            maxx=bounds.maxx+deta_width,
+            maxy=bounds.maxy+deta_height
+        )
+        return expanded.scale(scale)
+
+    def invoke_in_memory(self,keys:List[str],scale=1.02,p_width=1.0,p_height=1.0)->Dict[str,List[CropImage]]:
+        """裁剪关键词所在区域的图片，图片内容保存在内存中"""
         if not self.file_context or not self.file_context.text_list or len(self.file_context.text_list)<=0:
-            return []
+            return {}
         if not keys or len(keys)<=0:
-            return []
+            return {}
+        text_collection=self.file_context.get_text_collection()
         result={}
         for key in keys:
             key_result=[]
-            for text_item in self.file_context.text_list:
-                if key in text_item.text:
-                    bounds=text_item.bounds
-                    # 对坐标值进行宽高进行倍率计算
-                    deta_p_width=p_width-1
-                    deta_p_height=p_height-1
-                    deta_height=bounds.height()*deta_p_height
-                    deta_width=bounds.width()*deta_p_width
-                    bounds.maxx=bounds.maxx+deta_width
-                    bounds.maxy=bounds.maxy+deta_height
-                    params=MapPngByBoundsParams(
-                        bbox=bounds.scale(scale).to_str(),
-                        width=512
-                    )
-                    url=self.svc.map_to_img_url(params=params)
-                    save_dir="data/images"
-                    image_name=f"{time.time_ns()}.png"
-                    flag=self.svc.url_to_img(img_url=url,image_name=image_name,save_dir=save_dir)
-                    if flag:
-                        save_path=os.path.join(save_dir,image_name)
-                        save_path=os.path.abspath(save_path)
-                        key_result.append(save_path)
-                    else:
-                        print("error:解析图片失败")
+            for idx in text_collection.indices_by_text(key):
+                text_item=text_collection[idx]
+                bbox=self.crop_bounds(text_item.parse_bounds(),scale=scale,p_width=p_width,p_height=p_height).to_str()
+                params=MapPngByBoundsParams(
+                    bbox=bbox,
+                    width=512
+                )
+                url=self.svc.map_to_img_url(params=params)
+                image=self.svc.url_to_bytes(img_url=url)
+                if image:
+                    key_result.append(CropImage(key=key,bbox=bbox,image=image))
+                else:
+                    print("error:解析图片失败")
             result[key]=key_result
         return result
-        
\ No newline at end of file
+
+    def invoke_merged(self,keys:List[str],scale=1.02,p_width=1.0,p_height=1.0,
+                      max_scale:float=4.0,gap_ratio:float=0.5,base_width:int=512,max_width:int=2048)->Dict[str,List[CropImage]]:
+        """
+        合并相邻的关键词裁剪框后再出图，每个合并区域只下载一次，
+        返回 {关键词: 图片列表}，同一区域的图片对象在各关键词之间共享
+        """
+        if not self.file_context or not self.file_context.text_list or len(self.file_context.text_list)<=0:
+            return {}
+        if not keys or len(keys)<=0:
+            return {}
+        text_collection=self.file_context.get_text_collection()
+        boxes=[]
+        for key in keys:
+            for idx in text_collection.indices_by_text(key):
+                text_item=text_collection[idx]
+                boxes.append((key,self.crop_bounds(text_item.parse_bounds(),scale=scale,p_width=p_width,p_height=p_height)))
+        regions=merge_crop_regions(boxes,max_scale=max_scale,gap_ratio=gap_ratio)
+        print(f"裁剪框合并：{len(boxes)} -> {len(regions)}")
+        result={key:[] for key in keys}
+        for region in regions:
+            # 按区域相对单个裁剪框的宽度放大出图尺寸，保证文字清晰度不变
+            ratio=region.bounds.width()/region.unit_width if region.unit_width>0 else 1.0
+            width=int(min(max_width,base_width*max(1.0,ratio)))
+            bbox=region.bounds.to_str()
+            url=self.svc.map_to_img_url(params=MapPngByBoundsParams(bbox=bbox,width=width))
+            image=self.svc.url_to_bytes(img_url=url)
+            if not image:
+                print("error:解析图片失败")
+                continue
+            crop=CropImage(key=",".join(region.keys),bbox=bbox,image=image)
+            for key in region.keys:
+                result[key].append(crop)
+        return result
+
+    def invoke(self,keys:List[str],scale=1.02,p_width=1.0,p_height=1.0)->Dict[str,List]:
+        """裁剪并保存图片，返回 {关键词: 图片路径列表}"""
+        crops=self.invoke_in_memory(keys=keys,scale=scale,p_width=p_width,p_height=p_height)
+        return {
+            key:[crop.persist() for crop in key_crops]
+            for key,key_crops in crops.items()
+        }
@@ -3,26 +3,55 @@ import os
 import time
 import json
 import tqdm
-from typing import List
+import threading
+from typing import List,Dict,Tuple,Any,Optional,Literal
 from lxml import etree
 
 
 from pipelines.base import PipeLine
 from parser.text_parser import MapTextParser
-from parser.table_parser import MapTableparser
+from parser.table_parser import MapTableparser,table_completeness_score,table_to_markdown
 from parser.facade_parser import FacadeParser
 from rag.module.indexing.loader.pdf_loader import CustomizedOcrPdfLoader
 from langchain_community.document_loaders import UnstructuredFileLoader
-from conf.config import DATA_TMP_DIR
+from conf.config import DATA_TMP_DIR,FILE_PARSE_CACHE_FORMAT,TABLE_EXTRACT_MODE,TABLE_VECTOR_MIN_SCORE
 from utils.file import calculate_file_metadata_md5,file_to_markdown,split_paragraphs
 
-from vjmap.services import UploadMAPService,OpenmapService,OpenMapRequestParams
+from vjmap.services import UploadMAPService,OpenmapService,OpenMapRequestParams,ExportLayoutService
 from vjmap.items import (
     QueryItem
 )
 from extraction.context import DwgFileContext,BaseFileContext,FacadeContext
 from splitter.cad_splitter import TitleBelowTableSplitter
 from utils.file import image_to_markdown
+from utils.columnar import save_query_items,load_query_items,exists_query_items
+
+
+def extract_title_table(title:str,text_list:List[QueryItem],mapid:str,table_parser:MapTableparser,
+                        mode:str=TABLE_EXTRACT_MODE,min_score:float=TABLE_VECTOR_MIN_SCORE)->str:
+    """
+    抽取标题下方的表格并转为 markdown
+    vector_first 模式下先用矢量数据还原表格，完整度评分达到阈值直接使用，否则再出图走 VL 识别
+    """
+    title_splitter=TitleBelowTableSplitter(
+        title=title,
+        text_list=text_list,
+        mapid=mapid
+    )
+    if not title_splitter.title_query_item:
+        return ""
+    if mode=="vector_first":
+        bounds=title_splitter.split()
+        table_item=table_parser.find_table_in_bounds(bounds) if bounds else None
+        if table_item:
+            score=table_completeness_score(table_item)
+            print(f"表格【{title}】矢量抽取完整度: {score:.2f}")
+            if score>=min_score:
+                return table_to_markdown(table_item)
+    path=title_splitter.save_to_image()
+    if not path:
+        return ""
+    return image_to_markdown(image_path=path)
 
 
 class FileParsePipeLine(PipeLine):
@@ -35,8 +64,12 @@ class FileParsePipeLine(PipeLine):
         self.paragraphs=[]
         self._tmp_check()
     
+    def _cache_key(self)->str:
+        """缓存键，默认由文件元数据计算"""
+        return calculate_file_metadata_md5(self.file_path)
+    
     def _tmp_check(self):
-        md5=calculate_file_metadata_md5(self.file_path)
+        md5=self._cache_key()
         ab_dir=os.path.join(DATA_TMP_DIR,self.tmp_dir)
         os.makedirs(ab_dir,exist_ok=True)
         tmp_file_path=os.path.join(ab_dir,f"{md5}.json")
@@ -64,8 +97,13 @@ class FileParsePipeLine(PipeLine):
         
         # 判断是否存在文本列表对象数组
         if hasattr(self,'text_list') and len(self.content_list)>0:
+            # 优先读取列式缓存，不存在时读取json缓存
+            columnar_dir_path=os.path.join(ab_dir,f"{md5}_text_list")
             tmp_file_path=os.path.join(ab_dir,f"{md5}_text_list.json")
-            if os.path.exists(tmp_file_path):
+            if exists_query_items(columnar_dir_path):
+                self.text_list=load_query_items(columnar_dir_path)
+                print(f"读取缓存【{columnar_dir_path}】")
+            elif os.path.exists(tmp_file_path):
                 with open(tmp_file_path,'r',encoding="utf-8") as fp:
                     self.text_list=[QueryItem.from_dict(item) for item in json.loads(fp.read())]
                     print(f"读取缓存【{tmp_file_path}】")
@@ -79,7 +117,7 @@ class FileParsePipeLine(PipeLine):
                 
         
     def _tmp(self):
-        md5=calculate_file_metadata_md5(self.file_path)
+        md5=self._cache_key()
         ab_dir=os.path.join(DATA_TMP_DIR,self.tmp_dir)
         os.makedirs(ab_dir,exist_ok=True)
         tmp_file_path=os.path.join(ab_dir,f"{md5}.json")
@@ -88,11 +126,16 @@ class FileParsePipeLine(PipeLine):
                 fp.write(json.dumps(self.content_list,ensure_ascii=False,indent=4))
         # 判断是否存在文本列表对象数组
         if hasattr(self,'text_list') and len(self.content_list)>0:
-            tmp_file_path=os.path.join(ab_dir,f"{md5}_text_list.json")
-            if not os.path.exists(tmp_file_path):
-                with open(tmp_file_path,'w',encoding="utf-8") as fp:
-                    text_list=[item.to_dict() for item in self.text_list]
-                    fp.write(json.dumps(text_list,ensure_ascii=False,indent=4))
+            if FILE_PARSE_CACHE_FORMAT=="columnar":
+                columnar_dir_path=os.path.join(ab_dir,f"{md5}_text_list")
+                if not exists_query_items(columnar_dir_path):
+                    save_query_items(self.text_list,columnar_dir_path)
+            else:
+                tmp_file_path=os.path.join(ab_dir,f"{md5}_text_list.json")
+                if not os.path.exists(tmp_file_path):
+                    with open(tmp_file_path,'w',encoding="utf-8") as fp:
+                        text_list=[item.to_dict() for item in self.text_list]
+                        fp.write(json.dumps(text_list,ensure_ascii=False,indent=4))
         # 判断是否存在文本列表对象数组
         if hasattr(self,'paragraphs') and len(self.paragraphs)>0:
             tmp_file_path=os.path.join(ab_dir,f"{md5}_paragraphs.json")
@@ -175,25 +218,24 @@ class DwgTextParsePipeLine(FileParsePipeLine):
             if label and label=="建筑设计总说明":
                 table_title_list=["技术经济指标","结构设计等级","建筑分类等级",'结构类型、设计分类等级']
                 for title in tqdm.tqdm(table_title_list,desc=f"正在抽取【{label}】相关表格"):
-                    title_splitter=TitleBelowTableSplitter(
+                    res=extract_title_table(
                         title=title,
                         text_list=self.text_list,
-                        mapid=self.mapid
+                        mapid=self.mapid,
+                        table_parser=self.map_table_parser
                     )
-                    path=title_splitter.save_to_image()
-                    if path:
-                        res=image_to_markdown(image_path=path)
-                        if res:
-                            self.paragraphs.append({
-                                "title": title,
-                                "content": res
-                            })
+                    if res:
+                        self.paragraphs.append({
+                            "title": title,
+                            "content": res
+                        })
             if label and "立面" in label:
                 self.facade_content_list=self.facade_parser.load()
         except Exception as e:
             print(e)
             raise RuntimeError("执行异常")
-        finally:
+        else:
+            # 只在解析成功时写入缓存，避免异常时的半成品结果被后续任务读取
             self._tmp()
         file_context=DwgFileContext(
             file_path=self.file_path,
@@ -208,11 +250,16 @@ class DwgTextParsePipeLine(FileParsePipeLine):
         return file_context
     
 class DwgTextParseByMapIdAndFileIdPipeLine(FileParsePipeLine):
-    def __init__(self,mapid:str,fileid:str,uploadname:str,min_distence:int=2000):
+    def __init__(self,mapid:str,fileid:str,uploadname:str,min_distence:int=2000,cache_key:Optional[str]=None):
+        """
+        cache_key: 解析结果的缓存键；子布局每次导出的 mapid 都不同，需由调用方给出稳定的键（如 父fileid_布局序号），
+                   为空时不使用缓存
+        """
         assert mapid and fileid and uploadname
         self.mapid=mapid
         self.fileid=fileid
         self.uploadname=uploadname
+        self.cache_key=cache_key
         self.content_list=[]
         self.text_list=[]
         self.table_content_list=[]
@@ -257,25 +304,23 @@ class DwgTextParseByMapIdAndFileIdPipeLine(FileParsePipeLine):
             if label and label=="建筑设计总说明":
                 table_title_list=["技术经济指标","结构设计等级","建筑分类等级",'结构类型、设计分类等级']
                 for title in tqdm.tqdm(table_title_list,desc=f"正在抽取【{label}】相关表格"):
-                    title_splitter=TitleBelowTableSplitter(
+                    res=extract_title_table(
                         title=title,
                         text_list=self.text_list,
-                        mapid=self.mapid
+                        mapid=self.mapid,
+                        table_parser=self.map_table_parser
                     )
-                    path=title_splitter.save_to_image()
-                    if path:
-                        res=image_to_markdown(image_path=path)
-                        if res:
-                            self.paragraphs.append({
-                                "title": title,
-                                "content": res
-                            })
+                    if res:
+                        self.paragraphs.append({
+                            "title": title,
+                            "content": res
+                        })
             if label and "立面" in label:
                 self.facade_content_list=self.facade_parser.load()
         except Exception as e:
             print(e)
             raise RuntimeError("执行异常")
-        finally:
+        else:
             self._tmp()
         file_context=DwgFileContext(
             file_path=self.file_path,
@@ -289,10 +334,100 @@ class DwgTextParseByMapIdAndFileIdPipeLine(FileParsePipeLine):
         )
         return file_context
     
+    def _cache_key(self)->str:
+        return self.cache_key
+    
     def _tmp_check(self):
-        pass
+        if self.cache_key:
+            super()._tmp_check()
+    
     def _tmp(self):
-        pass
+        if self.cache_key:
+            super()._tmp()
+
+
+class ChildLayoutCache:
+    """
+    子布局缓存
+    以 (父图 fileid, 布局序号) 为键，缓存布局导出结果（子图 mapid/fileid）与解析后的子图上下文。
+    内存中缓存当前任务内的结果，磁盘上缓存布局导出结果，子图解析结果由 DwgTextParseByMapIdAndFileIdPipeLine 落盘，
+    同一图纸的布局导出与解析只执行一次
+    """
+    def __init__(self,cache_dir:str=None):
+        self.cache_dir=cache_dir or os.path.join(DATA_TMP_DIR,"child_layout")
+        os.makedirs(self.cache_dir,exist_ok=True)
+        self._contexts:Dict[Tuple[str,int],Optional[DwgFileContext]]={}
+        self._lock=threading.Lock()
+        self._key_locks:Dict[Any,threading.Lock]={}
+    
+    def _key_lock(self,key)->threading.Lock:
+        with self._lock:
+            if key not in self._key_locks:
+                self._key_locks[key]=threading.Lock()
+            return self._key_locks[key]
+    
+    def _index_path(self,fileid:str)->str:
+        return os.path.join(self.cache_dir,f"{fileid}.json")
+    
+    def _load_index(self,fileid:str)->dict:
+        index_path=self._index_path(fileid)
+        if os.path.exists(index_path):
+            with open(index_path,'r',encoding="utf-8") as fp:
+                return json.loads(fp.read())
+        return {"layout_number":None,"layouts":{}}
+    
+    def _save_index(self,fileid:str,index:dict):
+        index_path=self._index_path(fileid)
+        tmp_path=f"{index_path}.tmp"
+        with open(tmp_path,'w',encoding="utf-8") as fp:
+            fp.write(json.dumps(index,ensure_ascii=False,indent=4))
+        os.replace(tmp_path,index_path)
+    
+    def get_layout_number(self,mapid:str,fileid:str,uploadname:str)->int:
+        """获取图纸布局数量"""
+        with self._key_lock(fileid):
+            index=self._load_index(fileid)
+            if index.get("layout_number") is None:
+                index["layout_number"]=ExportLayoutService().get_current_map_layout_number(mapid,fileid,uploadname)
+                self._save_index(fileid,index)
+            return index["layout_number"]
+    
+    def get_children_layout(self,mapid:str,fileid:str,uploadname:str,layoutIndex:int)->Dict[Literal["mapid","fileid"],str]:
+        """获取子布局导出结果（导出失败的结果不缓存）"""
+        with self._key_lock(fileid):
+            index=self._load_index(fileid)
+            children_layout=index["layouts"].get(str(layoutIndex))
+            if children_layout:
+                return children_layout
+            children_layout=ExportLayoutService().get_children_layout(mapid,fileid,uploadname,layoutIndex)
+            if children_layout.get("mapid") and children_layout.get("fileid"):
+                index["layouts"][str(layoutIndex)]=children_layout
+                self._save_index(fileid,index)
+            return children_layout
+    
+    def get_children_context(self,mapid:str,fileid:str,uploadname:str,layoutIndex:int)->Optional[DwgFileContext]:
+        """获取子布局解析后的上下文，导出失败时返回 None"""
+        key=(fileid,layoutIndex)
+        if key in self._contexts:
+            return self._contexts[key]
+        with self._key_lock(key):
+            if key in self._contexts:
+                return self._contexts[key]
+            children_layout=self.get_children_layout(mapid,fileid,uploadname,layoutIndex)
+            children_mapid=children_layout.get("mapid")
+            children_fileid=children_layout.get("fileid")
+            children_context=None
+            if children_mapid and children_fileid:
+                pipeline=DwgTextParseByMapIdAndFileIdPipeLine(
+                    mapid=children_mapid,
+                    fileid=children_fileid,
+                    uploadname=children_fileid,
+                    cache_key=f"{fileid}_{layoutIndex}"
+                )
+                children_context=pipeline.invoke()
+            self._contexts[key]=children_context
+            return children_context
+
     
 class DocParsePipeLine(FileParsePipeLine):
     def __init__(self,file_path:str):
@@ -323,7 +458,7 @@ class DocParsePipeLine(FileParsePipeLine):
         except Exception as e:
             print(e)
             raise RuntimeError("执行异常")
-        finally:
+        else:
             self._tmp()
         file_context=BaseFileContext(
             file_path=self.file_path,
@@ -355,7 +490,7 @@ class TXTParsePipeLine(FileParsePipeLine):
         except Exception as e:
             print(e)
             raise RuntimeError("执行异常")
-        finally:
+        else:
             self._tmp()
         file_context=BaseFileContext(
             file_path=self.file_path,
@@ -385,7 +520,7 @@ class PDFParsePipeLine(FileParsePipeLine):
         except Exception as e:
             print(e)
             raise RuntimeError("执行异常")
-        finally:
+        else:
             self._tmp()
         file_context=BaseFileContext(
             file_path=self.file_path,
@@ -417,7 +552,7 @@ class XmlFParsePipeLine(FileParsePipeLine):
         except Exception as e:
             print(e)
             raise RuntimeError("执行异常")
-        finally:
+        else:
             self._tmp()
         file_context=BaseFileContext(
             file_path=self.file_path,
@@ -451,7 +586,7 @@ class PngParsePipeLine(FileParsePipeLine):
         except Exception as e:
             print(e)
             raise RuntimeError("执行异常")
-        finally:
+        else:
             self._tmp()
         file_context=BaseFileContext(
             file_path=self.file_path,
@@ -485,7 +620,7 @@ class JpegParsePipeLine(FileParsePipeLine):
         except Exception as e:
             print(e)
             raise RuntimeError("执行异常")
-        finally:
+        else:
             self._tmp()
         file_context=BaseFileContext(
             file_path=self.file_path,
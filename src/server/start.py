@@ -8,6 +8,7 @@ from scalar_fastapi import get_scalar_api_reference
 from server.router.file_router import router as file_router
 from server.router.task_router import router as task_router
 from database.base import create_tables
+from database.repository.sys_file_repository import backfill_file_paths
 
 # 导入所有数据库模型，确保表定义被注册
 from database.models import sys_file_model, task_model
@@ -86,6 +87,7 @@ async def startup_event():
     try:
         create_tables()
         print("数据库表初始化完成")
+        print(f"物化路径回填完成: {backfill_file_paths()} 条")
     except Exception as e:
         print(f"数据库表初始化失败: {str(e)}")
         raise
@@ -15,6 +15,8 @@ import logging
 from extraction.identifier import CADContentIdentifier
 from field_resgister import FIELDS_POOL
 from server.task_exec.message import Message
+from pipelines.cut_off_pipelines import cleanup_crop_images
+from utils.file import collect_image_paths
 import threading
 
 # 配置日志
@@ -61,6 +63,25 @@ def realfile_name_in_mapping(file_name:str):
     return None
 
 
+def cleanup_unreferenced_images(output_dir: str = None) -> int:
+    """清理过期的裁剪图片，数据库任务结果和输出目录结果文件中引用的图片保留"""
+    keep = set()
+    for task_result in task_repo.get_all_task_results():
+        keep |= collect_image_paths(task_result)
+    if output_dir and os.path.isdir(output_dir):
+        for name in os.listdir(output_dir):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(output_dir, name), "r", encoding="utf-8") as fp:
+                    keep |= collect_image_paths(json.load(fp))
+            except (OSError, ValueError) as e:
+                # 结果文件无法读取时不清理，避免误删其引用的图片
+                logger.error(f"读取结果文件失败，跳过图片清理: {name}, {e}")
+                return 0
+    return cleanup_crop_images(keep)
+
+
 def _cad_identify_worker(task_id: str, queue: multiprocessing.Queue, params: Dict[str, Any]):
     """CAD识别任务的工作函数（独立于类）"""
     import traceback
@@ -314,6 +335,10 @@ class CADIdentifyTask:
         task_repo.update_task_result(self.task_id, data)
         self.success_callback(self.task)
         logger.info(f"任务成功完成！")
+        try:
+            cleanup_unreferenced_images(self.output_dir)
+        except Exception as e:
+            logger.error(f"清理过期图片失败: {e}")
     
     def _handle_fail(self, data: Any):
         """处理失败消息"""
@@ -1,5 +1,6 @@
 import os
 import json
+import time
 import tqdm
 
 from splitter.base import Splitter
@@ -13,17 +14,21 @@ from vjmap.services import (
     MapConstDataService,
     QueryFeaturesParams,
     QueryFeaturesService,
-    MapPngByBoundsParams,
-    MapPngByBoundsService
+    MapPngByBoundsParams
 )
 
 from vjmap.utils import(
     geoPointFromString
 )
+from vjmap.renderer import MAP_ENTITY_SNAPSHOTS,get_map_png_service
 
 from typing import Dict,List
 
 
+# 整图线条查询的实体类型（查询完整类型时登记到本地出图快照）
+LINE_ENT_TYPES=['AcDbLine', 'AcDbPolyline', 'AcDb2dPolyline', 'AcDb3dPolyline']
+
+
 class CADSubMapSplitter(Splitter):
     def __init__(self,mapid:str,version:str="v1",geom:bool=True,level=0,**kwargs):
         super(Splitter).__init__(**kwargs)
@@ -34,7 +39,7 @@ class CADSubMapSplitter(Splitter):
         self.ent_type_id_map={}
         self.map_rects=[]
         self.all_rects=[]
-        self.query_ent_types=['AcDbLine', 'AcDbPolyline', 'AcDb2dPolyline', 'AcDb3dPolyline']
+        self.query_ent_types=list(LINE_ENT_TYPES)
         self.query_ent_type_map_items:Dict[str,List[QueryItem]]={}
         # self.query_ent_types=['AcDbPolyline']
         
@@ -98,6 +103,8 @@ class CADSubMapSplitter(Splitter):
                 self.query_ent_type_map_items[item.name].append(item)
             else:
                 self.query_ent_type_map_items[item.name]=[item]
+        if set(LINE_ENT_TYPES)<=set(self.query_ent_types):
+            MAP_ENTITY_SNAPSHOTS.register_lines(self.mapid,result)
         return result
 
     
@@ -262,18 +269,22 @@ class CADSubMapSplitter(Splitter):
         map_rects=self.split()
         # 对子图进行排序
         map_rects=sorted(map_rects,key=lambda rect:(rect["bounds"].miny,rect["bounds"].minx))
-        mapPngByBoundsService=MapPngByBoundsService(self.mapid,self.version,self.geom)
-        idx=1
-        for rect in tqdm.tqdm(map_rects,desc=f"子图转图片中【{save_dir}】"):
-            url=mapPngByBoundsService.map_to_img_url(params=MapPngByBoundsParams(
-                width=width,
-                height=height,
-                bbox=rect['bounds'].to_str()
-            ))
-            image_name=f"{self.mapid}_{idx:03d}.png"
-            end_save_dir=f"{save_dir}/{self.mapid}"
-            mapPngByBoundsService.url_to_img(img_url=url,image_name=image_name,save_dir=end_save_dir)
-            idx+=1
+        mapPngByBoundsService=get_map_png_service(self.mapid,self.version,self.geom)
+        end_save_dir=f"{save_dir}/{self.mapid}"
+        jobs=[
+            (
+                MapPngByBoundsParams(
+                    width=width,
+                    height=height,
+                    bbox=rect['bounds'].to_str()
+                ),
+                os.path.join(end_save_dir,f"{self.mapid}_{idx:03d}.png")
+            )
+            for idx,rect in enumerate(map_rects,start=1)
+        ]
+        # 并发导出，文件名按排序后的序号生成，与串行导出一致
+        with tqdm.tqdm(total=len(jobs),desc=f"子图转图片中【{save_dir}】") as pbar:
+            mapPngByBoundsService.export_images(jobs,on_done=lambda _:pbar.update(1))
         return True
     
 class TitleBelowTableSplitter(CADSubMapSplitter):
@@ -301,9 +312,7 @@ class TitleBelowTableSplitter(CADSubMapSplitter):
             title_bounds=EnvelopBounds().from_string(title_bounds)
         filtered_lines=[]
         for line in lines:
-            if isinstance(line.bounds, str):
-                line.bounds=EnvelopBounds().from_string(line.bounds)
-            if title_bounds.miny>line.bounds.maxy:
+            if title_bounds.miny>line.parse_bounds().maxy:
                 filtered_lines.append(line)
         return filtered_lines
 
@@ -342,10 +351,15 @@ class TitleBelowTableSplitter(CADSubMapSplitter):
         if not bounds:
             return None
         # 对子图进行排序
-        mapPngByBoundsService=MapPngByBoundsService(self.mapid,self.version,self.geom)
-        url=mapPngByBoundsService.map_to_img_url(params=MapPngByBoundsParams(
+        mapPngByBoundsService=get_map_png_service(self.mapid,self.version,self.geom)
+        if not image_name:
+            image_name=f"{str(time.time()).replace('.','')}.png"
+        # 单张导出同样走带重试的导出流程，失败返回 None
+        image_path=mapPngByBoundsService.export_images([(
+            MapPngByBoundsParams(
                 width=width,
                 bbox=bounds.scale(1.02).to_str(),
-        ))
-        image_path=mapPngByBoundsService.url_to_img(img_url=url,image_name=image_name,save_dir=save_dir)
+            ),
+            os.path.join(save_dir,image_name)
+        )])[0]
         return image_path
\ No newline at end of file
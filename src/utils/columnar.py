@@ -0,0 +1,237 @@
+"""
+列式缓存：将 QueryItem 列表按列存储为 .npy 文件，读取时内存映射
+
+目录结构（每列一个文件）：
+    bounds.npy              (n,4) float64，缺失为 NaN
+    points.npy/points_offsets.npy   坐标点 (m,2) float64 及每行偏移
+    {数值列}.npy            float64，缺失为 NaN
+    {字符串列}.bin/{字符串列}_offsets.npy/{字符串列}_mask.npy  字符串表
+
+读取时返回 ColumnarQueryItems 惰性视图，各列保持内存映射，只有被访问的行才还原为 QueryItem
+"""
+import os
+import json
+import math
+import shutil
+import numpy as np
+from collections.abc import MutableSequence
+from typing import List, Optional
+from vjmap.items import QueryItem, EnvelopBounds, GeoPoint
+
+
+# 整数列（以 float64 存储，NaN 表示 None）
+INT_COLUMNS = ["alpha", "color", "colorIndex", "id", "layerindex", "lineWidth", "thickness"]
+# 浮点列
+FLOAT_COLUMNS = ["length", "linetypeScale"]
+# 字符串列（bounds_str/points_str 用于保存尚未解析的原始字符串）
+STR_COLUMNS = ["envelop", "geojson", "linetype", "name", "objectid", "xdata", "text", "bounds_str", "points_str"]
+
+
+def _load_array(path: str) -> np.ndarray:
+    """内存映射读取 .npy；空数组无法映射时退化为普通读取"""
+    try:
+        return np.load(path, mmap_mode="r")
+    except ValueError:
+        return np.load(path)
+
+
+def _write_str_column(dir_path: str, name: str, values: List[Optional[str]]):
+    """字符串列：utf-8 拼接为一个二进制块 + 偏移数组 + 空值掩码"""
+    encoded = [v.encode("utf-8") if v is not None else b"" for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    if encoded:
+        offsets[1:] = np.cumsum([len(b) for b in encoded])
+    mask = np.array([v is not None for v in values], dtype=np.bool_)
+    with open(os.path.join(dir_path, f"{name}.bin"), "wb") as fp:
+        fp.write(b"".join(encoded))
+    np.save(os.path.join(dir_path, f"{name}_offsets.npy"), offsets)
+    np.save(os.path.join(dir_path, f"{name}_mask.npy"), mask)
+
+
+class _StrColumn:
+    """字符串列：二进制块内存映射，按行解码"""
+    def __init__(self, dir_path: str, name: str):
+        blob_path = os.path.join(dir_path, f"{name}.bin")
+        self.blob = np.memmap(blob_path, dtype=np.uint8, mode="r") if os.path.getsize(blob_path) > 0 else np.empty(0, dtype=np.uint8)
+        self.offsets = _load_array(os.path.join(dir_path, f"{name}_offsets.npy"))
+        self.mask = _load_array(os.path.join(dir_path, f"{name}_mask.npy"))
+
+    def __getitem__(self, row: int) -> Optional[str]:
+        if not self.mask[row]:
+            return None
+        return self.blob[int(self.offsets[row]):int(self.offsets[row + 1])].tobytes().decode("utf-8")
+
+
+def save_query_items(items: List[QueryItem], dir_path: str):
+    """按列保存 QueryItem 列表；先写临时目录再原子替换，避免读到半成品"""
+    tmp_dir = f"{dir_path}.tmp"
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    os.makedirs(tmp_dir, exist_ok=True)
+    n = len(items)
+
+    # 边界：EnvelopBounds 存为浮点数组，原始字符串存入字符串列
+    bounds = np.full((n, 4), np.nan, dtype=np.float64)
+    bounds_str = [None] * n
+    # 坐标点：GeoPoint 列表展平为 (m,2)，原始字符串存入字符串列
+    points_offsets = np.zeros(n + 1, dtype=np.int64)
+    points_flat = []
+    points_str = [None] * n
+    points_mask = np.zeros(n, dtype=np.bool_)
+    for i, item in enumerate(items):
+        if isinstance(item.bounds, EnvelopBounds):
+            values = (item.bounds.minx, item.bounds.miny, item.bounds.maxx, item.bounds.maxy)
+            if None not in values:
+                bounds[i] = values
+        elif item.bounds is not None:
+            bounds_str[i] = item.bounds
+        if isinstance(item.points, list):
+            points_mask[i] = True
+            points_flat.extend((p.x, p.y) for p in item.points)
+        elif item.points is not None:
+            points_str[i] = item.points
+        points_offsets[i + 1] = len(points_flat)
+    np.save(os.path.join(tmp_dir, "bounds.npy"), bounds)
+    np.save(os.path.join(tmp_dir, "points.npy"), np.array(points_flat, dtype=np.float64).reshape(-1, 2))
+    np.save(os.path.join(tmp_dir, "points_offsets.npy"), points_offsets)
+    np.save(os.path.join(tmp_dir, "points_mask.npy"), points_mask)
+
+    for name in INT_COLUMNS + FLOAT_COLUMNS:
+        column = np.array(
+            [getattr(item, name) if getattr(item, name) is not None else np.nan for item in items],
+            dtype=np.float64
+        )
+        np.save(os.path.join(tmp_dir, f"{name}.npy"), column)
+    # 布尔列：-1 表示 None
+    np.save(
+        os.path.join(tmp_dir, "isEnvelop.npy"),
+        np.array([-1 if item.isEnvelop is None else int(item.isEnvelop) for item in items], dtype=np.int8)
+    )
+
+    for name in STR_COLUMNS:
+        if name == "bounds_str":
+            values = bounds_str
+        elif name == "points_str":
+            values = points_str
+        else:
+            values = [getattr(item, name) for item in items]
+        _write_str_column(tmp_dir, name, values)
+
+    with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as fp:
+        fp.write(json.dumps({"count": n}))
+
+    if os.path.exists(dir_path):
+        shutil.rmtree(dir_path)
+    os.replace(tmp_dir, dir_path)
+
+
+class ColumnarQueryItems(MutableSequence):
+    """
+    列式缓存的惰性视图：各列保持内存映射，按下标访问时才还原为 QueryItem（还原后缓存，修改会保留）
+    bounds_array()/texts 直接由列数据构建，QueryItemCollection 可不还原对象完成空间与关键字筛选
+    """
+    def __init__(self, dir_path: str):
+        with open(os.path.join(dir_path, "meta.json"), "r", encoding="utf-8") as fp:
+            n = json.loads(fp.read())["count"]
+        self._bounds = _load_array(os.path.join(dir_path, "bounds.npy"))
+        self._points = _load_array(os.path.join(dir_path, "points.npy"))
+        self._points_offsets = _load_array(os.path.join(dir_path, "points_offsets.npy"))
+        self._points_mask = _load_array(os.path.join(dir_path, "points_mask.npy"))
+        self._numbers = {name: _load_array(os.path.join(dir_path, f"{name}.npy")) for name in INT_COLUMNS + FLOAT_COLUMNS}
+        self._is_envelop = _load_array(os.path.join(dir_path, "isEnvelop.npy"))
+        self._strs = {name: _StrColumn(dir_path, name) for name in STR_COLUMNS}
+        # 行号（-1 表示后续插入、不在列数据中的对象）及已还原的对象
+        self._rows: List[int] = list(range(n))
+        self._items: List[Optional[QueryItem]] = [None] * n
+        self._texts: Optional[List[str]] = None
+
+    def _materialize(self, row: int) -> QueryItem:
+        data = {}
+        for name in INT_COLUMNS + FLOAT_COLUMNS:
+            value = float(self._numbers[name][row])
+            data[name] = None if math.isnan(value) else (int(value) if name in INT_COLUMNS else value)
+        is_envelop = int(self._is_envelop[row])
+        data["isEnvelop"] = None if is_envelop < 0 else bool(is_envelop)
+        for name in ("envelop", "geojson", "linetype", "name", "objectid", "xdata", "text"):
+            data[name] = self._strs[name][row]
+        item = QueryItem(**data)
+        bounds = self._bounds[row]
+        if not np.isnan(bounds).any():
+            minx, miny, maxx, maxy = (float(v) for v in bounds)
+            item.bounds = EnvelopBounds(minx=minx, miny=miny, maxx=maxx, maxy=maxy)
+        else:
+            item.bounds = self._strs["bounds_str"][row]
+        if self._points_mask[row]:
+            start, end = int(self._points_offsets[row]), int(self._points_offsets[row + 1])
+            item.points = [GeoPoint(float(x), float(y)) for x, y in self._points[start:end]]
+        else:
+            item.points = self._strs["points_str"][row]
+        return item
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        item = self._items[index]
+        if item is None:
+            item = self._materialize(self._rows[index])
+            self._items[index] = item
+        return item
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            raise TypeError("ColumnarQueryItems 不支持切片赋值")
+        self._items[index] = value
+        self._texts = None
+
+    def __delitem__(self, index):
+        del self._rows[index]
+        del self._items[index]
+        self._texts = None
+
+    def insert(self, index, value):
+        self._rows.insert(index, -1)
+        self._items.insert(index, value)
+        self._texts = None
+
+    @property
+    def texts(self) -> List[str]:
+        """各行文本（未还原的行直接读字符串列）"""
+        if self._texts is None:
+            text_column = self._strs["text"]
+            self._texts = [
+                (item.text if item is not None else text_column[row]) or ""
+                for row, item in zip(self._rows, self._items)
+            ]
+        return self._texts
+
+    def bounds_array(self) -> np.ndarray:
+        """(n,4) 边界数组；已还原的对象以对象当前的 bounds 为准"""
+        rows = np.array(self._rows, dtype=np.int64)
+        result = np.full((len(rows), 4), np.nan, dtype=np.float64)
+        if len(rows) > 0:
+            valid = rows >= 0
+            result[valid] = self._bounds[rows[valid]]
+        bounds_str_mask = self._strs["bounds_str"].mask
+        for idx, item in enumerate(self._items):
+            if item is None and (not np.isnan(result[idx]).any() or not bounds_str_mask[rows[idx]]):
+                continue
+            # 已还原的对象，或以字符串保存的 bounds，需要解析对象
+            item = self[idx]
+            bounds = item.parse_bounds() if item.bounds is not None else None
+            if bounds is not None and None not in (bounds.minx, bounds.miny, bounds.maxx, bounds.maxy):
+                result[idx] = (bounds.minx, bounds.miny, bounds.maxx, bounds.maxy)
+            else:
+                result[idx] = np.nan
+        return result
+
+
+def load_query_items(dir_path: str) -> ColumnarQueryItems:
+    """内存映射读取列式缓存，返回惰性视图（访问时才还原 QueryItem）"""
+    return ColumnarQueryItems(dir_path)
+
+
+def exists_query_items(dir_path: str) -> bool:
+    return os.path.exists(os.path.join(dir_path, "meta.json"))
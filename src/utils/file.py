@@ -3,6 +3,7 @@ import os
 import sys
 import re
 import base64
+import time
 from typing import List
 from pathlib import Path
 from typing import Optional
@@ -10,6 +11,8 @@ from markitdown import MarkItDown, StreamInfo, DocumentConverterResult
 from utils.openai import openai_chat_by_api,InferenceParams
 from conf.config import VL_MODEL_NAME,DATA_TMP_DIR
 from common.prompts import markdown_transfrom_prompt,text_transfrom_prompt
+from utils.image import prepare_image,read_image
+from utils.vl_cache import VL_RESULT_CACHE
 
 
 def calculate_file_metadata_md5(file_path: str) -> str:
@@ -122,15 +125,96 @@ def split_paragraphs(text):
 
 
 def image_to_base64(image_path):
-    """将图片转换为base64字符串"""
+    """将图片（文件路径或二进制内容）转换为base64字符串"""
+    if isinstance(image_path, (bytes, bytearray)):
+        return base64.b64encode(image_path).decode('utf-8')
     with open(image_path, "rb") as image_file:
         base64_image = base64.b64encode(image_file.read()).decode('utf-8')
     return base64_image
 
+def image_to_vl_base64(image_path, data_type="png"):
+    """按 VL 预处理配置压缩图片后转为base64，返回 (base64字符串, 图片格式)"""
+    image, data_type = prepare_image(read_image(image_path), data_type=data_type)
+    return base64.b64encode(image).decode('utf-8'), data_type
+
+def image_exists(image_path) -> bool:
+    """图片是否可用：二进制内容非空，或文件路径存在"""
+    if isinstance(image_path, (bytes, bytearray)):
+        return len(image_path) > 0
+    return bool(image_path) and os.path.exists(image_path)
+
+def save_image_bytes(image: bytes, save_dir: str, suffix: str = ".png") -> str:
+    """
+    将图片内容保存到目录，文件名为内容md5（相同图片只保存一份）
+    :return: 图片绝对路径
+    """
+    os.makedirs(save_dir, exist_ok=True)
+    save_path = os.path.abspath(os.path.join(save_dir, f"{hashlib.md5(image).hexdigest()}{suffix}"))
+    if not os.path.exists(save_path):
+        tmp_path = f"{save_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as fp:
+            fp.write(image)
+        os.replace(tmp_path, save_path)
+    else:
+        # 复用已有图片时刷新修改时间，避免刚被引用的图片按过期清理
+        try:
+            os.utime(save_path, None)
+        except OSError:
+            pass
+    return save_path
+
+def collect_image_paths(data, suffixes=(".png", ".jpg", ".jpeg", ".webp")) -> set:
+    """递归收集结果数据（dict/list/字符串）中引用的图片路径"""
+    paths = set()
+    stack = [data]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, dict):
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple)):
+            stack.extend(item)
+        elif isinstance(item, str) and item.lower().endswith(suffixes):
+            paths.add(os.path.abspath(item))
+    return paths
+
+def cleanup_orphan_images(image_dir: str, max_age_seconds: float, keep: Optional[set] = None, recursive: bool = True) -> int:
+    """
+    清理目录中超过保留时长且未被引用的图片（以及写入中断遗留的临时文件）
+    :param image_dir: 图片目录
+    :param max_age_seconds: 保留时长（秒），按最后修改时间计算
+    :param keep: 仍被引用、不能删除的图片路径
+    :return: 删除的文件数
+    """
+    if not os.path.isdir(image_dir):
+        return 0
+    keep = {os.path.abspath(path) for path in (keep or set())}
+    deadline = time.time() - max_age_seconds
+    removed = 0
+    walker = os.walk(image_dir) if recursive else [(image_dir, [], os.listdir(image_dir))]
+    for root, _, files in walker:
+        for name in files:
+            if not name.endswith((".png", ".jpg", ".jpeg", ".webp", ".tmp")):
+                continue
+            path = os.path.abspath(os.path.join(root, name))
+            if path in keep:
+                continue
+            try:
+                if os.path.getmtime(path) < deadline:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                continue
+    return removed
+
 def image_to_markdown(image_path,data_type="png"):
-    if not os.path.exists(image_path):
+    if not image_exists(image_path):
         return ""
-    base64_image=image_to_base64(image_path)
+    image=read_image(image_path)
+    cache_key=VL_RESULT_CACHE.key(image,VL_MODEL_NAME,"你是表格识别助手",markdown_transfrom_prompt)
+    cached=VL_RESULT_CACHE.get(cache_key)
+    if cached is not None:
+        return cached
+    base64_image,data_type=image_to_vl_base64(image,data_type)
     try:
         res=openai_chat_by_api(
             model_name=VL_MODEL_NAME,
@@ -160,14 +244,20 @@ def image_to_markdown(image_path,data_type="png"):
             res= res.replace("```","")
         else:
             res=""
+        VL_RESULT_CACHE.set(cache_key,res)
         return res
     except Exception as e:
         return ""
     
 def image_to_text(image_path,data_type="png"):
-    if not os.path.exists(image_path):
+    if not image_exists(image_path):
         return ""
-    base64_image=image_to_base64(image_path)
+    image=read_image(image_path)
+    cache_key=VL_RESULT_CACHE.key(image,VL_MODEL_NAME,"你是文本提取助手",text_transfrom_prompt)
+    cached=VL_RESULT_CACHE.get(cache_key)
+    if cached is not None:
+        return cached
+    base64_image,data_type=image_to_vl_base64(image,data_type)
     try:
         res=openai_chat_by_api(
             model_name=VL_MODEL_NAME,
@@ -194,14 +284,20 @@ def image_to_text(image_path,data_type="png"):
         )
         if not res:
             res=""
+        VL_RESULT_CACHE.set(cache_key,res)
         return res
     except Exception as e:
         return ""
     
-def image_chat(image_path, prompt):
-    if not os.path.exists(image_path):
+def image_chat(image_path, prompt, data_type="png"):
+    if not image_exists(image_path):
         return ""
-    base64_image=image_to_base64(image_path)
+    image=read_image(image_path)
+    cache_key=VL_RESULT_CACHE.key(image,VL_MODEL_NAME,prompt)
+    cached=VL_RESULT_CACHE.get(cache_key)
+    if cached is not None:
+        return cached
+    base64_image,data_type=image_to_vl_base64(image,data_type)
     res = openai_chat_by_api(
         model_name=VL_MODEL_NAME,
         messages=[
@@ -210,13 +306,14 @@ def image_chat(image_path, prompt):
                 "content": [
                     {
                         "type": "image_url",
-                        "image_url": {"url": f"data:image/png;base64,{base64_image}"}, 
+                        "image_url": {"url": f"data:image/{data_type};base64,{base64_image}"}, 
                     },
                     {"type": "text", "text": prompt},
                 ],
             }
         ]
     )
+    VL_RESULT_CACHE.set(cache_key,res)
     return res
     
 
@@ -0,0 +1,129 @@
+"""
+VL 请求图片预处理
+
+发送给视觉大模型前按配置压缩图片：限制最长边、线稿转灰度、重新编码为 WebP/JPEG，
+只有编码结果更小时才替换原图，并累计统计节省的字节数
+"""
+import io
+from dataclasses import dataclass, asdict
+from typing import Optional, Tuple, Union
+from conf.config import (
+    VL_IMAGE_MAX_SIDE,
+    VL_IMAGE_GRAYSCALE,
+    VL_IMAGE_FORMAT,
+    VL_IMAGE_QUALITY
+)
+from utils.task_stats import TaskStatsScope, add_counts, current_scope
+
+try:
+    from PIL import Image, ImageStat
+except ImportError:  # 未安装 Pillow 时不做预处理，原图发送
+    Image = None
+    ImageStat = None
+
+
+# 灰度判定阈值：HSV 饱和度均值低于该值视为线稿
+GRAYSCALE_SATURATION_THRESHOLD = 16
+
+
+@dataclass
+class ImageEncodeOptions:
+    max_side: int = VL_IMAGE_MAX_SIDE       # 最长边像素，0 表示不缩放
+    grayscale: str = VL_IMAGE_GRAYSCALE     # auto（低饱和度线稿转灰度）/ true / false
+    format: str = VL_IMAGE_FORMAT           # webp / jpeg / png / original
+    quality: int = VL_IMAGE_QUALITY         # WebP/JPEG 压缩质量
+
+
+@dataclass
+class ImageEncodeStats:
+    images: int = 0
+    original_bytes: int = 0
+    encoded_bytes: int = 0
+
+    @property
+    def saved_bytes(self) -> int:
+        return self.original_bytes - self.encoded_bytes
+
+    def to_dict(self):
+        data = asdict(self)
+        data["saved_bytes"] = self.saved_bytes
+        return data
+
+
+class _StatsRecorder:
+    """预处理字节数统计，按任务计入当前统计范围（utils.task_stats）"""
+
+    def record(self, original: int, encoded: int):
+        add_counts("image_encode", "", 1, original, encoded)
+
+    def stats(self, scope: Optional[TaskStatsScope] = None) -> ImageEncodeStats:
+        scope = scope or current_scope()
+        counts = scope.snapshot("image_encode").get(("sum", ""), []) if scope is not None else []
+        if len(counts) < 3:
+            return ImageEncodeStats()
+        return ImageEncodeStats(images=int(counts[0]), original_bytes=int(counts[1]), encoded_bytes=int(counts[2]))
+
+    def report(self, scope: Optional[TaskStatsScope] = None) -> str:
+        s = self.stats(scope)
+        ratio = s.saved_bytes / s.original_bytes * 100 if s.original_bytes > 0 else 0
+        return (f"VL图片预处理: {s.images} 张, 原始 {s.original_bytes/1024:.1f}KB, "
+                f"发送 {s.encoded_bytes/1024:.1f}KB, 节省 {s.saved_bytes/1024:.1f}KB ({ratio:.1f}%)")
+
+
+IMAGE_ENCODE_STATS = _StatsRecorder()
+
+
+def _is_line_drawing(image) -> bool:
+    if image.mode in ("L", "1"):
+        return True
+    hsv = image.convert("RGB").convert("HSV")
+    return ImageStat.Stat(hsv).mean[1] < GRAYSCALE_SATURATION_THRESHOLD
+
+
+def prepare_image(image: bytes, data_type: str = "png", options: ImageEncodeOptions = None) -> Tuple[bytes, str]:
+    """
+    按配置压缩图片
+    :param image: 原图内容
+    :param data_type: 原图格式（png/jpeg 等）
+    :return: (图片内容, 图片格式)，编码后未变小时返回原图
+    """
+    options = options or ImageEncodeOptions()
+    if Image is None or not image:
+        return image, data_type
+    try:
+        img = Image.open(io.BytesIO(image))
+        img.load()
+        if options.max_side and max(img.size) > options.max_side:
+            img.thumbnail((options.max_side, options.max_side), Image.LANCZOS)
+        grayscale = options.grayscale.lower()
+        if grayscale == "true" or (grayscale == "auto" and _is_line_drawing(img)):
+            img = img.convert("L")
+        target = options.format.lower()
+        if target == "original":
+            target = data_type.lower()
+        if target == "jpg":
+            target = "jpeg"
+        if target == "jpeg" and img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        buffer = io.BytesIO()
+        if target in ("webp", "jpeg"):
+            img.save(buffer, format=target.upper(), quality=options.quality)
+        else:
+            img.save(buffer, format=target.upper(), optimize=True)
+        encoded = buffer.getvalue()
+    except Exception as e:
+        print(f"图片预处理失败，使用原图: {e}")
+        return image, data_type
+    if len(encoded) >= len(image):
+        IMAGE_ENCODE_STATS.record(len(image), len(image))
+        return image, data_type
+    IMAGE_ENCODE_STATS.record(len(image), len(encoded))
+    return encoded, target
+
+
+def read_image(image: Union[str, bytes, bytearray]) -> bytes:
+    """读取图片内容（文件路径或二进制内容）"""
+    if isinstance(image, (bytes, bytearray)):
+        return bytes(image)
+    with open(image, "rb") as fp:
+        return fp.read()
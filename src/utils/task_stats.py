@@ -0,0 +1,135 @@
+"""
+任务级统计范围
+
+正则、提示词模板、图片预处理、VL缓存等的计数按任务（统计范围）分别累计，
+同一进程内并发执行多个任务时互不干扰，每个任务的报告只反映本任务。
+
+- 当前范围通过 contextvars 传递，线程池需使用 utils.thread.ContextThreadPoolExecutor 才能把范围带入工作线程
+- 热路径无锁：每个线程在范围内有自己的计数槽，线程退出后计数合并进范围汇总并移除该槽
+- 没有活动范围时不做统计
+"""
+import threading
+import weakref
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, Hashable, Iterator, List, Optional, Tuple
+
+_CURRENT_SCOPE: contextvars.ContextVar = contextvars.ContextVar("task_stats_scope", default=None)
+
+# 计数键：(合并方式, 类别, 名称)；time 为 [次数, 累计耗时, 最大耗时]，sum 为逐项求和
+StatsKey = Tuple[str, str, Hashable]
+
+
+def _merge(key: StatsKey, target: List[float], values: List[float]):
+    if len(target) < len(values):
+        target.extend([0] * (len(values) - len(target)))
+    if key[0] == "time":
+        target[0] += values[0]
+        target[1] += values[1]
+        target[2] = max(target[2], values[2])
+    else:
+        for idx, value in enumerate(values):
+            target[idx] += value
+
+
+class _ThreadSlot:
+    """单个线程在某个统计范围内的计数槽"""
+    __slots__ = ("counters", "__weakref__")
+
+    def __init__(self):
+        self.counters: Dict[StatsKey, List[float]] = {}
+
+
+class TaskStatsScope:
+    """一次任务的统计范围"""
+
+    def __init__(self, name: str = ""):
+        self.name = name
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # 已退出线程合并后的汇总
+        self._folded: Dict[StatsKey, List[float]] = {}
+        # 仍存活线程的计数槽
+        self._live: Dict[int, Dict[StatsKey, List[float]]] = {}
+
+    @staticmethod
+    def _fold(scope_ref: "weakref.ReferenceType[TaskStatsScope]", counters: Dict[StatsKey, List[float]]):
+        # 线程退出（计数槽被回收）时调用；不持有范围的强引用，范围结束后自动失效
+        scope = scope_ref()
+        if scope is None:
+            return
+        with scope._lock:
+            scope._live.pop(id(counters), None)
+            for key, values in counters.items():
+                _merge(key, scope._folded.setdefault(key, [0, 0.0, 0.0] if key[0] == "time" else []), values)
+
+    def _counters(self) -> Dict[StatsKey, List[float]]:
+        slot = getattr(self._local, "slot", None)
+        if slot is None:
+            slot = _ThreadSlot()
+            self._local.slot = slot
+            with self._lock:
+                self._live[id(slot.counters)] = slot.counters
+            weakref.finalize(slot, TaskStatsScope._fold, weakref.ref(self), slot.counters)
+        return slot.counters
+
+    def record_time(self, kind: str, name: Hashable, cost: float):
+        key = ("time", kind, name)
+        counters = self._counters()
+        values = counters.get(key)
+        if values is None:
+            counters[key] = [1, cost, cost]
+            return
+        values[0] += 1
+        values[1] += cost
+        if cost > values[2]:
+            values[2] = cost
+
+    def add(self, kind: str, name: Hashable, *values: float):
+        key = ("sum", kind, name)
+        counters = self._counters()
+        current = counters.get(key)
+        if current is None:
+            counters[key] = list(values)
+            return
+        _merge(key, current, list(values))
+
+    def snapshot(self, kind: str) -> Dict[Tuple[str, Hashable], List[float]]:
+        """汇总指定类别的计数，返回 {(合并方式, 名称): 计数}"""
+        with self._lock:
+            sources = [dict(self._folded)] + [dict(counters) for counters in self._live.values()]
+        result: Dict[Tuple[str, Hashable], List[float]] = {}
+        for source in sources:
+            for key, values in list(source.items()):
+                if key[1] != kind:
+                    continue
+                target = result.setdefault((key[0], key[2]), [0, 0.0, 0.0] if key[0] == "time" else [])
+                _merge(key, target, list(values))
+        return result
+
+
+def current_scope() -> Optional[TaskStatsScope]:
+    return _CURRENT_SCOPE.get()
+
+
+@contextmanager
+def task_stats_scope(name: str = "") -> Iterator[TaskStatsScope]:
+    """在当前上下文中开启一个任务统计范围"""
+    scope = TaskStatsScope(name)
+    token = _CURRENT_SCOPE.set(scope)
+    try:
+        yield scope
+    finally:
+        _CURRENT_SCOPE.reset(token)
+
+
+def record_time(kind: str, name: Hashable, cost: float):
+    scope = _CURRENT_SCOPE.get()
+    if scope is not None:
+        scope.record_time(kind, name, cost)
+
+
+def add_counts(kind: str, name: Hashable, *values: float):
+    scope = _CURRENT_SCOPE.get()
+    if scope is not None:
+        scope.add(kind, name, *values)
@@ -0,0 +1,116 @@
+"""
+提示词模板缓存
+
+所有 LLM 流水线共用一个 jinja2.Environment，模板按源码缓存编译结果（同一提示词只编译一次），
+并统计每个模板的渲染次数与耗时，便于定位逐楼层、逐候选循环中的渲染开销
+"""
+import time
+import hashlib
+import threading
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Optional
+from jinja2 import Environment, Template
+
+from utils.task_stats import TaskStatsScope, current_scope, record_time
+
+
+@dataclass
+class TemplateStats:
+    name: str = ""
+    renders: int = 0
+    total_time: float = 0.0     # 累计渲染耗时（秒）
+    max_time: float = 0.0       # 单次最大渲染耗时（秒）
+    compile_time: float = 0.0   # 编译耗时（秒）
+
+    def to_dict(self):
+        return asdict(self)
+
+
+class TimedTemplate:
+    """带渲染计时的已编译模板，接口与 jinja2.Template.render 一致；渲染计时记入当前任务的统计范围"""
+
+    def __init__(self, template: Template, stats: TemplateStats, source: str):
+        # stats 只保存名称与编译耗时，渲染计数按任务记在统计范围中
+        self.template = template
+        self.stats = stats
+        self.source = source
+
+    def render(self, *args, **kwargs) -> str:
+        start = time.perf_counter()
+        try:
+            return self.template.render(*args, **kwargs)
+        finally:
+            record_time("template", self.source, time.perf_counter() - start)
+
+
+class PromptTemplateRegistry:
+    """提示词模板注册表：共享 Environment，按模板源码缓存编译结果"""
+
+    def __init__(self):
+        self.environment = Environment()
+        self._templates: Dict[str, TimedTemplate] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _default_name(source: str) -> str:
+        first_line = next((line.strip() for line in source.splitlines() if line.strip()), "")
+        return f"{first_line[:30]}#{hashlib.md5(source.encode()).hexdigest()[:8]}"
+
+    def get_template(self, source: str, name: str = None) -> TimedTemplate:
+        timed = self._templates.get(source)
+        if timed is not None:
+            return timed
+        with self._lock:
+            timed = self._templates.get(source)
+            if timed is None:
+                start = time.perf_counter()
+                template = self.environment.from_string(source)
+                stats = TemplateStats(
+                    name=name or self._default_name(source),
+                    compile_time=time.perf_counter() - start
+                )
+                timed = TimedTemplate(template, stats, source)
+                self._templates[source] = timed
+        return timed
+
+    def render(self, source: str, params: dict = None, name: str = None) -> str:
+        return self.get_template(source, name=name).render(params or {})
+
+    def stats(self, scope: Optional[TaskStatsScope] = None) -> List[TemplateStats]:
+        """按累计渲染耗时降序返回指定统计范围（默认当前任务）内各模板的统计"""
+        scope = scope or current_scope()
+        if scope is None:
+            return []
+        with self._lock:
+            templates = dict(self._templates)
+        stats = []
+        for (_, source), (renders, total_time, max_time) in scope.snapshot("template").items():
+            timed = templates.get(source)
+            stats.append(TemplateStats(
+                name=timed.stats.name if timed else self._default_name(source),
+                renders=int(renders),
+                total_time=total_time,
+                max_time=max_time,
+                compile_time=timed.stats.compile_time if timed else 0.0
+            ))
+        return sorted(stats, key=lambda s: s.total_time, reverse=True)
+
+    def report(self, top: int = 10, scope: Optional[TaskStatsScope] = None) -> str:
+        lines = ["提示词模板渲染统计（按累计耗时降序）:"]
+        for s in self.stats(scope)[:top]:
+            if s.renders <= 0:
+                continue
+            lines.append(
+                f"\t{s.name}: 渲染 {s.renders} 次, 累计 {s.total_time*1000:.1f}ms, "
+                f"平均 {s.total_time/s.renders*1000:.3f}ms, 最大 {s.max_time*1000:.1f}ms, "
+                f"编译 {s.compile_time*1000:.1f}ms"
+            )
+        return "\n".join(lines)
+
+
+PROMPT_TEMPLATE_REGISTRY = PromptTemplateRegistry()
+
+
+def get_template(source: str, name: str = None) -> TimedTemplate:
+    """获取已编译（带缓存）的提示词模板"""
+    return PROMPT_TEMPLATE_REGISTRY.get_template(source, name=name)
@@ -1,17 +1,26 @@
 import os
+import contextvars
 from contextlib import contextmanager
 from concurrent.futures.thread import ThreadPoolExecutor
 from concurrent.futures import as_completed
 
+
+class ContextThreadPoolExecutor(ThreadPoolExecutor):
+    """提交任务时复制当前 contextvars 上下文（如任务统计范围），工作线程中与提交方看到相同的上下文变量"""
+    def submit(self, fn, /, *args, **kwargs):
+        context = contextvars.copy_context()
+        return super().submit(context.run, fn, *args, **kwargs)
+
+
 @contextmanager
 def xthread(worker_num:int=6) -> ThreadPoolExecutor:
     """上下文管理器用于自动获取 ThreadPoolExecutor, 避免错误"""
     worker_num=max(os.cpu_count()*2,worker_num)
-    pool = ThreadPoolExecutor(max_workers=worker_num)
+    pool = ContextThreadPoolExecutor(max_workers=worker_num)
     try:
         yield pool
     except:
         pool.shutdown(wait=True, cancel_futures=True)
         raise
     finally:
-        pool.shutdown()
\ No newline at end of file
+        pool.shutdown()
@@ -0,0 +1,101 @@
+"""
+VL 图片调用结果缓存
+
+以 (图片像素哈希, 提示词, 模型, 预处理参数) 为键，把视觉大模型的识别结果缓存到磁盘。
+同一项目/同一设计院的图签、图例、标准表格反复出现，命中缓存即可跳过一次数秒级的 VL 调用。
+像素哈希对解码后的像素计算，同一画面即使 PNG 编码参数不同也能命中
+"""
+import io
+import os
+import json
+import hashlib
+import threading
+from dataclasses import asdict
+from typing import Optional
+from conf.config import DATA_TMP_DIR, VL_CACHE_ENABLED
+from utils.image import ImageEncodeOptions
+from utils.task_stats import TaskStatsScope, add_counts, current_scope
+
+try:
+    from PIL import Image
+except ImportError:  # 未安装 Pillow 时退化为按文件内容哈希
+    Image = None
+
+
+def image_pixel_hash(image: bytes) -> str:
+    """图片像素哈希（尺寸+模式+像素数据），解码失败时使用内容哈希"""
+    if Image is not None:
+        try:
+            img = Image.open(io.BytesIO(image))
+            img.load()
+            digest = hashlib.sha256()
+            digest.update(f"{img.mode}:{img.size[0]}x{img.size[1]}:".encode())
+            digest.update(img.tobytes())
+            return digest.hexdigest()
+        except Exception:
+            pass
+    return hashlib.sha256(image).hexdigest()
+
+
+class VLResultCache:
+    """VL 识别结果磁盘缓存（按键的 sha256 分目录存放）"""
+
+    def __init__(self, cache_dir: str = None, enabled: bool = VL_CACHE_ENABLED):
+        self.cache_dir = cache_dir or os.path.join(DATA_TMP_DIR, "vl_cache")
+        self.enabled = enabled
+
+    def key(self, image: bytes, model: str, *prompts: str) -> str:
+        # 预处理参数影响模型实际看到的图片，一并计入键
+        options = json.dumps(asdict(ImageEncodeOptions()), sort_keys=True)
+        digest = hashlib.sha256()
+        for part in (image_pixel_hash(image), model, options, *prompts):
+            digest.update(str(part).encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        result = None
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as fp:
+                    result = json.loads(fp.read()).get("result")
+            except (OSError, ValueError):
+                result = None
+        # 命中/未命中计入当前任务的统计范围
+        add_counts("vl_cache", "", 0 if result is None else 1, 1 if result is None else 0)
+        return result
+
+    def set(self, key: str, result: str):
+        """只缓存非空结果；写缓存失败只打印日志，不影响调用方使用本次结果"""
+        if not self.enabled or not result:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as fp:
+                fp.write(json.dumps({"result": result}, ensure_ascii=False))
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"写入VL结果缓存失败: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def report(self, scope: Optional[TaskStatsScope] = None) -> str:
+        scope = scope or current_scope()
+        counts = scope.snapshot("vl_cache").get(("sum", ""), []) if scope is not None else []
+        hits, misses = (int(counts[0]), int(counts[1])) if len(counts) >= 2 else (0, 0)
+        total = hits + misses
+        ratio = hits / total * 100 if total > 0 else 0
+        return f"VL结果缓存: 命中 {hits}/{total} ({ratio:.1f}%)"
+
+
+VL_RESULT_CACHE = VLResultCache()
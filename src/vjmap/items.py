@@ -2,15 +2,15 @@
 相关实体类
 """
 import math
+import json
+import numpy as np
 from dataclasses import dataclass,field,asdict
-from typing import Optional
-
-from dataclasses import dataclass
 from typing import Optional,List
-import json
 
 
 class GeoPoint:
+    __slots__=("x","y")
+    
     def __init__(self,x:float,y:float):
         self.x=x
         self.y=y
@@ -32,7 +32,7 @@ class GeoPoint:
     def to_str(self):
         return str(self.x)+","+str(self.y)
 
-@dataclass
+@dataclass(slots=True)
 class EnvelopBounds:
     minx:Optional[float]=None
     miny:Optional[float]=None
@@ -94,7 +94,7 @@ class EnvelopBounds:
     def from_dict(data):
         return EnvelopBounds(**data)
         
-@dataclass
+@dataclass(slots=True)
 class QueryItem:
     alpha: Optional[int] = None
     bounds: Optional[str|EnvelopBounds] = None
@@ -139,6 +139,58 @@ class QueryItem:
 
         return QueryItem(**data)
     
+    def parse_bounds(self)->Optional[EnvelopBounds]:
+        """将字符串形式的 bounds 解析为 EnvelopBounds 并回写，只解析一次"""
+        if isinstance(self.bounds,str):
+            self.bounds=EnvelopBounds().from_string(self.bounds)
+        return self.bounds
+
+
+class QueryItemCollection:
+    """
+    文本集合（列式）
+    bounds 一次性解析为 (n,4) float64 数组 [minx,miny,maxx,maxy]，中心点 (n,2) 缓存，
+    避免在嵌套循环中反复解析 bounds、反复构建 GeoPoint
+    """
+    def __init__(self,items:List[QueryItem]):
+        if hasattr(items,"bounds_array"):
+            # 列式缓存视图（utils.columnar.ColumnarQueryItems）：直接使用列数据，不还原全部对象
+            self.items=items
+            n=len(self.items)
+            self.bounds=items.bounds_array()
+        else:
+            self.items=list(items)
+            n=len(self.items)
+            self.bounds=np.full((n,4),np.nan,dtype=np.float64)
+            for idx,item in enumerate(self.items):
+                bounds=item.parse_bounds()
+                if bounds is not None and None not in (bounds.minx,bounds.miny,bounds.maxx,bounds.maxy):
+                    self.bounds[idx]=(bounds.minx,bounds.miny,bounds.maxx,bounds.maxy)
+        self.centers=np.column_stack((
+            (self.bounds[:,0]+self.bounds[:,2])/2,
+            (self.bounds[:,1]+self.bounds[:,3])/2
+        )) if n>0 else np.empty((0,2),dtype=np.float64)
+        self.texts=list(items.texts) if hasattr(items,"texts") else [item.text or "" for item in self.items]
+    
+    def __len__(self):
+        return len(self.items)
+    
+    def __iter__(self):
+        return iter(self.items)
+    
+    def __getitem__(self,idx):
+        return self.items[idx]
+    
+    def indices_by_text(self,key:str)->List[int]:
+        """包含关键字的文本下标"""
+        return [idx for idx,text in enumerate(self.texts) if key in text]
+    
+    def indices_intersecting(self,bounds:EnvelopBounds)->np.ndarray:
+        """包围盒与给定范围相交的下标"""
+        b=self.bounds
+        mask=(b[:,0]<=bounds.maxx)&(b[:,2]>=bounds.minx)&(b[:,1]<=bounds.maxy)&(b[:,3]>=bounds.miny)
+        return np.nonzero(mask)[0]
+    
 
 @dataclass
 class TableAttribute:
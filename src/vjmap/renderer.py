@@ -0,0 +1,370 @@
+"""
+本地栅格渲染
+
+用已经查询到的图纸实体快照（线条、多段线、文字）在本地按范围绘制 PNG，
+与 MapPngByBoundsService 的 map_to_img_url/url_to_img 接口一致，省去每张裁剪图一次远程 WMS 请求，
+也便于离线评测 OCR 流程。未安装 Pillow 或找不到中文字体时不可用，自动退回远程出图
+"""
+import io
+import os
+import hashlib
+import threading
+from functools import lru_cache
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlencode, urlparse, parse_qs
+from vjmap.items import QueryItem, QueryItemCollection, EnvelopBounds
+from vjmap.services import MapPngByBoundsService, MapPngByBoundsParams
+from conf.config import MAP_RENDER_MODE, LOCAL_RENDER_FONT_PATH
+from utils.task_stats import TaskStatsScope, add_counts, current_scope
+
+try:
+    from PIL import Image, ImageDraw, ImageFont
+except ImportError:
+    Image = None
+    ImageDraw = None
+    ImageFont = None
+
+
+LOCAL_URL_PREFIX = "local://"
+# 常见中文字体位置（未配置 LOCAL_RENDER_FONT_PATH 时依次查找）
+DEFAULT_FONT_PATHS = [
+    "/usr/share/fonts/truetype/wqy/wqy-microhei.ttc",
+    "/usr/share/fonts/truetype/wqy/wqy-zenhei.ttc",
+    "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc",
+    "C:/Windows/Fonts/simhei.ttf",
+    "/System/Library/Fonts/PingFang.ttc",
+]
+# 进程内最多保留的图纸快照数
+MAX_SNAPSHOTS = 8
+# 立面出图缓存最多保留的图片路径数
+MAX_FACADE_IMAGES = 64
+
+
+@lru_cache(maxsize=1)
+def _find_font_path() -> Optional[str]:
+    for path in [LOCAL_RENDER_FONT_PATH] + DEFAULT_FONT_PATHS:
+        if path and os.path.exists(path):
+            return path
+    return None
+
+
+def local_render_active() -> bool:
+    """是否启用本地出图（MAP_RENDER_MODE=local 且 Pillow、中文字体可用）"""
+    return MAP_RENDER_MODE == "local" and Image is not None and _find_font_path() is not None
+
+
+class MapEntitySnapshot:
+    """单张图纸的实体快照：线条与文字分别建立列式边界索引"""
+
+    def __init__(self, mapid: str):
+        self.mapid = mapid
+        self.lines: Optional[QueryItemCollection] = None
+        self.texts: Optional[QueryItemCollection] = None
+
+    @staticmethod
+    def _intersecting(collection: Optional[QueryItemCollection], bounds: EnvelopBounds) -> List[QueryItem]:
+        if collection is None or len(collection) == 0:
+            return []
+        return [collection[idx] for idx in collection.indices_intersecting(bounds)]
+
+    def lines_in(self, bounds: EnvelopBounds) -> List[QueryItem]:
+        return self._intersecting(self.lines, bounds)
+
+    def texts_in(self, bounds: EnvelopBounds) -> List[QueryItem]:
+        return self._intersecting(self.texts, bounds)
+
+
+class MapEntitySnapshotRegistry:
+    """
+    进程级图纸实体快照登记表（按 mapid，超出数量时淘汰最久未用的图纸）
+    只在启用本地出图时登记，远程出图模式下不构建列式索引、不常驻实体列表
+    """
+
+    def __init__(self, max_maps: int = MAX_SNAPSHOTS):
+        self.max_maps = max_maps
+        self._snapshots: "OrderedDict[str, MapEntitySnapshot]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, mapid: str) -> MapEntitySnapshot:
+        snapshot = self._snapshots.get(mapid)
+        if snapshot is None:
+            snapshot = MapEntitySnapshot(mapid)
+            self._snapshots[mapid] = snapshot
+            while len(self._snapshots) > self.max_maps:
+                self._snapshots.popitem(last=False)
+        self._snapshots.move_to_end(mapid)
+        return snapshot
+
+    def register_lines(self, mapid: str, lines: List[QueryItem]):
+        if not local_render_active():
+            return
+        with self._lock:
+            self._get_or_create(mapid).lines = QueryItemCollection(lines)
+
+    def register_texts(self, mapid: str, texts: List[QueryItem]):
+        if not local_render_active():
+            return
+        with self._lock:
+            self._get_or_create(mapid).texts = QueryItemCollection(texts)
+
+    def get(self, mapid: str) -> Optional[MapEntitySnapshot]:
+        with self._lock:
+            snapshot = self._snapshots.get(mapid)
+            if snapshot is not None:
+                self._snapshots.move_to_end(mapid)
+            return snapshot
+
+    def release(self, mapid: str):
+        with self._lock:
+            self._snapshots.pop(mapid, None)
+
+
+MAP_ENTITY_SNAPSHOTS = MapEntitySnapshotRegistry()
+
+
+class LocalMapRenderer:
+    """按范围将实体快照绘制为 PNG（线条与文字统一用前景色绘制）"""
+
+    def __init__(self, snapshot: MapEntitySnapshot, font_path: str, foreground: str = "rgb(255,255,255)"):
+        self.snapshot = snapshot
+        self.font_path = font_path
+        self.foreground = foreground
+        self._fonts: Dict[int, "ImageFont.FreeTypeFont"] = {}
+
+    def _font(self, size: int):
+        size = max(6, min(int(size), 512))
+        font = self._fonts.get(size)
+        if font is None:
+            font = ImageFont.truetype(self.font_path, size)
+            self._fonts[size] = font
+        return font
+
+    def render(self, bounds: EnvelopBounds, width: int, height: int, background: str = "rgb(0,0,0)") -> bytes:
+        width, height = max(1, int(width)), max(1, int(height))
+        image = Image.new("RGB", (width, height), background)
+        draw = ImageDraw.Draw(image)
+        sx = width / bounds.width() if bounds.width() > 0 else 1.0
+        sy = height / bounds.height() if bounds.height() > 0 else 1.0
+
+        def to_px(x, y):
+            return ((x - bounds.minx) * sx, (bounds.maxy - y) * sy)
+
+        for line in self.snapshot.lines_in(bounds):
+            if not isinstance(line.points, list) or len(line.points) < 2:
+                continue
+            draw.line([to_px(p.x, p.y) for p in line.points], fill=self.foreground, width=1)
+
+        for text_item in self.snapshot.texts_in(bounds):
+            text_bounds = text_item.parse_bounds()
+            if not text_item.text or text_bounds is None:
+                continue
+            # 多行文字按行数均分高度作为字号（不处理文字旋转）
+            lines = text_item.text.split("\n")
+            size = text_bounds.height() * sy / max(1, len(lines))
+            if size < 2:
+                continue
+            draw.multiline_text(
+                to_px(text_bounds.minx, text_bounds.maxy),
+                "\n".join(lines),
+                fill=self.foreground,
+                font=self._font(size),
+                spacing=0
+            )
+
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG")
+        return buffer.getvalue()
+
+
+class LocalMapPngByBoundsService(MapPngByBoundsService):
+    """
+    本地出图服务：map_to_img_url 返回 local:// 地址，url_to_bytes/url_to_img 在本地绘制，
+    快照缺少线条或文字时按需查询整图实体；非本地地址或实体加载失败时仍走远程 WMS
+    """
+
+    def __init__(self, mapid: str, font_path: str, version: str = "v1", geom: bool = True, **kwargs):
+        super().__init__(mapid, version, geom, **kwargs)
+        self.font_path = font_path
+        self._load_lock = threading.Lock()
+
+    def _snapshot(self) -> Optional[MapEntitySnapshot]:
+        snapshot = MAP_ENTITY_SNAPSHOTS.get(self.mapid)
+        if snapshot is not None and snapshot.lines is not None and snapshot.texts is not None:
+            return snapshot
+        with self._load_lock:
+            snapshot = MAP_ENTITY_SNAPSHOTS.get(self.mapid)
+            if snapshot is None or snapshot.lines is None:
+                # 快照中没有线条时查询一次整图线条（CADSubMapSplitter.getmap_lines 会自动登记快照）
+                from splitter.cad_splitter import CADSubMapSplitter
+                lines = CADSubMapSplitter(mapid=self.mapid, version=self.version, geom=self.geom).getmap_lines()
+                snapshot = MAP_ENTITY_SNAPSHOTS.get(self.mapid)
+                if snapshot is None or snapshot.lines is None:
+                    MAP_ENTITY_SNAPSHOTS.register_lines(self.mapid, lines)
+            snapshot = MAP_ENTITY_SNAPSHOTS.get(self.mapid)
+            if snapshot is None or snapshot.texts is None:
+                # 同理按需查询一次整图文字（MapTextParser.parse_all_text_from_map 会自动登记快照）
+                from parser.text_parser import MapTextParser
+                texts = MapTextParser(mapid=self.mapid, version=self.version, geom=self.geom).parse_all_text_from_map()
+                snapshot = MAP_ENTITY_SNAPSHOTS.get(self.mapid)
+                if snapshot is None or snapshot.texts is None:
+                    MAP_ENTITY_SNAPSHOTS.register_texts(self.mapid, texts)
+            snapshot = MAP_ENTITY_SNAPSHOTS.get(self.mapid)
+        return snapshot
+
+    def _remote_url(self, query: Dict[str, str]) -> str:
+        """local:// 地址对应的远程 WMS 出图地址"""
+        return super().map_to_img_url(params=MapPngByBoundsParams(
+            width=int(query["width"]),
+            height=int(query["height"]),
+            bbox=query["bbox"],
+            backgroundColor=query.get("bg", "rgb(0,0,0)")
+        ))
+
+    def map_to_img_url(self, params: MapPngByBoundsParams):
+        if not params:
+            raise ValueError("params is empty")
+        bounds = EnvelopBounds().from_string(f"[{params.bbox}]")
+        width = int(float(params.width or 1024))
+        if params.height:
+            height = int(float(params.height))
+        else:
+            height = max(1, round(width * bounds.height() / bounds.width())) if bounds.width() > 0 else width
+        query = urlencode({
+            "bbox": bounds.to_str(),
+            "width": width,
+            "height": height,
+            "bg": params.backgroundColor
+        })
+        return f"{LOCAL_URL_PREFIX}{self.mapid}?{query}"
+
+    def url_to_bytes(self, img_url: str = None) -> bytes:
+        if not img_url or not img_url.startswith(LOCAL_URL_PREFIX):
+            return super().url_to_bytes(img_url=img_url)
+        query = {k: v[0] for k, v in parse_qs(urlparse(img_url).query).items()}
+        bounds = EnvelopBounds().from_string(f"[{query['bbox']}]")
+        try:
+            snapshot = self._snapshot()
+        except Exception as e:
+            print(f"加载图纸实体快照失败: {e}")
+            snapshot = None
+        if snapshot is None or snapshot.lines is None or snapshot.texts is None:
+            # 实体不全时本地图会缺线条或文字，退回远程出图
+            return super().url_to_bytes(img_url=self._remote_url(query))
+        try:
+            renderer = LocalMapRenderer(snapshot, self.font_path)
+            return renderer.render(bounds, int(query["width"]), int(query["height"]), query.get("bg", "rgb(0,0,0)"))
+        except Exception as e:
+            print(f"本地出图失败: {e}")
+            return b""
+
+    def url_to_img(self, img_url: str = None, image_name: str = "", save_dir: str = "data/images"):
+        if not img_url or not img_url.startswith(LOCAL_URL_PREFIX):
+            return super().url_to_img(img_url=img_url, image_name=image_name, save_dir=save_dir)
+        image = self.url_to_bytes(img_url=img_url)
+        if not image:
+            return False
+        if not image_name:
+            image_name = f"{abs(hash(img_url))}.png"
+        os.makedirs(save_dir, exist_ok=True)
+        save_path = os.path.join(save_dir, image_name)
+        with open(save_path, "wb") as fp:
+            fp.write(image)
+        return save_path
+
+
+def get_map_png_service(mapid: str, version: str = "v1", geom: bool = True) -> MapPngByBoundsService:
+    """按 MAP_RENDER_MODE 返回出图服务：local 且本地可渲染时用本地渲染，否则使用远程 WMS"""
+    if MAP_RENDER_MODE == "local" and Image is not None:
+        font_path = _find_font_path()
+        if font_path:
+            return LocalMapPngByBoundsService(mapid, font_path, version=version, geom=geom)
+        print("未找到中文字体，本地出图不可用，使用远程出图")
+    return MapPngByBoundsService(mapid, version, geom)
+
+
+class FacadeRenderCache:
+    """
+    立面子图出图缓存：按 (mapid, 子图范围, 出图宽度) 缓存已保存的图片路径（超出数量时淘汰最久未用的条目），
+    同一立面只出一次大图；并发请求同一立面时后到者等待先到者出图完成。
+    图纸关闭时（CloseMapService.close）清除该图纸的条目
+    """
+
+    def __init__(self, save_dir: str = "data/images", max_entries: int = MAX_FACADE_IMAGES):
+        self.save_dir = save_dir
+        self.max_entries = max_entries
+        self._paths: "OrderedDict[Tuple[str, str, int], str]" = OrderedDict()
+        # 出图中的键：[锁, 等待/持有该锁的请求数]，最后一个请求完成后移除
+        self._key_locks: Dict[Tuple[str, str, int], list] = {}
+        self._lock = threading.Lock()
+
+    def _acquire_key(self, key: Tuple[str, str, int]) -> threading.Lock:
+        with self._lock:
+            entry = self._key_locks.get(key)
+            if entry is None:
+                entry = [threading.Lock(), 0]
+                self._key_locks[key] = entry
+            entry[1] += 1
+        entry[0].acquire()
+        return entry[0]
+
+    def _release_key(self, key: Tuple[str, str, int], lock: threading.Lock):
+        lock.release()
+        with self._lock:
+            entry = self._key_locks.get(key)
+            if entry is not None and entry[0] is lock:
+                entry[1] -= 1
+                if entry[1] <= 0:
+                    self._key_locks.pop(key, None)
+
+    def _cached_path(self, key: Tuple[str, str, int]) -> Optional[str]:
+        with self._lock:
+            path = self._paths.get(key)
+            if path is not None:
+                self._paths.move_to_end(key)
+        return path if path and os.path.exists(path) else None
+
+    def get_image(self, mapid: str, submap: EnvelopBounds, width: int = 4096) -> Optional[str]:
+        """返回立面子图图片路径，未出过图（或图片已被清理）时出图并保存"""
+        bbox = submap.to_str()
+        key = (mapid, bbox, int(width))
+        lock = self._acquire_key(key)
+        try:
+            path = self._cached_path(key)
+            if path:
+                add_counts("facade_render", "", 1, 0)
+                return path
+            service = get_map_png_service(mapid)
+            url = service.map_to_img_url(params=MapPngByBoundsParams(width=width, bbox=bbox))
+            image_name = f"{mapid}_{hashlib.md5(f'{bbox}:{int(width)}'.encode()).hexdigest()}.png"
+            path = service.url_to_img(img_url=url, image_name=image_name, save_dir=os.path.join(self.save_dir, mapid))
+            add_counts("facade_render", "", 0, 1)
+            if path:
+                with self._lock:
+                    self._paths[key] = path
+                    self._paths.move_to_end(key)
+                    while len(self._paths) > self.max_entries:
+                        self._paths.popitem(last=False)
+            return path or None
+        finally:
+            self._release_key(key, lock)
+
+    def invalidate(self, mapid: str):
+        with self._lock:
+            for key in [key for key in self._paths if key[0] == mapid]:
+                self._paths.pop(key, None)
+
+    def report(self, scope: Optional[TaskStatsScope] = None) -> str:
+        scope = scope or current_scope()
+        counts = scope.snapshot("facade_render").get(("sum", ""), []) if scope is not None else []
+        hits, misses = (int(counts[0]), int(counts[1])) if len(counts) >= 2 else (0, 0)
+        return f"立面出图缓存: 请求 {hits + misses} 次, 命中 {hits}, 出图 {misses}"
+
+
+FACADE_RENDER_CACHE = FacadeRenderCache()
+
+
+def get_facade_image(mapid: str, submap: EnvelopBounds, width: int = 4096) -> Optional[str]:
+    """获取立面子图图片路径（共享出图缓存）"""
+    return FACADE_RENDER_CACHE.get_image(mapid, submap, width=width)
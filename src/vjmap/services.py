@@ -2,6 +2,8 @@ import os
 import time
 import uuid
 import json
+import copy
+import threading
 
 from api.client import APIClient
 from vjmap.items import QueryItem
@@ -11,7 +13,9 @@ from vjmap.utils import (
     getServiceUrl
 )
 from dataclasses import dataclass, field,asdict
-from typing import List,Optional,Literal,Dict
+from typing import List,Optional,Literal,Dict,Tuple,Callable
+from conf.config import MAP_IMAGE_EXPORT_WORKERS,MAP_IMAGE_EXPORT_RETRIES
+from utils.thread import ContextThreadPoolExecutor
 from .items import (
     EnvelopBounds,
     TableItem,
@@ -19,6 +23,80 @@ from .items import (
 )
 
 
+class MapDataCache:
+    """
+    进程级地图数据缓存（常量数据、元数据、样式名称）
+    
+    键为 (服务地址, 数据类型, mapid, version, 附加参数)，各解析器/分割器的服务实例共享，
+    避免每次查询前重复请求。地图关闭时（CloseMapService.close）失效对应版本；
+    地图以不同的 fileid 重新打开（重新上传）时由 OpenmapService 通过 opened 失效。
+    写入与读取均为深拷贝，调用方修改返回的数据不会影响缓存
+    """
+    CONST_DATA="constData"
+    METADATA="metadata"
+    LAYERNAME="layername"
+
+    def __init__(self):
+        self._data:Dict[tuple,object]={}
+        # 各地图最近一次打开时的 fileid
+        self._fileids:Dict[tuple,str]={}
+        self._lock=threading.Lock()
+
+    @staticmethod
+    def _key(kind:str,mapid:str,version:str="v1",extra:tuple=()):
+        return (getServiceUrl(),kind,mapid,version,extra)
+
+    def get(self,kind:str,mapid:str,version:str="v1",extra:tuple=()):
+        with self._lock:
+            value=self._data.get(self._key(kind,mapid,version,extra))
+        return copy.deepcopy(value)
+
+    def set(self,kind:str,mapid:str,value,version:str="v1",extra:tuple=()):
+        value=copy.deepcopy(value)
+        with self._lock:
+            self._data[self._key(kind,mapid,version,extra)]=value
+
+    def invalidate(self,mapid:str,version:Optional[str]=None,kind:Optional[str]=None)->int:
+        """
+        使指定地图的缓存失效
+        :param mapid: 地图id
+        :param version: 版本号，为空时失效全部版本
+        :param kind: 数据类型，为空时失效全部类型
+        :return: 失效的条目数
+        """
+        server=getServiceUrl()
+        with self._lock:
+            keys=[
+                key for key in self._data
+                if key[0]==server and key[2]==mapid
+                and (version is None or key[3]==version)
+                and (kind is None or key[1]==kind)
+            ]
+            for key in keys:
+                del self._data[key]
+        return len(keys)
+
+    def opened(self,mapid:str,fileid:str)->int:
+        """
+        记录地图已打开；与上次打开的 fileid 不同（地图内容已更换）时使该地图的缓存失效
+        :return: 失效的条目数
+        """
+        key=(getServiceUrl(),mapid)
+        with self._lock:
+            previous=self._fileids.get(key)
+            self._fileids[key]=fileid
+        if previous is not None and previous!=fileid:
+            return self.invalidate(mapid)
+        return 0
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._fileids.clear()
+
+
+MAP_DATA_CACHE=MapDataCache()
+
 
 
 
@@ -127,6 +205,7 @@ class OpenmapService(Service):
                 continue
             else:
                 break
+        MAP_DATA_CACHE.opened(mapid,params.fileid)
         return open_res
     def openmap(self,mapid:str,params:OpenMapRequestParams)->dict:
         """
@@ -146,6 +225,7 @@ class OpenmapService(Service):
                 continue
             else:
                 break
+        MAP_DATA_CACHE.opened(mapid,params.fileid)
         return open_res
 
 @dataclass
@@ -254,12 +334,17 @@ class MapMetadataService(Service):
         """
         if not mapid:
             raise ValueError("mapid is empty")
+        cached=MAP_DATA_CACHE.get(MapDataCache.METADATA,mapid,version)
+        if cached is not None:
+            return cached
         endpoint = f"/map/cmd/metadata/{mapid}/{version}" 
         headers={
             "token":getAccessToken()
         }
         try:
             response = self.client.send_request(method="GET", endpoint=endpoint,headers=headers)
+            if response:
+                MAP_DATA_CACHE.set(MapDataCache.METADATA,mapid,response,version)
             return response
         finally:
             pass
@@ -274,6 +359,9 @@ class MapConstDataService(Service):
         """
         if not mapid:
             raise ValueError("mapid is empty")
+        cached=MAP_DATA_CACHE.get(MapDataCache.CONST_DATA,mapid,version)
+        if cached is not None:
+            return cached
         endpoint = f"/map/cmd/constData/{mapid}/{version}" 
         headers={
             "token":getAccessToken()
@@ -281,6 +369,8 @@ class MapConstDataService(Service):
         try:
             response = self.client.send_request(method="GET", endpoint=endpoint,headers=headers)
             if response and response.get("entTypeIdMap"):
+                # 只缓存非空结果，地图尚未打开完成时下次仍会重新请求
+                MAP_DATA_CACHE.set(MapDataCache.CONST_DATA,mapid,response["entTypeIdMap"],version)
                 return response["entTypeIdMap"]
             return {}
         finally:
@@ -300,6 +390,10 @@ class CloseMapService(Service):
         headers={
             "token":getAccessToken()
         }
+        MAP_DATA_CACHE.invalidate(mapid,version)
+        # 图纸关闭后其立面出图缓存不再有效（renderer 依赖本模块，延迟导入避免循环引用）
+        from vjmap.renderer import FACADE_RENDER_CACHE
+        FACADE_RENDER_CACHE.invalidate(mapid)
         try:
             response = self.client.send_request(method="GET", endpoint=endpoint,headers=headers)
             if response and response.get("status"):
@@ -358,8 +452,10 @@ class CreateMapStyleService(Service):
             raise ValueError("mapid is empty")
         if not version:
             raise ValueError("version is empty")
-        if self.layername:
-            return self.layername
+        cached=MAP_DATA_CACHE.get(MapDataCache.LAYERNAME,mapid,version,(geom,))
+        if cached:
+            self.layername=cached
+            return cached
         endpoint = f"/map/cmd/createMapStyle/{mapid}/{version}"
         params = {
             "geom":geom,
@@ -369,6 +465,7 @@ class CreateMapStyleService(Service):
             response = self.client.send_request(method="GET", endpoint=endpoint,params=params)
             if response and response.get("stylename"):
                 self.layername=response["stylename"]
+                MAP_DATA_CACHE.set(MapDataCache.LAYERNAME,mapid,self.layername,version,(geom,))
                 return response["stylename"]
             return None
         except Exception as e:
@@ -501,6 +598,64 @@ class MapPngByBoundsService(CreateMapStyleService):
         self.client.download_image(url=img_url,save_path=save_path)
         print(f"download image success,save path is {save_path}")
         return save_path
+    
+    def url_to_bytes(self,img_url:str=None)->bytes:
+        """下载图片内容到内存，不写入磁盘"""
+        if not img_url:
+            return b""
+        return self.client.fetch_image(url=img_url)
+    
+    def download_image(self,img_url:str,save_path:str,retries:int=MAP_IMAGE_EXPORT_RETRIES,backoff:float=1.0)->bool:
+        """
+        下载图片到指定路径，网络错误或返回空内容时按指数退避重试
+        :return: 是否下载成功
+        """
+        save_dir=os.path.dirname(save_path)
+        if save_dir:
+            os.makedirs(save_dir,exist_ok=True)
+        for attempt in range(retries+1):
+            image=self.url_to_bytes(img_url=img_url)
+            if image:
+                # 先写临时文件再替换，并发导出时不会读到写了一半的图片
+                tmp_path=f"{save_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp_path,"wb") as fp:
+                    fp.write(image)
+                os.replace(tmp_path,save_path)
+                return True
+            if attempt<retries:
+                print(f"下载图片失败，{backoff*(2**attempt):.0f}秒后第{attempt+1}次重试: {save_path}")
+                time.sleep(backoff*(2**attempt))
+        return False
+    
+    def export_images(self,jobs:List[Tuple[MapPngByBoundsParams,str]],
+                      max_workers:int=MAP_IMAGE_EXPORT_WORKERS,
+                      retries:int=MAP_IMAGE_EXPORT_RETRIES,
+                      on_done:Optional[Callable[[Optional[str]],None]]=None)->List[Optional[str]]:
+        """
+        并发导出多张图片
+        :param jobs: (出图参数, 保存路径) 列表
+        :param max_workers: 最大并发数
+        :param retries: 单张图片失败重试次数
+        :param on_done: 每张图片完成后的回调（用于进度显示）
+        :return: 与 jobs 顺序一致的保存路径，失败为 None
+        """
+        if not jobs:
+            return []
+        # 出图地址串行生成（样式名称只请求一次）
+        urls=[self.map_to_img_url(params=params) for params,_ in jobs]
+        
+        def export(item:Tuple[str,str])->Optional[str]:
+            url,save_path=item
+            path=save_path if self.download_image(img_url=url,save_path=save_path,retries=retries) else None
+            if path is None:
+                print(f"error:导出图片失败 {save_path}")
+            if on_done:
+                on_done(path)
+            return path
+        
+        items=list(zip(urls,[save_path for _,save_path in jobs]))
+        with ContextThreadPoolExecutor(max_workers=max(1,min(max_workers,len(items)))) as executor:
+            return list(executor.map(export,items))
         
         
 @dataclass